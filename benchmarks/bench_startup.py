@@ -0,0 +1,96 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_server import MockOpenAIServer
+
+# Median wall-clock budgets in seconds for a full `tgpt` invocation. A run over budget fails.
+BUDGETS = {
+    "help": 0.25,
+    "tx": 0.60,
+}
+
+# Modules that must not be imported for a given invocation.
+FORBIDDEN_MODULES = {
+    "help": ("requests", "tgpt.gpt_client", "tgpt.config_handler"),
+    "tx": ("tgpt.image_handler", "tgpt.batch_runner"),
+}
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs the CLI in-process and reports the loaded modules on stderr, so the module checks see exactly what main() imported.
+PROBE = (
+    "import sys, json\n"
+    "from tgpt.main import main\n"
+    "sys.argv = ['tgpt'] + sys.argv[1:]\n"
+    "main()\n"
+    "sys.stderr.write(json.dumps(sorted(sys.modules)))\n"
+)
+
+
+def write_config(home, api_base):
+    """
+    Write a config file pointing tgpt at the mock server.
+    """
+    os.makedirs(os.path.join(home, ".tgpt"), exist_ok=True)
+    with open(os.path.join(home, ".tgpt", "config"), "w") as config_file:
+        config_file.write(f"[DEFAULT]\nAPI = test-key\nAPI_BASE = {api_base}\nMAX_RETRIES = 0\n")
+
+
+def time_invocation(args, env, runs):
+    """
+    Run the CLI several times and collect the wall-clock times and the loaded modules.
+
+    Returns:
+        tuple: The list of run times in seconds and the modules loaded by the last run.
+    """
+    times = []
+    modules = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", PROBE] + args, env=env, cwd=REPO_ROOT,
+                                capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+        modules = json.loads(result.stderr.strip().splitlines()[-1])
+    return times, modules
+
+
+def measure(runs=10):
+    """
+    Time every invocation against a fresh mock server and temporary config.
+
+    Returns:
+        dict: The run times in seconds and the loaded modules, keyed by invocation name.
+    """
+    results = {}
+    with MockOpenAIServer(completion_words=1) as server, tempfile.TemporaryDirectory() as home:
+        write_config(home, server.api_base)
+        env = dict(os.environ, HOME=home, PYTHONPATH=REPO_ROOT)
+        for name, args in (("help", ["--help"]), ("tx", ["tx", "What is the capital of France?"])):
+            results[name] = time_invocation(args, env, runs)
+    return results
+
+
+def main(runs=10):
+    failed = False
+    for name, (times, modules) in measure(runs).items():
+        median = statistics.median(times)
+        status = "ok" if median <= BUDGETS[name] else "OVER BUDGET"
+        print(f"{name:>5}: median {median * 1000:.1f} ms, min {min(times) * 1000:.1f} ms "
+              f"(budget {BUDGETS[name] * 1000:.0f} ms) {status}")
+        failed |= median > BUDGETS[name]
+
+        loaded = [module for module in FORBIDDEN_MODULES[name] if module in modules]
+        if loaded:
+            print(f"{name:>5}: imported {', '.join(loaded)}, which it should not need")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+import argparse
+import base64
+import json
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_png(size):
+    """
+    Build a valid PNG of roughly the given number of bytes, filled with noise so it does not compress.
+
+    Returns:
+        bytes: The PNG file contents.
+    """
+    side = max(1, int((size / 3) ** 0.5))
+    rng = random.Random(side)
+    raw = b"".join(b"\x00" + bytes(rng.getrandbits(8) for _ in range(side * 3)) for _ in range(side))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """
+    A threaded HTTP server that ignores clients dropping their pooled connections.
+    """
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class MockOpenAIServer:
+    """
+    A local OpenAI-compatible server for benchmarks, serving chat completions (including streaming),
+    embeddings, image generations and variations and the generated image files. Embeddings are
+    hashed bags of words, so texts sharing words are similar.
+
+    Attributes:
+        latency (float): The delay added before every API response, in seconds.
+        jitter (float): The maximum random delay added on top of the latency, in seconds.
+        error_rate (float): The fraction of API requests answered with a 500 error.
+        rate_limit_rate (float): The fraction of API requests answered with a 429 and a Retry-After header.
+        tail_rate (float): The fraction of API requests delayed by tail_latency on top, to model a latency tail.
+        tail_latency (float): The extra delay of the slow requests, in seconds.
+        completion_words (int): The number of words in every completion.
+        image_bytes (int): The approximate size of the served images.
+        download_latency (float): The delay added before every image file download, in seconds.
+        requests (int): The number of API requests received.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 completion_words=50, image_bytes=64 * 1024, download_latency=0.0, tail_rate=0.0, tail_latency=0.0, seed=0):
+        """
+        Initialize the MockOpenAIServer. Port 0 picks a free port.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.completion_words = completion_words
+        self.image_bytes = image_bytes
+        self.download_latency = download_latency
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._images = {}
+        self.set_image_bytes(image_bytes)
+        self._server = _QuietHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def api_base(self):
+        """
+        The base URL to configure as API_BASE.
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def set_image_bytes(self, image_bytes):
+        """
+        Change the size of the served images. Images are kept by size, so switching back and forth
+        does not allocate inside a measured run.
+        """
+        if image_bytes not in self._images:
+            image = make_png(image_bytes)
+            self._images[image_bytes] = (image, base64.b64encode(image))
+        self.image_bytes = image_bytes
+        self._image, self._encoded_image = self._images[image_bytes]
+
+    def start(self):
+        """
+        Serve requests on a background thread.
+
+        Returns:
+            MockOpenAIServer: The running server.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving and close the socket.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _inject(self):
+        """
+        Apply the configured latency and decide whether to fail the request.
+
+        Returns:
+            int: The status code to fail with, or None to answer normally.
+        """
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if self.tail_rate and self._random.random() < self.tail_rate:
+                delay += self.tail_latency
+        if delay:
+            time.sleep(delay)
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def _make_handler(self):
+        """
+        Build the request handler class bound to this server.
+
+        Returns:
+            type: The BaseHTTPRequestHandler subclass.
+        """
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                if not self.path.startswith("/files/"):
+                    return self._send_json(404, {"error": {"message": "Not found"}})
+                if mock.download_latency:
+                    time.sleep(mock.download_latency)
+                image = mock._image
+                start = 0
+                range_header = self.headers.get("Range")
+                if range_header and range_header.startswith("bytes="):
+                    start = int(range_header[6:].split("-")[0] or 0)
+                    if start >= len(image):
+                        self.send_response(416)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(image) - 1}/{len(image)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(image) - start))
+                self.end_headers()
+                self.wfile.write(image[start:])
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                failure = mock._inject()
+                if failure == 429:
+                    return self._send_json(429, {"error": {"message": "Rate limit reached"}}, {"Retry-After": "0.05"})
+                if failure:
+                    return self._send_json(500, {"error": {"message": "Injected server error"}})
+
+                if self.path.endswith("/chat/completions"):
+                    return self._completion(json.loads(body))
+                if self.path.endswith("/embeddings"):
+                    return self._embeddings(json.loads(body))
+                if self.path.endswith("/images/generations"):
+                    return self._images(json.loads(body))
+                if self.path.endswith("/images/variations"):
+                    return self._images(self._form_fields(body))
+                self._send_json(404, {"error": {"message": "Not found"}})
+
+            def _completion(self, payload):
+                n = int(payload.get("n") or 1)
+                words = [f"word{i}" for i in range(mock.completion_words)]
+                usage = {"prompt_tokens": sum(len(m.get("content") or "") // 4 for m in payload["messages"]),
+                         "completion_tokens": mock.completion_words * n}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                headers = {"x-ratelimit-limit-requests": "100000", "x-ratelimit-remaining-requests": "99999",
+                           "x-ratelimit-limit-tokens": "100000000", "x-ratelimit-remaining-tokens": "99999999"}
+
+                if not payload.get("stream"):
+                    choices = [{"index": i, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}
+                               for i in range(n)]
+                    return self._send_json(200, {"model": payload.get("model"), "choices": choices, "usage": usage}, headers)
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                for word in words:
+                    for i in range(n):
+                        self._send_event({"choices": [{"index": i, "delta": {"content": word + " "}, "finish_reason": None}]})
+                for i in range(n):
+                    self._send_event({"choices": [{"index": i, "delta": {}, "finish_reason": "stop"}]})
+                self._send_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _embeddings(self, payload):
+                texts = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+                dimensions = int(payload.get("dimensions") or 1536)
+                data = []
+                for i, text in enumerate(texts):
+                    vector = [0.0] * dimensions
+                    for word in text.lower().split():
+                        vector[zlib.crc32(word.encode()) % dimensions] += 1.0
+                    data.append({"object": "embedding", "index": i, "embedding": vector})
+                usage = {"prompt_tokens": sum(len(text) // 4 for text in texts)}
+                usage["total_tokens"] = usage["prompt_tokens"]
+                self._send_json(200, {"object": "list", "model": payload.get("model"), "data": data, "usage": usage})
+
+            def _images(self, payload):
+                n = int(payload.get("n") or 1)
+                if payload.get("response_format") == "b64_json":
+                    return self._send_b64_images(n)
+                host, port = self.server.server_address[:2]
+                data = [{"url": f"http://{host}:{port}/files/image-{i}.png"} for i in range(n)]
+                self._send_json(200, {"created": int(time.time()), "data": data})
+
+            def _send_b64_images(self, n):
+                # Written image by image from one encoded copy, so the mock's own memory does not
+                # show up in the client's peak memory.
+                encoded = mock._encoded_image
+                parts = [b'{"created": %d, "data": [' % int(time.time())]
+                for i in range(n):
+                    parts += [b", " if i else b"", b'{"b64_json": "', encoded, b'"}']
+                parts.append(b"]}")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(sum(len(part) for part in parts)))
+                self.end_headers()
+                for part in parts:
+                    self.wfile.write(part)
+
+            @staticmethod
+            def _form_fields(body):
+                fields = {}
+                for part in body.split(b"\r\n--"):
+                    if b'name="' not in part or b"\r\n\r\n" not in part:
+                        continue
+                    name = part.split(b'name="', 1)[1].split(b'"', 1)[0].decode()
+                    if name != "image":
+                        fields[name] = part.split(b"\r\n\r\n", 1)[1].split(b"\r\n", 1)[0].decode()
+                return fields
+
+            def _send_event(self, event):
+                self._send_chunk(b"data: " + json.dumps(event).encode() + b"\n\n")
+
+            def _send_chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI-compatible server for benchmarks")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every API response, in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum random delay added on top, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests failing with a 429")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Fraction of requests delayed by --tail-latency")
+    parser.add_argument("--tail-latency", type=float, default=0.0, help="Extra delay of the slow requests, in seconds")
+    parser.add_argument("--words", type=int, default=50, help="Number of words in every completion")
+    parser.add_argument("--image-bytes", type=int, default=64 * 1024, help="Approximate size of the served images")
+    parser.add_argument("--download-latency", type=float, default=0.0, help="Delay added to every image download, in seconds")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                              rate_limit_rate=args.rate_limit_rate, completion_words=args.words, image_bytes=args.image_bytes,
+                              download_latency=args.download_latency, tail_rate=args.tail_rate, tail_latency=args.tail_latency)
+    print(f"Mock OpenAI server listening, set API_BASE = {server.api_base}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from mock_server import MockOpenAIServer
+from tgpt.gpt_client import GPTClient
+from tgpt.http_transport import HTTPTransport
+from tgpt.image_handler import ImageHandler
+from tgpt.rate_limiter import RequestScheduler
+from tgpt.vector_index import VectorIndex
+import bench_startup
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+# Metrics where a larger value is better, every other metric is better when smaller.
+HIGHER_IS_BETTER = ("rps",)
+
+# Latency changes smaller than this are scheduler noise on a loopback server, whatever the percentage.
+NOISE_FLOOR_MS = 5.0
+
+MESSAGES = [{"role": "user", "content": "What is the capital of France?"}]
+
+# Vector indexes built for the search scenario, kept for the run so the traced pass reuses them.
+_vector_indexes = {}
+
+
+def percentile(samples, fraction):
+    """
+    Compute a percentile of the samples by the nearest-rank method.
+
+    Returns:
+        float: The sample at the given fraction of the sorted samples.
+    """
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(latencies, elapsed):
+    """
+    Reduce per-request latencies to the reported metrics.
+
+    Returns:
+        dict: The p50, p90 and p99 latencies in milliseconds and the requests per second.
+    """
+    return {
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+def timed(function):
+    """
+    Call a function and measure how long it took.
+
+    Returns:
+        float: The wall-clock time of the call in seconds.
+    """
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def make_client(server, pool_size=10):
+    """
+    Build a GPTClient pointed at the mock server, retrying quickly so injected faults do not dominate.
+
+    Returns:
+        GPTClient: The client.
+    """
+    transport = HTTPTransport(pool_size=pool_size, scheduler=RequestScheduler(base_delay=0.01, max_delay=0.1))
+    return GPTClient("test-key", max_tokens=100, transport=transport, api_base=server.api_base)
+
+
+def bench_completion(server, requests):
+    """
+    Sequential non-streamed completions over one warm connection.
+    """
+    client = make_client(server)
+    client.create_completion(MESSAGES)
+    start = time.perf_counter()
+    latencies = [timed(lambda: client.create_completion(MESSAGES)) for _ in range(requests)]
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def bench_completion_concurrent(server, requests, workers=16):
+    """
+    Non-streamed completions from a thread pool sharing one client.
+    """
+    client = make_client(server, pool_size=workers)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = list(executor.map(lambda _: timed(lambda: client.create_completion(MESSAGES)), range(requests)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def bench_completion_faults(server, requests):
+    """
+    Sequential completions with 5% injected 500s and 5% injected 429s, including the retries.
+    """
+    server.error_rate, server.rate_limit_rate = 0.05, 0.05
+    try:
+        return bench_completion(server, requests)
+    finally:
+        server.error_rate, server.rate_limit_rate = 0.0, 0.0
+
+
+def bench_completion_tail(server, requests, hedge=False):
+    """
+    Sequential completions with 20 ms latency where 3% of requests take 500 ms longer.
+    """
+    server.latency, server.tail_rate, server.tail_latency = 0.02, 0.03, 0.5
+    try:
+        client = make_client(server)
+        if hedge:
+            client.set_hedging(percentile=90, max_ratio=0.1)
+        start = time.perf_counter()
+        latencies = [timed(lambda: client.create_completion(MESSAGES)) for _ in range(requests)]
+        metrics = summarize(latencies, time.perf_counter() - start)
+        if hedge:
+            hedges = client.hedger.get_stats()
+            metrics["hedged_pct"] = round(100 * hedges["fired"] / hedges["requests"], 1)
+        return metrics
+    finally:
+        server.latency, server.tail_rate, server.tail_latency = 0.0, 0.0, 0.0
+
+
+def bench_completion_tail_hedged(server, requests):
+    """
+    The latency tail scenario with hedging at the p90 latency, capped to 10% extra requests.
+    """
+    return bench_completion_tail(server, requests, hedge=True)
+
+
+def bench_completion_stalled(server, requests):
+    """
+    Sequential completions where 2% of requests stall for 30 s, cut off by a 250 ms read timeout
+    and retried, each completion within a 5 s deadline.
+    """
+    server.latency, server.tail_rate, server.tail_latency = 0.02, 0.02, 30.0
+    try:
+        client = make_client(server)
+        client.transport.timeout = (1, 0.25)
+        client.transport.deadline = 5
+
+        def complete():
+            with client.transport.command():
+                return client.create_completion(MESSAGES)
+
+        start = time.perf_counter()
+        latencies = [timed(complete) for _ in range(requests)]
+        return summarize(latencies, time.perf_counter() - start)
+    finally:
+        server.latency, server.tail_rate, server.tail_latency = 0.0, 0.0, 0.0
+
+
+def bench_stream(server, requests):
+    """
+    Streamed 200-word completions, also reporting the time to the first delta.
+    """
+    client = make_client(server)
+    server.completion_words = 200
+    first_tokens = []
+    latencies = []
+    start = time.perf_counter()
+    try:
+        for _ in range(requests):
+            request_start = time.perf_counter()
+            chunks = client.create_completion(MESSAGES, stream=True)
+            next(chunks)
+            first_tokens.append(time.perf_counter() - request_start)
+            for _ in chunks:
+                pass
+            latencies.append(time.perf_counter() - request_start)
+    finally:
+        server.completion_words = 50
+    metrics = summarize(latencies, time.perf_counter() - start)
+    metrics["ttft_p50_ms"] = round(percentile(first_tokens, 0.50) * 1000, 2)
+    return metrics
+
+
+def bench_image_generate(server, requests, n=4):
+    """
+    Image generations of n 256 KB images, including the parallel downloads.
+    """
+    handler = ImageHandler("test-key", api_base=server.api_base)
+    server.set_image_bytes(256 * 1024)
+    latencies = []
+    start = time.perf_counter()
+    try:
+        with tempfile.TemporaryDirectory() as save_path, contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(requests):
+                latencies.append(timed(lambda: handler.generate_image("A cat", n=n, save_path=save_path)))
+    finally:
+        server.set_image_bytes(64 * 1024)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def bench_image_large(server, requests, response_format, n=10, image_bytes=1536 * 1024):
+    """
+    Image generations of ten large images, in the given response format. URLs model a CDN
+    with a 50 ms delay before every download.
+    """
+    handler = ImageHandler("test-key", api_base=server.api_base)
+    server.set_image_bytes(image_bytes)
+    server.download_latency = 0.05
+    latencies = []
+    start = time.perf_counter()
+    try:
+        with tempfile.TemporaryDirectory() as save_path, contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(requests):
+                latencies.append(timed(lambda: handler.generate_image("A cat", size="large", n=n,
+                                                                      response_format=response_format,
+                                                                      save_path=save_path)))
+    finally:
+        server.set_image_bytes(64 * 1024)
+        server.download_latency = 0.0
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def bench_image_large_url(server, requests):
+    """
+    Ten large images returned as URLs and downloaded in parallel.
+    """
+    return bench_image_large(server, requests, "url")
+
+
+def bench_image_large_b64(server, requests):
+    """
+    Ten large images returned inline as base64 and decoded straight to disk.
+    """
+    return bench_image_large(server, requests, "b64_json")
+
+
+def build_vector_index(rows, dimensions):
+    """
+    Write a VectorIndex of random normalized vectors directly with NumPy, far faster than appending.
+
+    Returns:
+        VectorIndex: The index, in a temporary directory kept until the benchmarks exit.
+    """
+    import numpy
+    if (rows, dimensions) in _vector_indexes:
+        return _vector_indexes[rows, dimensions][1]
+    directory = tempfile.TemporaryDirectory()
+    rng = numpy.random.default_rng(0)
+    offsets = numpy.empty(rows, dtype=numpy.uint64)
+    position = 0
+    with open(os.path.join(directory.name, VectorIndex.VECTORS_NAME), "wb") as vectors_file, \
+            open(os.path.join(directory.name, VectorIndex.META_NAME), "wb") as meta_file:
+        for block in range(0, rows, 100000):
+            vectors = rng.standard_normal((min(100000, rows - block), dimensions), dtype=numpy.float32)
+            vectors /= numpy.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors.tofile(vectors_file)
+            for row in range(block, block + len(vectors)):
+                line = f'{{"source": "doc{row // 100}.txt", "chunk": {row % 100}, "text": "chunk {row}"}}\n'.encode()
+                offsets[row] = position
+                meta_file.write(line)
+                position += len(line)
+    offsets.tofile(os.path.join(directory.name, VectorIndex.OFFSETS_NAME))
+    with open(os.path.join(directory.name, VectorIndex.HEADER_NAME), "w") as header_file:
+        json.dump({"model": "text-embedding-3-small", "dimensions": dimensions, "count": rows, "sources": {}}, header_file)
+    _vector_indexes[rows, dimensions] = (directory, VectorIndex(directory.name))
+    return _vector_indexes[rows, dimensions][1]
+
+
+def bench_vector_search(server, requests, rows=1000000, dimensions=256):
+    """
+    Top-5 cosine searches over a memory-mapped index of a million 256-dimension vectors, after
+    one search to page the index in. Skipped without NumPy.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return {}
+    index = build_vector_index(rows, dimensions)
+    rng = numpy.random.default_rng(1)
+    index.search(rng.standard_normal(dimensions).tolist())
+    queries = [rng.standard_normal(dimensions).tolist() for _ in range(requests)]
+    start = time.perf_counter()
+    latencies = [timed(lambda: index.search(query, k=5)) for query in queries]
+    return summarize(latencies, time.perf_counter() - start)
+
+
+SCENARIOS = {
+    "completion": (bench_completion, 300),
+    "completion_concurrent": (bench_completion_concurrent, 600),
+    "completion_faults": (bench_completion_faults, 300),
+    "completion_tail": (bench_completion_tail, 300),
+    "completion_tail_hedged": (bench_completion_tail_hedged, 300),
+    "completion_stalled": (bench_completion_stalled, 300),
+    "stream": (bench_stream, 100),
+    "image_generate": (bench_image_generate, 30),
+    "image_large_url": (bench_image_large_url, 10),
+    "image_large_b64": (bench_image_large_b64, 10),
+    "vector_search": (bench_vector_search, 50),
+}
+
+
+def run_scenario(server, function, requests):
+    """
+    Run a scenario for its timings, then again on a fraction of the requests under tracemalloc
+    for its peak Python memory, so tracing does not distort the timings.
+
+    Returns:
+        dict: The scenario metrics.
+    """
+    metrics = function(server, requests)
+    tracemalloc.start()
+    try:
+        function(server, max(1, requests // 10))
+        metrics["peak_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+    return metrics
+
+
+def run_all(selected, startup_runs):
+    """
+    Run the selected scenarios against one mock server.
+
+    Returns:
+        dict: The metrics of every scenario, keyed by scenario name.
+    """
+    results = {}
+    with MockOpenAIServer() as server:
+        for name in selected:
+            if name in SCENARIOS:
+                function, requests = SCENARIOS[name]
+                results[name] = run_scenario(server, function, requests)
+                print(f"{name:>22}: {json.dumps(results[name])}")
+
+    if "startup" in selected:
+        for name, (times, _) in bench_startup.measure(startup_runs).items():
+            results[f"startup_{name}"] = {"p50_ms": round(statistics.median(times) * 1000, 2),
+                                          "min_ms": round(min(times) * 1000, 2)}
+            print(f"{'startup_' + name:>22}: {json.dumps(results['startup_' + name])}")
+
+    print(f"{'max_rss_kb':>22}: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare the results against the baseline.
+
+    Returns:
+        list: A description of every metric that regressed by more than the tolerance.
+    """
+    regressions = []
+    for scenario, metrics in results.items():
+        for metric, value in metrics.items():
+            expected = baseline.get(scenario, {}).get(metric)
+            if not expected:
+                continue
+            if metric.endswith("_ms") and abs(value - expected) < NOISE_FLOOR_MS:
+                continue
+            change = (value - expected) / expected
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append(f"{scenario}.{metric}: {value} vs baseline {expected} ({change:+.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tgpt against a local mock OpenAI-compatible server")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS) + ["startup"],
+                        help=f"Scenarios to run (Default: all of {', '.join(list(SCENARIOS) + ['startup'])})")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results to the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed regression before failing (Default: 0.5)")
+    parser.add_argument("--startup-runs", type=int, default=10, help="Number of CLI invocations to time (Default: 10)")
+    args = parser.parse_args()
+
+    results = run_all(args.scenarios, args.startup_runs)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        baseline.update(results)
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create one")
+        return 0
+    with open(args.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
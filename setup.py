@@ -28,6 +28,11 @@ setup(
     install_requires=[
         'requests'
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'images': ['Pillow'],
+        'embeddings': ['numpy'],
+    },
     entry_points={
         'console_scripts': [
             'tgpt=tgpt.main:main',
@@ -0,0 +1,91 @@
+import asyncio
+import io
+import os
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+
+from benchmarks.mock_server import MockOpenAIServer, make_png
+from tgpt.async_client import AsyncGPTClient, AsyncTransport
+
+
+class AsyncGPTClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockOpenAIServer(completion_words=3, image_bytes=2048).start()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def _run(self, use, max_in_flight=20, api_base=None):
+        async def run():
+            async with AsyncGPTClient("test-key", transport=AsyncTransport(max_in_flight=max_in_flight),
+                                      api_base=api_base or self.server.api_base) as client:
+                return await use(client)
+
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            result = asyncio.run(run())
+        return result, stdout.getvalue()
+
+    def test_bounds_requests_in_flight(self):
+        self.server.latency = 0.2
+        prompts = [f"Question {i}" for i in range(6)]
+        gather = lambda client: asyncio.gather(*(client.completion(prompt) for prompt in prompts))
+
+        start = time.monotonic()
+        answers, _ = self._run(gather, max_in_flight=2)
+        self.assertGreaterEqual(time.monotonic() - start, 0.6)
+        self.assertEqual(answers, [["word0 word1 word2"]] * 6)
+
+        start = time.monotonic()
+        self._run(gather, max_in_flight=6)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(self.server.requests, 12)
+
+    def test_streams_deltas(self):
+        async def stream(client):
+            return [item async for item in client.stream_completion("Hello", n=2)]
+
+        deltas, _ = self._run(stream)
+        self.assertEqual(sorted(deltas), sorted([(i, f"word{w} ") for w in range(3) for i in range(2)]))
+
+    def test_errors_return_empty_results(self):
+        self.server.error_rate = 1.0
+        answer, output = self._run(lambda client: client.completion("Hello"))
+        self.assertEqual(answer, [])
+        self.assertIn("Error making request to GPT API", output)
+
+        paths, output = self._run(lambda client: client.generate_image("A fox", save_path=self.directory.name))
+        self.assertEqual(paths, [])
+        self.assertIn("Error making request to OpenAI API", output)
+
+        answer, output = self._run(lambda client: client.completion("Hello"), api_base="http://127.0.0.1:1/v1")
+        self.assertEqual(answer, [])
+
+        paths, output = self._run(lambda client: client.generate_variation(os.path.join(self.directory.name, "missing.png")))
+        self.assertEqual(paths, [])
+        self.assertIn("Error generating image variation", output)
+
+    def test_generates_and_saves_images(self):
+        for response_format in ("url", "b64_json"):
+            paths, _ = self._run(lambda client: client.generate_image("A fox", n=3, response_format=response_format,
+                                                                       save_path=self.directory.name))
+            self.assertEqual(len(paths), 3)
+            for path in paths:
+                with open(path, "rb") as image_file:
+                    self.assertEqual(image_file.read(), self.server._image)
+
+        source = os.path.join(self.directory.name, "source.png")
+        with open(source, "wb") as source_file:
+            source_file.write(make_png(3000))
+        paths, _ = self._run(lambda client: client.generate_variation(source, n=2, save_path=self.directory.name))
+        self.assertEqual(len(paths), 2)
+        self.assertTrue(all(path and os.path.exists(path) for path in paths))
+        self.assertEqual([name for name in os.listdir(self.directory.name) if name.endswith(".part")], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stderr
+
+from tgpt.batch_runner import BatchRunner
+
+
+class _FakeClient:
+    """
+    A client answering every prompt at once, failing for the prompt "fail" and raising for "boom".
+    """
+    def __init__(self):
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def create_completion(self, messages, n=1, model=None, max_tokens=None, temperature=None):
+        prompt = messages[-1]["content"]
+        with self._lock:
+            self.prompts.append(prompt)
+        if prompt == "fail":
+            return []
+        if prompt == "boom":
+            raise RuntimeError("connection pool exploded")
+        return [f"answer to {prompt}"] * n
+
+    def get_model(self):
+        return "gpt-test"
+
+
+class BatchRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.directory.name, "prompts.jsonl")
+        self.output_path = os.path.join(self.directory.name, "results.jsonl")
+        self.client = _FakeClient()
+        self.runner = BatchRunner(self.client, concurrency=2, report_interval=60)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write_input(self, *lines):
+        with open(self.input_path, "w") as input_file:
+            for line in lines:
+                input_file.write((line if isinstance(line, str) else json.dumps(line)) + "\n")
+
+    def _run(self, **kwargs):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            stats = self.runner.run(self.input_path, self.output_path, **kwargs)
+        return stats, stderr.getvalue()
+
+    def _results(self):
+        with open(self.output_path) as output_file:
+            return {record["line"]: record for record in map(json.loads, output_file)}
+
+    def test_bad_and_failed_lines_do_not_stop_the_batch(self):
+        self._write_input({"prompt": "one", "id": "a"},
+                          {"prompt": "hi", "max_tokens": "100"},
+                          "not json",
+                          {"messages": "hi"},
+                          {"prompt": "hi", "n": 0},
+                          {"prompt": "hi", "temperature": "hot"},
+                          {"prompt": "boom"},
+                          {"prompt": "fail"},
+                          {"prompt": "two", "n": 2})
+        stats, stderr = self._run()
+
+        self.assertEqual((stats["completed"], stats["failed"]), (2, 7))
+        results = self._results()
+        self.assertEqual(sorted(results), [1, 9])
+        self.assertEqual(results[1]["choices"], ["answer to one"])
+        self.assertEqual(results[1]["id"], "a")
+        self.assertEqual(results[9]["choices"], ["answer to two"] * 2)
+        self.assertIn('Line 2 failed: Invalid input line: "max_tokens" must be an integer', stderr)
+        self.assertIn("Line 7 failed: Request failed: connection pool exploded", stderr)
+        self.assertIn("Line 8 failed: No completion returned", stderr)
+        self.assertNotIn("hi", self.client.prompts)
+
+    def test_resume_skips_finished_lines_and_retries_failed_ones(self):
+        self._write_input({"prompt": "one"}, {"prompt": "fail"}, {"prompt": "three"})
+        self._run()
+        self._write_input({"prompt": "one"}, {"prompt": "two"}, {"prompt": "three"})
+        self.client.prompts.clear()
+
+        stats, _ = self._run()
+        self.assertEqual((stats["completed"], stats["skipped"]), (1, 2))
+        self.assertEqual(self.client.prompts, ["two"])
+        self.assertEqual(sorted(self._results()), [1, 2, 3])
+
+        stats, _ = self._run(resume=False)
+        self.assertEqual((stats["completed"], stats["skipped"]), (3, 0))
+        self.assertEqual(sorted(self._results()), [1, 2, 3])
+
+    def test_resume_trusts_output_over_checkpoint(self):
+        self._write_input({"prompt": "one"}, {"prompt": "two"}, {"prompt": "three"})
+        # A crash after writing line 1 but before checkpointing it, in the middle of writing line 2.
+        with open(self.output_path, "w") as output_file:
+            output_file.write(json.dumps({"line": 1, "choices": ["answer to one"]}) + "\n")
+            output_file.write('{"line": 2, "choi')
+
+        stats, _ = self._run()
+        self.assertEqual((stats["completed"], stats["skipped"]), (2, 1))
+        self.assertEqual(sorted(self.client.prompts), ["three", "two"])
+        with open(self.output_path) as output_file:
+            lines = output_file.read().splitlines()
+        self.assertEqual(sorted(json.loads(line)["line"] for line in lines), [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.commandline_interface import CommandLineInterface
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _FakeClient:
+    """
+    A client answering every prompt at once. The prompt "fail" prints an error and returns nothing,
+    like GPTClient after a failed request, and "boom" raises.
+    """
+    last_usage = {"prompt_tokens": 3, "completion_tokens": 2}
+
+    def completion(self, prompt, n=1, stop=None, stream=False):
+        if prompt == "boom":
+            raise RuntimeError("Deadline exceeded")
+        if prompt == "fail":
+            print("Error making request to GPT API: 500 Server Error")
+            return iter([]) if stream else []
+        answers = [f"answer {i} to\n{prompt}" for i in range(n)]
+        if stream:
+            return ((i, answer[start:start + 4]) for i, answer in enumerate(answers) for start in range(0, len(answer), 4))
+        return answers
+
+    def generate_image(self, prompt, n=1, size="medium", response_format="url", save_path=None):
+        if prompt == "boom":
+            raise RuntimeError("Deadline exceeded")
+        if prompt == "fail":
+            print("Error generating image: 400 Client Error")
+            return []
+        return [f"{prompt}-{i}.png" if i % 2 == 0 else None for i in range(n)]
+
+    def generate_variation(self, image_name, n=1, size="medium", response_format="url", save_path=None):
+        return [f"variation-{i}.png" for i in range(n)]
+
+    def get_model(self):
+        return "gpt-test"
+
+
+class JSONOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.cli = CommandLineInterface(_FakeClient(), json_output=True)
+        self.cli._output = self.stdout = io.StringIO()
+        self.stderr = io.StringIO()
+
+    def _run(self, method, *args, **kwargs):
+        """Call a CLI method and return its result and the parsed JSON lines it wrote."""
+        with redirect_stdout(self.stdout), redirect_stderr(self.stderr):
+            result = getattr(self.cli, method)(*args, **kwargs)
+        lines = self.stdout.getvalue().splitlines()
+        self.assertTrue(self.stdout.getvalue().endswith("\n"))
+        return result, [json.loads(line) for line in lines]
+
+    def test_writes_one_record_per_answer(self):
+        result, records = self._run("handle_completion", "Name two rivers", n=2)
+        self.assertTrue(result)
+        self.assertEqual([(record["type"], record["index"], record["text"]) for record in records],
+                         [("completion", 0, "answer 0 to\nName two rivers"), ("completion", 1, "answer 1 to\nName two rivers")])
+        self.assertEqual(records[0]["model"], "gpt-test")
+        self.assertEqual(records[0]["usage"], _FakeClient.last_usage)
+        self.assertNotIn("ttft_ms", records[0])
+        self.assertEqual(len(self.stdout.getvalue().splitlines()), 2)
+
+    def test_streamed_answers_are_joined_with_time_to_first_token(self):
+        result, records = self._run("handle_completion", "rivers", n=2, stream=True)
+        self.assertTrue(result)
+        self.assertEqual([record["text"] for record in records], ["answer 0 to\nrivers", "answer 1 to\nrivers"])
+        self.assertIn("ttft_ms", records[0])
+
+    def test_client_errors_become_error_records(self):
+        result, records = self._run("handle_completion", "fail")
+        self.assertFalse(result)
+        self.assertEqual(records, [{"type": "error", "kind": "completion", "prompt": "fail",
+                                    "error": "Error making request to GPT API: 500 Server Error"}])
+        self.assertIn("500 Server Error", self.stderr.getvalue())
+
+        result, records = self._run("handle_completion", "boom", stream=True)
+        self.assertFalse(result)
+        self.assertEqual(records[-1], {"type": "error", "kind": "completion", "prompt": "boom", "error": "Deadline exceeded"})
+
+    def test_saved_images_and_failed_images(self):
+        result, records = self._run("generate_image", "a fox", n=3, size="small")
+        self.assertEqual(result, ["a fox-0.png", None, "a fox-2.png"])
+        self.assertEqual([(record["type"], record["index"], record.get("path")) for record in records],
+                         [("image", 0, os.path.abspath("a fox-0.png")), ("error", 1, None), ("image", 2, os.path.abspath("a fox-2.png"))])
+        self.assertEqual(records[1], {"type": "error", "kind": "image", "index": 1, "prompt": "a fox",
+                                      "error": "The image could not be saved"})
+        self.assertEqual(records[0]["size"], "small")
+        self.assertIn("latency_ms", records[0])
+
+    def test_image_errors_become_error_records(self):
+        self.assertEqual(self._run("generate_image", "fail")[0], [])
+        self.assertEqual(self._run("generate_image", "boom")[0], [])
+        _, records = self._run("generate_variation", "cat.png", n=1)
+        self.assertEqual(records[:2], [
+            {"type": "error", "kind": "image", "prompt": "fail", "error": "Error generating image: 400 Client Error"},
+            {"type": "error", "kind": "image", "prompt": "boom", "error": "Deadline exceeded"}])
+        self.assertEqual((records[2]["type"], records[2]["source"]), ("variation", os.path.abspath("cat.png")))
+
+    def test_emit_escapes_newlines_and_keeps_unicode(self):
+        self.cli.emit({"type": "completion", "text": "line one\nline two — ünïcode"})
+        self.assertEqual(self.stdout.getvalue().count("\n"), 1)
+        self.assertIn("ünïcode", self.stdout.getvalue())
+        self.assertEqual(json.loads(self.stdout.getvalue())["text"], "line one\nline two — ünïcode")
+
+
+class NonTTYMainTest(unittest.TestCase):
+    """
+    Run tgpt with stdout on a pipe, as in `tgpt tx ... | jq`, against the mock server.
+    """
+    def setUp(self):
+        self.server = MockOpenAIServer(completion_words=5).start()
+        self.addCleanup(self.server.stop)
+        self.home = tempfile.TemporaryDirectory()
+        self.addCleanup(self.home.cleanup)
+        os.makedirs(os.path.join(self.home.name, ".tgpt"))
+
+    def _main(self, *argv, api_base=None):
+        with open(os.path.join(self.home.name, ".tgpt", "config"), "w") as config_file:
+            config_file.write(textwrap.dedent(f"""\
+                [DEFAULT]
+                API = test-key
+                API_BASE = {api_base or self.server.api_base}
+                MAX_RETRIES = 0
+                SEARCH_INDEX =
+                TOKENIZER_FILE = {os.path.join(self.home.name, "missing.tiktoken")}
+                DAEMON_SOCKET = {os.path.join(self.home.name, "tgpt.sock")}
+                """))
+        process = subprocess.run([sys.executable, "-c", "from tgpt.main import main; main()", *argv], cwd=REPO_ROOT,
+                                 env={**os.environ, "HOME": self.home.name}, capture_output=True, text=True, timeout=60)
+        return [json.loads(line) for line in process.stdout.splitlines()], process.stderr
+
+    def test_completions_are_ndjson(self):
+        records, _ = self._main("tx", "Name three rivers", "-n", "3")
+        self.assertEqual([(record["type"], record["index"]) for record in records],
+                         [("completion", 0), ("completion", 1), ("completion", 2)])
+        self.assertEqual(records[0]["text"], "word0 word1 word2 word3 word4")
+
+    def test_request_errors_are_error_records(self):
+        records, stderr = self._main("tx", "Name three rivers", api_base="http://127.0.0.1:9/v1")
+        self.assertEqual(len(records), 1)
+        self.assertEqual((records[0]["type"], records[0]["kind"], records[0]["prompt"]), ("error", "completion", "Name three rivers"))
+        self.assertIn(records[0]["error"], stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from tgpt.context_window import ContextWindow, estimate_tokens
+
+
+def _ten_tokens(message):
+    return 10
+
+
+class ContextWindowTest(unittest.TestCase):
+    def _window(self, turns, **kwargs):
+        window = ContextWindow(token_budget=50, count_tokens=_ten_tokens, **kwargs)
+        window.pin("Be brief.")
+        for i in range(turns):
+            window.add("user", f"u{i}")
+            window.add("assistant", f"a{i}")
+        return window
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens({"role": "user", "content": "x" * 40}), 14)
+        self.assertEqual(estimate_tokens({"role": "user", "content": None}), 4)
+
+    def test_sends_newest_turns_within_budget(self):
+        window = self._window(3)
+        contents = [message["content"] for message in window.build("next")]
+        # The budget leaves room for three turns, but a window never starts with an answer.
+        self.assertEqual(contents, ["Be brief.", "u2", "a2", "next"])
+        self.assertEqual(len(window.messages), 6)
+        self.assertEqual(window.get_token_count(), 60)
+
+    def test_pinned_messages_are_always_sent(self):
+        window = ContextWindow(token_budget=5, count_tokens=_ten_tokens)
+        window.pin("Be brief.")
+        window.add("user", "u0")
+        self.assertEqual([message["content"] for message in window.build("next")], ["Be brief.", "next"])
+
+    def test_folds_dropped_turns_into_summary(self):
+        calls = []
+
+        def summarizer(summary, messages):
+            calls.append((summary, [message["content"] for message in messages]))
+            return f"summary {len(calls)}"
+
+        window = self._window(3, summarizer=summarizer)
+        messages = window.build("next")
+        self.assertEqual(calls, [(None, ["u0", "a0", "u1", "a1"])])
+        self.assertEqual(messages[1], {"role": "system", "content": "Summary of the earlier conversation: summary 1"})
+        self.assertEqual([message["content"] for message in messages[2:]], ["u2", "a2", "next"])
+
+        window.build("again")
+        self.assertEqual(len(calls), 1)
+
+        window.add("user", "u3")
+        window.add("assistant", "a3")
+        window.build("more", summarize=False)
+        self.assertEqual(len(calls), 1)
+        window.build("more")
+        self.assertEqual(calls[1], ("summary 1", ["u2", "a2"]))
+
+    def test_clear_keeps_pinned_messages(self):
+        window = self._window(2, summarizer=lambda summary, messages: "summary")
+        window.build("next")
+        window.clear()
+        self.assertEqual(window.get_token_count(), 0)
+        self.assertIsNone(window.summary)
+        self.assertEqual([message["content"] for message in window.build("next")], ["Be brief.", "next"])
+        window.clear(keep_pinned=False)
+        self.assertEqual(window.build("next"), [{"role": "user", "content": "next"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.daemon import RemoteGPTClient, TGPTDaemon, is_daemon_running
+from tgpt.gpt_client import GPTClient
+from tgpt.http_transport import HTTPTransport
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockOpenAIServer(completion_words=3).start()
+        self.directory = tempfile.TemporaryDirectory()
+        transport = HTTPTransport(timeout=(1, 30))
+        client = GPTClient("test-key", transport=transport, api_base=self.server.api_base)
+        self.daemon = TGPTDaemon(client, socket_path=os.path.join(self.directory.name, "tgpt.sock"), idle_timeout=0.3)
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+        for _ in range(50):
+            if is_daemon_running(self.daemon.socket_path):
+                break
+            time.sleep(0.05)
+
+    def tearDown(self):
+        self.server.latency = 0.0
+        self.thread.join(timeout=5)
+        self.server.stop()
+        self.directory.cleanup()
+        self.assertFalse(self.thread.is_alive())
+
+    def _exchange(self, *requests):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(5)
+            connection.connect(self.daemon.socket_path)
+            connection.sendall(b"".join(json.dumps(request).encode("utf-8") + b"\n" for request in requests))
+            messages = []
+            with connection.makefile("rb") as reader:
+                for line in reader:
+                    messages.append(json.loads(line))
+                    if sum("result" in message or "error" in message for message in messages) == len(requests):
+                        return messages
+
+    def _wait_idle(self, seconds):
+        for _ in range(int(seconds / 0.05)):
+            if self.daemon._active == 0:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def test_ping_and_unknown_command(self):
+        self.assertEqual(self._exchange({"command": "ping"}, {"command": "nope"}),
+                         [{"result": "pong"}, {"error": "Unknown command: nope"}])
+
+    def test_completion_round_trip(self):
+        remote = RemoteGPTClient(self.daemon.socket_path, timeout=5)
+        self.assertEqual(remote.completion("Hello", n=2), ["word0 word1 word2"] * 2)
+
+        self.assertEqual(list(remote.completion("Hello", stream=True)),
+                         [(0, "word0 "), (0, "word1 "), (0, "word2 ")])
+        messages = self._exchange({"command": "tx", "prompt": "Hello", "stream": True})
+        self.assertEqual(messages[-1], {"result": None})
+        self.assertEqual("".join(message["delta"] for message in messages[:-1]), "word0 word1 word2 ")
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "a close behind unread data is only seen on Linux")
+    def test_disconnect_cancels_request_after_front_end_sent_more_data(self):
+        self.server.latency = 10.0
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(self.daemon.socket_path)
+            connection.sendall(b'{"command": "tx", "prompt": "Hello"}\n')
+            time.sleep(0.3)
+            connection.sendall(b'{"command": "ping"}\n')
+            time.sleep(0.3)
+            self.assertEqual(self.daemon._active, 1)
+        start = time.monotonic()
+        self.assertTrue(self._wait_idle(2))
+        self.assertLess(time.monotonic() - start, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
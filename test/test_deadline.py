@@ -0,0 +1,147 @@
+import asyncio
+import os
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.async_client import AsyncGPTClient, AsyncTransport
+from tgpt.batch_runner import BatchRunner
+from tgpt.daemon import RemoteGPTClient, TGPTDaemon
+from tgpt.deadline import Cancelled, Deadline, DeadlineExceeded, DeadlineExecutor, get_active_deadline, propagate
+from tgpt.gpt_client import GPTClient
+from tgpt.http_transport import HTTPTransport
+from tgpt.rate_limiter import RequestScheduler
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_no_deadline_never_expires(self):
+        deadline = Deadline(0)
+        self.assertIsNone(deadline.remaining())
+        self.assertTrue(deadline.allows(1e9))
+        self.assertEqual(deadline.cap((10, 60)), (10, 60))
+
+    def test_cap_shortens_timeouts_to_time_left(self):
+        connect, read = Deadline(1).cap((10, 60))
+        self.assertLessEqual(connect, 1)
+        self.assertLessEqual(read, 1)
+        self.assertEqual(Deadline(100).cap((10, 60)), (10, 60))
+        self.assertLessEqual(Deadline(1).cap(None), 1)
+
+    def test_check_raises_once_expired_or_cancelled(self):
+        deadline = Deadline(0.05)
+        deadline.check()
+        with self.assertRaises(DeadlineExceeded):
+            deadline.check(wait=1)
+        time.sleep(0.06)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.check()
+
+        deadline = Deadline(0)
+        deadline.cancel()
+        self.assertFalse(deadline.allows())
+        with self.assertRaises(Cancelled):
+            deadline.check()
+
+    def test_propagate_runs_within_callers_deadline(self):
+        transport = HTTPTransport()
+        seen = []
+        with transport.command(10) as deadline:
+            worker = threading.Thread(target=propagate(lambda: seen.append(get_active_deadline())))
+            worker.start()
+            worker.join()
+            with DeadlineExecutor(max_workers=2) as executor:
+                seen.append(executor.submit(get_active_deadline).result())
+        self.assertEqual(seen, [deadline, deadline])
+        self.assertIsNone(get_active_deadline())
+
+
+class CancellationTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockOpenAIServer(latency=10.0).start()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.latency = 0.0
+        self.server.stop()
+        self.directory.cleanup()
+
+    def test_deadline_stops_retries(self):
+        transport = HTTPTransport(scheduler=RequestScheduler(max_retries=5, base_delay=0.05), timeout=(1, 0.2))
+        client = GPTClient("test-key", transport=transport, api_base=self.server.api_base)
+        start = time.monotonic()
+        with transport.command(1):
+            self.assertEqual(client.create_completion([{"role": "user", "content": "Hello"}]), [])
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_sigint_aborts_batch_in_flight(self):
+        input_path = os.path.join(self.directory.name, "prompts.jsonl")
+        output_path = os.path.join(self.directory.name, "results.jsonl")
+        with open(input_path, "w") as input_file:
+            for i in range(20):
+                input_file.write(f'{{"prompt": "Question {i}"}}\n')
+
+        transport = HTTPTransport(timeout=(1, 30))
+        client = GPTClient("test-key", transport=transport, api_base=self.server.api_base)
+        runner = BatchRunner(client, concurrency=4, report_interval=60)
+        timer = threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGINT))
+
+        start = time.monotonic()
+        timer.start()
+        with self.assertRaises(KeyboardInterrupt):
+            with transport.command(0) as deadline:
+                runner.run(input_path, output_path)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertTrue(deadline.cancelled)
+
+        # The requests in flight are aborted rather than left waiting for the slow server.
+        for thread in threading.enumerate():
+            if thread.name.startswith("ThreadPoolExecutor"):
+                thread.join(timeout=2)
+                self.assertFalse(thread.is_alive())
+        self.assertLessEqual(self.server.requests, 4)
+        with open(output_path) as output_file:
+            self.assertEqual(output_file.read(), "")
+
+    def test_daemon_cancels_request_when_front_end_gives_up(self):
+        transport = HTTPTransport(timeout=(1, 30))
+        client = GPTClient("test-key", transport=transport, api_base=self.server.api_base)
+        daemon = TGPTDaemon(client, socket_path=os.path.join(self.directory.name, "tgpt.sock"), idle_timeout=0.5)
+        server_thread = threading.Thread(target=daemon.serve_forever)
+        server_thread.start()
+        try:
+            for _ in range(50):
+                if os.path.exists(daemon.socket_path):
+                    break
+                time.sleep(0.05)
+            remote = RemoteGPTClient(daemon.socket_path, timeout=0.5)
+
+            start = time.monotonic()
+            self.assertEqual(remote.completion("Hello"), [])
+            self.assertLess(time.monotonic() - start, 2)
+
+            # Closing the connection cancels the request on the daemon instead of leaving it running.
+            for _ in range(40):
+                if daemon._active == 0:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(daemon._active, 0)
+        finally:
+            server_thread.join(timeout=5)
+        self.assertFalse(server_thread.is_alive())
+
+    def test_async_client_times_out_stalled_request(self):
+        async def complete():
+            transport = AsyncTransport(timeout=(1, 0.3))
+            async with AsyncGPTClient("test-key", transport=transport, api_base=self.server.api_base) as client:
+                return await client.completion("Hello")
+
+        start = time.monotonic()
+        self.assertEqual(asyncio.run(complete()), [])
+        self.assertLess(time.monotonic() - start, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
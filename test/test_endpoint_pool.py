@@ -0,0 +1,91 @@
+import time
+import unittest
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.endpoint_pool import Endpoint, EndpointPool
+from tgpt.gpt_client import GPTClient
+from tgpt.http_transport import HTTPTransport
+from tgpt.rate_limiter import RequestScheduler
+
+
+class EndpointPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.fast = Endpoint("fast", "http://fast/v1/", "key")
+        self.slow = Endpoint("slow", "http://slow/v1", "key")
+        self.pool = EndpointPool([self.fast, self.slow], cooldown=0.05)
+        for endpoint, latency in ((self.fast, 0.1), (self.slow, 0.5)):
+            self.pool.record(self.pool.choose(exclude=[other for other in self.pool.endpoints if other is not endpoint]),
+                             latency, True)
+
+    def _fail(self, endpoint, times):
+        for _ in range(times):
+            endpoint.in_flight += 1
+            self.pool.record(endpoint, 0.0, False)
+
+    def test_needs_an_endpoint(self):
+        with self.assertRaises(ValueError):
+            EndpointPool([])
+
+    def test_routes_urls_of_the_pool(self):
+        self.assertEqual(self.pool.route("http://fast/v1/chat/completions"), "/chat/completions")
+        self.assertIsNone(self.pool.route("http://other/v1/chat/completions"))
+        self.assertIsNone(self.pool.route("http://fast/v1"))
+
+    def test_prefers_unmeasured_then_fastest_weighted_endpoint(self):
+        fresh = Endpoint("fresh", "http://fresh/v1", "key")
+        pool = EndpointPool([self.fast, fresh])
+        self.assertIs(pool.choose(), fresh)
+        self.assertIs(self.pool.choose(), self.fast)
+        self.slow.weight = 10
+        self.assertIs(self.pool.choose(), self.slow)
+
+    def test_spreads_load_by_requests_in_flight(self):
+        chosen = [self.pool.choose() for _ in range(6)]
+        self.assertIn(self.slow, chosen)
+
+    def test_opens_circuit_after_consecutive_failures(self):
+        self._fail(self.fast, 2)
+        self.assertIs(self.pool.choose(), self.fast)
+        self._fail(self.fast, 1)
+        self.assertEqual(self.pool.get_stats()[0]["state"], "open")
+        self.assertIs(self.pool.choose(), self.slow)
+        # With every other endpoint tried, the open one is used rather than refusing the request.
+        self.assertIs(self.pool.choose(exclude=[self.slow]), self.fast)
+
+    def test_probes_once_after_cooldown_and_backs_off(self):
+        self._fail(self.fast, 3)
+        time.sleep(0.06)
+        self.assertEqual(self.pool.get_stats()[0]["state"], "half-open")
+        probe = self.pool.choose()
+        self.assertIs(probe, self.fast)
+        self.assertIs(self.pool.choose(), self.slow)
+
+        self.pool.record(probe, 0.0, False)
+        self.assertAlmostEqual(self.fast.open_until - time.monotonic(), 0.1, delta=0.02)
+        time.sleep(0.11)
+        self.pool.record(self.pool.choose(), 0.1, True)
+        self.assertEqual(self.pool.get_stats()[0]["state"], "closed")
+        self.assertEqual(self.pool._cooldowns["fast"], 0.05)
+
+    def test_uses_endpoint_closed_off_longest_when_all_are_open(self):
+        self._fail(self.fast, 3)
+        time.sleep(0.01)
+        self._fail(self.slow, 3)
+        self.assertIs(self.pool.choose(), self.fast)
+
+
+class FailoverTest(unittest.TestCase):
+    def test_fails_over_to_healthy_endpoint(self):
+        with MockOpenAIServer(error_rate=1.0) as broken, MockOpenAIServer(completion_words=5) as healthy:
+            pool = EndpointPool([Endpoint("broken", broken.api_base, "key"), Endpoint("healthy", healthy.api_base, "key")])
+            transport = HTTPTransport(scheduler=RequestScheduler(base_delay=0.01), endpoints=pool)
+            client = GPTClient("key", transport=transport, api_base=broken.api_base)
+            for i in range(10):
+                self.assertEqual(len(client.create_completion([{"role": "user", "content": f"Question {i}"}])), 1)
+            self.assertEqual(pool.get_stats()[0]["state"], "open")
+            self.assertLessEqual(broken.requests, 3)
+            self.assertEqual(healthy.requests, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
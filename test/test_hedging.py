@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+
+from tgpt.hedging import Hedger
+
+
+def _sleep_then(latency, result):
+    return lambda kind: time.sleep(latency) or result
+
+
+class HedgerBudgetTest(unittest.TestCase):
+    def test_hedges_stay_within_ratio(self):
+        hedger = Hedger(max_ratio=0.1)
+        hedger.requests = 9
+        self.assertFalse(hedger._allow())
+        hedger.requests = 10
+        self.assertTrue(hedger._allow())
+        self.assertFalse(hedger._allow())
+        hedger.requests = 19
+        self.assertFalse(hedger._allow())
+        hedger.requests = 20
+        self.assertTrue(hedger._allow())
+        self.assertEqual(hedger.fired, 2)
+
+    def test_delay_follows_latency_percentile(self):
+        hedger = Hedger(percentile=50, min_samples=3)
+        for latency in (0.1, 0.2):
+            hedger._record("completion", latency)
+        self.assertIsNone(hedger.get_delay("completion"))
+        hedger._record("completion", 0.3)
+        self.assertAlmostEqual(hedger.get_delay("completion"), 0.2)
+        self.assertIsNone(hedger.get_delay("other"))
+
+
+class HedgerRunTest(unittest.TestCase):
+    def _warm(self, hedger, count=3):
+        for _ in range(count):
+            hedger.run(_sleep_then(0.01, "fast"), "completion")
+
+    def test_runs_inline_until_a_hedge_could_fire(self):
+        threads = []
+        hedger = Hedger(min_samples=3, max_ratio=1.0)
+        for _ in range(3):
+            hedger.run(lambda kind: threads.append(threading.current_thread()), "completion")
+        self.assertEqual(threads, [threading.main_thread()] * 3)
+        self.assertIsNotNone(hedger.get_delay("completion"))
+
+        hedger = Hedger(min_samples=1, max_ratio=0.01)
+        hedger._record("completion", 0.01)
+        hedger.run(lambda kind: threads.append(threading.current_thread()), "completion")
+        self.assertIs(threads[-1], threading.main_thread())
+
+    def test_reuses_worker_and_starts_no_hedge_for_fast_requests(self):
+        hedger = Hedger(min_samples=3, max_ratio=1.0)
+        self._warm(hedger)
+        workers = set()
+
+        def call(kind):
+            workers.add(threading.current_thread())
+            time.sleep(0.001)
+            return kind
+
+        for _ in range(20):
+            self.assertEqual(hedger.run(call, "completion"), "completion")
+            time.sleep(0.01)
+        self.assertEqual(len(workers), 1)
+        self.assertEqual(hedger.get_stats()["fired"], 0)
+
+    def test_hedge_answers_slow_request(self):
+        hedger = Hedger(min_samples=3, max_ratio=1.0)
+        self._warm(hedger)
+        released = []
+        finished = threading.Event()
+
+        def cancel(result):
+            released.append(result)
+            finished.set()
+
+        def call(kind):
+            return _sleep_then(0.01, "hedge")(kind) if kind.endswith("_hedge") else _sleep_then(0.5, "primary")(kind)
+
+        start = time.monotonic()
+        self.assertEqual(hedger.run(call, "completion", cancel=cancel), "hedge")
+        self.assertLess(time.monotonic() - start, 0.3)
+        self.assertEqual(hedger.get_stats(), {"requests": 4, "fired": 1, "won": 1})
+        self.assertTrue(finished.wait(2))
+        self.assertEqual(released, ["primary"])
+
+    def test_failure_of_the_only_request_is_raised(self):
+        hedger = Hedger(min_samples=3, max_ratio=1.0)
+        with self.assertRaises(ValueError):
+            hedger.run(lambda kind: int("inline"), "completion")
+        self._warm(hedger)
+        with self.assertRaises(ValueError):
+            hedger.run(lambda kind: int("pooled"), "completion")
+        self.assertEqual(hedger.get_stats()["fired"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.gpt_client import GPTClient
+from tgpt.http_transport import HTTPTransport, TrackedHTTPConnectionPool
+from tgpt.metrics import Metrics
+
+
+class _ListSink:
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def close(self):
+        pass
+
+
+class HTTPTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockOpenAIServer(completion_words=3).start()
+        self.url = self.server.api_base + "/chat/completions"
+        self.payload = {"model": "gpt-4", "messages": [{"role": "user", "content": "Hello"}]}
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _post(self, transport):
+        response = transport.post(self.url, json=self.payload)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_reuses_keep_alive_connections(self):
+        sink = _ListSink()
+        transport = HTTPTransport(metrics=Metrics([sink]))
+        for _ in range(5):
+            self._post(transport)
+
+        self.assertEqual(transport.get_stats(), {"hosts": 1, "connections": 1, "requests": 5, "reused": 4,
+                                                 "reuse_ratio": 0.8})
+        self.assertIsInstance(transport._adapter.poolmanager.connection_from_url(self.url), TrackedHTTPConnectionPool)
+
+        # Only the first request pays for opening the connection.
+        self.assertEqual(len(sink.records), 5)
+        self.assertGreater(sink.records[0]["connect_ms"], 0)
+        self.assertEqual([record["connect_ms"] for record in sink.records[1:]], [0] * 4)
+
+    def test_blocking_pool_never_opens_more_than_its_size(self):
+        self.server.latency = 0.1
+        transport = HTTPTransport(pool_size=2, pool_block=True)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(lambda _: self._post(transport), range(6)))
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+        self.assertEqual(transport.get_stats()["connections"], 2)
+
+    def test_non_blocking_pool_opens_extra_connections_under_load(self):
+        self.server.latency = 0.1
+        transport = HTTPTransport(pool_size=2)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(lambda _: self._post(transport), range(6)))
+        self.assertLess(time.monotonic() - start, 0.3)
+        self.assertEqual(transport.get_stats()["connections"], 6)
+
+    def test_client_and_image_handler_share_the_pool(self):
+        transport = HTTPTransport()
+        client = GPTClient("test-key", transport=transport, api_base=self.server.api_base)
+        self.assertIs(client.image_handler.transport, transport)
+        client.create_completion(self.payload["messages"])
+        client.create_completion(self.payload["messages"], temperature=0)
+        self.assertEqual(transport.get_stats()["connections"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from tgpt.async_client import AsyncImageHandler, AsyncTransport
+from tgpt.http_transport import HTTPTransport
+from tgpt.image_handler import ImageHandler, _Base64ImageWriter
+
+IMAGE = b"\x89PNG" + bytes(range(256)) * 4
+
+
+class _FileServer:
+    """
+    A local file server failing in the ways downloads can fail: /missing answers 404, /flaky
+    answers 503 the first time, /truncated cuts the first transfer short.
+    """
+    def __init__(self):
+        self.hits = Counter()
+        hits = self.hits
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                hits[self.path] += 1
+                if self.path == "/missing" or (self.path == "/flaky" and hits[self.path] == 1):
+                    self.send_response(404 if self.path == "/missing" else 503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = IMAGE
+                start = 0
+                if self.headers.get("Range"):
+                    start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+                    self.send_response(206)
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(body) - start))
+                self.end_headers()
+                if self.path == "/truncated" and hits[self.path] == 1:
+                    self.wfile.write(body[:100])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body[start:])
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SaveImageTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _FileServer()
+        self.directory = tempfile.TemporaryDirectory()
+        self.handler = ImageHandler("test-key", transport=HTTPTransport(), download_retries=3)
+        sleep = mock.patch("tgpt.image_handler.time.sleep")
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def _save(self, path):
+        file_path = os.path.join(self.directory.name, "image.png")
+        return self.handler.save_image({"url": self.server.url + path}, file_path), file_path
+
+    def test_retries_server_errors(self):
+        saved, file_path = self._save("/flaky")
+        self.assertEqual(saved, file_path)
+        self.assertEqual(self.server.hits["/flaky"], 2)
+        with open(file_path, "rb") as image_file:
+            self.assertEqual(image_file.read(), IMAGE)
+
+    def test_resumes_truncated_transfer(self):
+        saved, file_path = self._save("/truncated")
+        self.assertEqual(saved, file_path)
+        self.assertEqual(self.server.hits["/truncated"], 2)
+        with open(file_path, "rb") as image_file:
+            self.assertEqual(image_file.read(), IMAGE)
+
+    def test_does_not_retry_client_errors(self):
+        saved, file_path = self._save("/missing")
+        self.assertIsNone(saved)
+        self.assertEqual(self.server.hits["/missing"], 1)
+        self.sleep.assert_not_called()
+        self.assertFalse(os.path.exists(file_path + ".part"))
+
+    def test_does_not_retry_past_deadline(self):
+        with self.handler.transport.command(0) as deadline:
+            deadline.cancel()
+            saved, _ = self._save("/flaky")
+        self.assertIsNone(saved)
+        self.sleep.assert_not_called()
+
+
+class Base64ImageWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.images = [IMAGE, IMAGE[:-1], IMAGE[:-2]]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _body(self, escape=lambda encoded: encoded):
+        data = [{"b64_json": escape(base64.b64encode(image).decode("ascii"))} for image in self.images]
+        return json.dumps({"created": 0, "data": data}).replace("\\\\", "\\").encode("ascii")
+
+    def _writer(self):
+        return _Base64ImageWriter(lambda i: os.path.join(self.directory.name, f"image-{i}.png"))
+
+    def _decode(self, body, split):
+        writer = self._writer()
+        with redirect_stdout(io.StringIO()):
+            for position in range(0, len(body), split):
+                writer.feed(body[position:position + split])
+            writer.close()
+        return writer
+
+    def _assert_saved(self, writer):
+        self.assertEqual(len(writer.paths), len(self.images))
+        for path, image in zip(writer.paths, self.images):
+            with open(path, "rb") as image_file:
+                self.assertEqual(image_file.read(), image)
+        self.assertEqual([name for name in os.listdir(self.directory.name) if name.endswith(".part")], [])
+
+    def test_decodes_whatever_the_chunk_boundaries(self):
+        body = self._body()
+        for split in (1, 2, 3, 5, 7, 64, len(body)):
+            self._assert_saved(self._decode(body, split))
+
+    def test_resolves_json_escapes_split_across_chunks(self):
+        body = self._body(lambda encoded: encoded.replace("/", "\\/").replace("+", "\\u002B")[:40] + "\\n"
+                          + encoded.replace("/", "\\/").replace("+", "\\u002B")[40:])
+        self.assertIn(b"\\/", body)
+        self.assertIn(b"\\u002B", body)
+        for split in (1, 3, 4, 5, 7):
+            self._assert_saved(self._decode(body, split))
+
+    def test_rejects_truncated_and_malformed_values(self):
+        body = self._body()
+        for broken in (body[:body.index(b"b64_json") + 30], body[:body.index(b"b64_json") + 10],
+                       body.replace(b'"b64_json": "', b'"b64_json": "A', 1),
+                       body.replace(b'"b64_json": "', b'"b64_json": "*', 1),
+                       body.replace(b'"b64_json": "', b'"b64_json": "\\q', 1),
+                       body.replace(b'"b64_json": "', b'"b64_json": 12', 1)):
+            writer = self._writer()
+            with redirect_stdout(io.StringIO()), self.assertRaises(ValueError):
+                for position in range(0, len(broken), 5):
+                    writer.feed(broken[position:position + 5])
+                writer.close()
+            writer.abort()
+            self.assertEqual([name for name in os.listdir(self.directory.name) if name.endswith(".part")], [])
+
+    def test_async_writer_reports_malformed_values(self):
+        path = os.path.join(self.directory.name, "image.png")
+        encoded = base64.b64encode(IMAGE).decode("ascii")
+        AsyncImageHandler._write_b64(encoded[:20] + "\n" + encoded[20:], path, chunk_size=8)
+        with open(path, "rb") as image_file:
+            self.assertEqual(image_file.read(), IMAGE)
+
+        handler = AsyncImageHandler("test-key", transport=AsyncTransport())
+        for broken in (encoded[:-1], "*" + encoded[1:], None):
+            stdout = io.StringIO()
+            with redirect_stdout(stdout):
+                self.assertIsNone(asyncio.run(handler.save_image({"b64_json": broken}, path + ".broken")))
+            self.assertIn("An error occurred while saving the image", stdout.getvalue())
+            self.assertFalse(os.path.exists(path + ".broken.part"))
+
+
+if __name__ == "__main__":
+    unittest.main()
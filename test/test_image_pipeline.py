@@ -0,0 +1,86 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.http_transport import HTTPTransport
+from tgpt.image_handler import ImageHandler
+from tgpt.image_pipeline import ImagePipeline
+from tgpt.main import build_parser
+
+
+class ImagePipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockOpenAIServer(image_bytes=1024).start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.prompts_path = os.path.join(self.directory.name, "prompts.txt")
+        self.output_dir = os.path.join(self.directory.name, "images")
+        with open(self.prompts_path, "w") as prompts_file:
+            prompts_file.write("A red fox\n# skipped\n\nA blue whale\n")
+        handler = ImageHandler("test-key", transport=HTTPTransport(), api_base=self.server.api_base)
+        self.pipeline = ImagePipeline(handler, concurrency=2, max_per_request=2)
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def _manifest(self):
+        with open(os.path.join(self.output_dir, ImagePipeline.MANIFEST_NAME)) as manifest_file:
+            return [json.loads(line) for line in manifest_file]
+
+    def test_generates_named_images_and_manifest(self):
+        stats = self.pipeline.generate(self.prompts_path, self.output_dir, n=3)
+        self.assertEqual((stats["completed"], stats["failed"], stats["images"]), (2, 0, 6))
+        self.assertEqual([(record["key"], record["n"], record["size"]) for record in self._manifest()],
+                         [("0001-a-red-fox", 3, "medium"), ("0004-a-blue-whale", 3, "medium")])
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "0004-a-blue-whale-2.png")))
+
+    def test_rerun_skips_only_inputs_made_with_same_count_and_size(self):
+        self.pipeline.generate(self.prompts_path, self.output_dir, n=2)
+        requests = self.server.requests
+
+        stats = self.pipeline.generate(self.prompts_path, self.output_dir, n=2)
+        self.assertEqual((stats["skipped"], stats["completed"]), (2, 0))
+        self.assertEqual(self.server.requests, requests)
+
+        stats = self.pipeline.generate(self.prompts_path, self.output_dir, n=4)
+        self.assertEqual((stats["skipped"], stats["completed"], stats["images"]), (0, 2, 8))
+
+        stats = self.pipeline.generate(self.prompts_path, self.output_dir, n=4, size="small")
+        self.assertEqual((stats["skipped"], stats["completed"]), (0, 2))
+
+        # Each input keeps a single record, from its latest run.
+        self.assertEqual([(record["n"], record["size"]) for record in self._manifest()],
+                         [(4, "small"), (4, "small")])
+        stats = self.pipeline.generate(self.prompts_path, self.output_dir, n=4, size="small")
+        self.assertEqual(stats["skipped"], 2)
+
+    def test_rejects_counts_below_one(self):
+        with self.assertRaises(ValueError):
+            self.pipeline.generate(self.prompts_path, self.output_dir, n=0)
+        self.assertEqual(self.server.requests, 0)
+
+    def test_reports_failed_inputs_to_callback(self):
+        failures = []
+        self.pipeline.on_error = lambda source, error, elapsed: failures.append((source, error))
+        self.pipeline.handler.transport.scheduler.max_retries = 0
+        self.server.error_rate = 1.0
+        with contextlib.redirect_stderr(io.StringIO()):
+            stats = self.pipeline.generate(self.prompts_path, self.output_dir, n=1)
+        self.assertEqual((stats["completed"], stats["failed"]), (0, 2))
+        self.assertEqual(sorted(source for source, _ in failures), ["A blue whale", "A red fox"])
+        self.assertTrue(all(error.startswith("request failed") for _, error in failures))
+
+    def test_output_directory_is_an_option(self):
+        argv = ["gi", "--from-file", "prompts.txt", "-o", "assets"]
+        args = build_parser(argv).parse_args(argv)
+        self.assertEqual((args.from_file, args.output_dir, args.prompt), ("prompts.txt", "assets", None))
+        argv = ["gv", "--dir", "inputs", "--output-dir", "variations"]
+        args = build_parser(argv).parse_args(argv)
+        self.assertEqual((args.dir, args.output_dir, args.image_name), ("inputs", "variations", None))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import hashlib
+import io
+import os
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+from tgpt import image_preprocessor
+from tgpt.image_preprocessor import MAX_UPLOAD_BYTES, PNG_SIGNATURE, ImagePreprocessor, read_image_header
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def png_header(width, height):
+    """Build the start of a PNG up to its dimensions, which is all the header check reads."""
+    return PNG_SIGNATURE + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", width, height) + b"\x08\x02\x00\x00\x00"
+
+
+def encode(image, image_format="PNG"):
+    output = io.BytesIO()
+    image.save(output, format=image_format)
+    return output.getvalue()
+
+
+class ReadImageHeaderTest(unittest.TestCase):
+    def test_reads_dimensions_of_each_format(self):
+        self.assertEqual(read_image_header(png_header(30, 20)), ("PNG", 30, 20))
+        self.assertEqual(read_image_header(b"GIF89a" + struct.pack("<HH", 7, 9)), ("GIF", 7, 9))
+        self.assertEqual(read_image_header(b"RIFF\x00\x00\x00\x00WEBPVP8 "), ("WEBP", None, None))
+        self.assertEqual(read_image_header(b"not an image"), (None, None, None))
+
+    @unittest.skipIf(Image is None, "Pillow is not installed")
+    def test_reads_jpeg_frame_dimensions(self):
+        data = encode(Image.new("RGB", (48, 24), "red"), "JPEG")
+        self.assertEqual(read_image_header(data), ("JPEG", 48, 24))
+
+
+class ValidateWithoutPillowTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(image_preprocessor, "Image", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.preprocessor = ImagePreprocessor(cache_dir=None)
+
+    def test_square_png_is_uploaded_unchanged(self):
+        data = png_header(64, 64) + b"rest of the file"
+        self.assertIs(self.preprocessor.prepare(data, "512x512"), data)
+
+    def test_rejects_non_square_png(self):
+        with self.assertRaisesRegex(ValueError, "64x32 but must be square"):
+            self.preprocessor.prepare(png_header(64, 32), "512x512")
+
+    def test_rejects_oversized_png(self):
+        data = png_header(64, 64) + b"\x00" * MAX_UPLOAD_BYTES
+        with self.assertRaisesRegex(ValueError, "over the 4 MB limit"):
+            self.preprocessor.prepare(data, "512x512")
+
+    def test_rejects_other_formats(self):
+        with self.assertRaisesRegex(ValueError, "GIF images must be converted"):
+            self.preprocessor.prepare(b"GIF89a" + struct.pack("<HH", 8, 8), "512x512")
+        with self.assertRaisesRegex(ValueError, "Unsupported image format"):
+            self.preprocessor.prepare(b"not an image", "512x512")
+
+
+@unittest.skipIf(Image is None, "Pillow is not installed")
+class ProcessTest(unittest.TestCase):
+    def _prepare(self, image, size="256x256", fit="crop", image_format="PNG"):
+        result = ImagePreprocessor(fit=fit, cache_dir=None).prepare(encode(image, image_format), size)
+        self.assertTrue(result.startswith(PNG_SIGNATURE))
+        return Image.open(io.BytesIO(result))
+
+    def test_crop_keeps_the_center(self):
+        image = Image.new("RGB", (40, 20), "blue")
+        image.paste(Image.new("RGB", (20, 20), "lime"), (10, 0))
+        result = self._prepare(image)
+        self.assertEqual((result.size, result.mode), ((20, 20), "RGB"))
+        self.assertEqual(result.getcolors(), [(400, (0, 255, 0))])
+
+    def test_pad_centers_on_transparency(self):
+        result = self._prepare(Image.new("RGB", (40, 20), "red"), fit="pad")
+        self.assertEqual((result.size, result.mode), ((40, 40), "RGBA"))
+        self.assertEqual(result.getpixel((20, 2)), (0, 0, 0, 0))
+        self.assertEqual(result.getpixel((20, 20)), (255, 0, 0, 255))
+        self.assertEqual(result.getpixel((20, 37)), (0, 0, 0, 0))
+
+    def test_downscales_to_target_but_never_upscales(self):
+        self.assertEqual(self._prepare(Image.new("RGB", (600, 400), "red")).size, (256, 256))
+        self.assertEqual(self._prepare(Image.new("RGB", (100, 100), "red")).size, (100, 100))
+
+    def test_converts_jpeg_to_png(self):
+        self.assertEqual(self._prepare(Image.new("RGB", (300, 300), "red"), image_format="JPEG").size, (256, 256))
+
+    def test_rejects_unreadable_image(self):
+        with self.assertRaisesRegex(ValueError, "Unreadable image"):
+            ImagePreprocessor(cache_dir=None).prepare(png_header(8, 8), "256x256")
+
+    def test_rejects_unknown_fit(self):
+        with self.assertRaisesRegex(ValueError, "Unknown image fit"):
+            ImagePreprocessor(fit="stretch")
+
+
+@unittest.skipIf(Image is None, "Pillow is not installed")
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.data = encode(Image.new("RGB", (64, 32), "red"))
+
+    def _preprocessor(self, **kwargs):
+        preprocessor = ImagePreprocessor(cache_dir=self.directory.name, **kwargs)
+        patcher = mock.patch.object(preprocessor, "_process", wraps=preprocessor._process)
+        self.addCleanup(patcher.stop)
+        return preprocessor, patcher.start()
+
+    def _entries(self):
+        return sorted(name for name in os.listdir(self.directory.name) if name.endswith(".png"))
+
+    def _path(self, data, size="256x256", fit="crop"):
+        key = hashlib.sha256(data + f"|{size}|{fit}".encode()).hexdigest()
+        return os.path.join(self.directory.name, f"{key}.png")
+
+    def test_hit_skips_processing_across_instances(self):
+        first, process = self._preprocessor()
+        result = first.prepare(self.data, "256x256")
+        self.assertEqual(process.call_count, 1)
+        self.assertEqual(len(self._entries()), 1)
+
+        second, process = self._preprocessor()
+        self.assertEqual(second.prepare(self.data, "256x256"), result)
+        process.assert_not_called()
+
+    def test_source_size_and_fit_change_the_key(self):
+        preprocessor, process = self._preprocessor()
+        preprocessor.prepare(self.data, "256x256")
+        preprocessor.prepare(encode(Image.new("RGB", (64, 32), "blue")), "256x256")
+        preprocessor.prepare(self.data, "16x16")
+        self.assertEqual(process.call_count, 3)
+
+        padded, process = self._preprocessor(fit="pad")
+        self.assertEqual(Image.open(io.BytesIO(padded.prepare(self.data, "256x256"))).size, (64, 64))
+        self.assertEqual(process.call_count, 1)
+        self.assertEqual(len(self._entries()), 4)
+
+    def test_evicts_least_recently_used_entries(self):
+        preprocessor, process = self._preprocessor(max_cache_entries=2)
+        sources = [encode(Image.new("RGB", (8, 8), color)) for color in ("red", "lime", "blue")]
+        for age, source in enumerate(sources[:2]):
+            preprocessor.prepare(source, "256x256")
+            os.utime(self._path(source), (age, age))
+
+        # Reading the oldest entry refreshes it, so the other one is evicted next.
+        preprocessor.prepare(sources[0], "256x256")
+        preprocessor.prepare(sources[2], "256x256")
+        self.assertEqual(process.call_count, 3)
+        self.assertTrue(os.path.exists(self._path(sources[0])))
+        self.assertFalse(os.path.exists(self._path(sources[1])))
+        self.assertEqual(len(self._entries()), 2)
+
+    def test_unwritable_cache_is_ignored(self):
+        blocker = os.path.join(self.directory.name, "file")
+        open(blocker, "w").close()
+        preprocessor = ImagePreprocessor(cache_dir=os.path.join(blocker, "cache"))
+        self.assertTrue(preprocessor.prepare(self.data, "256x256").startswith(PNG_SIGNATURE))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import io
+import unittest
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.gpt_client import GPTClient
+from tgpt.http_transport import HTTPTransport
+from tgpt.map_reduce import PROMPT_OVERHEAD, MapReduce, iter_chunks
+
+
+class IterChunksTest(unittest.TestCase):
+    def test_splits_on_best_boundary(self):
+        text = b"first paragraph.\n\nsecond paragraph. more words here\n"
+        chunks = list(iter_chunks(io.BytesIO(text), 32))
+        self.assertEqual(chunks[0], "first paragraph.\n\n")
+        self.assertEqual("".join(chunks).encode(), text)
+        self.assertTrue(all(len(chunk.encode()) <= 32 for chunk in chunks))
+
+    def test_does_not_cut_characters(self):
+        text = "é" * 100
+        chunks = list(iter_chunks(io.BytesIO(text.encode()), 15))
+        self.assertEqual("".join(chunks), text)
+        self.assertNotIn("�", "".join(chunks))
+
+    def test_skips_blank_chunks(self):
+        self.assertEqual(list(iter_chunks(io.BytesIO(b""), 16)), [])
+        self.assertEqual(list(iter_chunks(io.BytesIO(b"   \n\n   "), 4)), [])
+
+
+class ChunkBudgetTest(unittest.TestCase):
+    def test_defaults_to_room_left_in_context(self):
+        runner = MapReduce(GPTClient("test-key", model="gpt-4", max_tokens=100))
+        self.assertEqual(runner.chunk_tokens, 8192 - 100 - PROMPT_OVERHEAD)
+
+    def test_clamps_requested_budget_to_context(self):
+        client = GPTClient("test-key", model="gpt-4", max_tokens=100)
+        self.assertEqual(MapReduce(client, chunk_tokens=100000).chunk_tokens, 8192 - 100 - PROMPT_OVERHEAD)
+        self.assertEqual(MapReduce(client, chunk_tokens=1000).chunk_tokens, 1000)
+
+    def test_rejects_context_too_small_to_split(self):
+        with self.assertRaises(ValueError):
+            MapReduce(GPTClient("test-key", model="gpt-4", max_tokens=4000))
+        with self.assertRaises(ValueError):
+            MapReduce(GPTClient("test-key", model="gpt-4", max_tokens=100), chunk_tokens=100)
+
+
+class MapReduceTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockOpenAIServer(completion_words=20).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_combines_chunks_into_one_answer(self):
+        client = GPTClient("test-key", model="gpt-4", max_tokens=100, transport=HTTPTransport(),
+                           api_base=self.server.api_base)
+        runner = MapReduce(client, concurrency=3, chunk_tokens=256)
+        source = io.BytesIO(("A sentence of input text. " * 400).encode())
+        partials = []
+        result = runner.run(source, "Count the sentences.", on_partial=lambda index, text: partials.append(index))
+
+        self.assertIsNotNone(result["answer"])
+        self.assertGreater(result["chunks"], 1)
+        self.assertEqual(result["failed"], 0)
+        self.assertEqual(sorted(partials), list(range(result["chunks"])))
+        self.assertGreater(result["requests"], result["chunks"])
+
+    def test_small_input_is_one_request(self):
+        client = GPTClient("test-key", model="gpt-4", transport=HTTPTransport(), api_base=self.server.api_base)
+        result = MapReduce(client).run(io.BytesIO(b"Hello"))
+        self.assertEqual((result["chunks"], result["requests"]), (1, 1))
+        self.assertIsNotNone(result["answer"])
+
+
+if __name__ == "__main__":
+    unittest.main()
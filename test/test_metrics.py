@@ -0,0 +1,122 @@
+import atexit
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+
+from tgpt.metrics import (HistogramSink, JSONLinesSink, Metrics, PrometheusTextfileSink, make_record,
+                          percentile)
+
+
+def _record(kind="completion", total_ms=70.0, status=200, error=None, retries=0, prompt_tokens=10,
+            completion_tokens=20, ttfb_ms=50.0):
+    return {"time": time.time(), "kind": kind, "method": "POST", "host": "api.openai.com", "status": status,
+            "error": error, "retries": retries, "queue_ms": 0.0, "connect_ms": 0.0, "ttfb_ms": ttfb_ms,
+            "total_ms": total_ms, "bytes_out": 100, "bytes_in": 300, "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens}
+
+
+class PercentileTest(unittest.TestCase):
+    def test_nearest_rank(self):
+        self.assertIsNone(percentile([], 0.5))
+        self.assertEqual(percentile([7], 0.99), 7)
+        samples = list(range(100, 0, -1))
+        self.assertEqual(percentile(samples, 0.0), 1)
+        self.assertEqual(percentile(samples, 0.5), 51)
+        self.assertEqual(percentile(samples, 0.95), 95)
+        self.assertEqual(percentile(samples, 0.99), 99)
+        self.assertEqual(percentile(samples, 1.0), 100)
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 3)
+
+
+class HistogramSinkTest(unittest.TestCase):
+    def test_summarizes_per_kind(self):
+        sink = HistogramSink(max_samples=3)
+        self.assertEqual(sink.format(), "No requests recorded yet.")
+        for total_ms in (1000.0, 10.0, 20.0, 30.0):
+            sink.record(_record(total_ms=total_ms))
+        sink.record(_record(kind="download", status=None, error="timed out", retries=2, prompt_tokens=None,
+                            completion_tokens=None, ttfb_ms=None))
+        sink.record(_record(kind="download", status=404))
+
+        summary = sink.summary()
+        self.assertEqual(list(summary), ["completion", "download"])
+        completion = summary["completion"]
+        self.assertEqual((completion["requests"], completion["errors"], completion["prompt_tokens"]), (3, 0, 30))
+        self.assertEqual((completion["total_p50_ms"], completion["total_p99_ms"]), (20.0, 30.0))
+        download = summary["download"]
+        self.assertEqual((download["requests"], download["errors"], download["retries"]), (2, 2, 2))
+        self.assertEqual(download["ttfb_p50_ms"], 50.0)
+        self.assertEqual(download["bytes_in"], 600)
+        self.assertIn("completion", sink.format())
+
+
+class JSONLinesSinkTest(unittest.TestCase):
+    def test_appends_one_record_per_line(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "logs", "metrics.jsonl")
+            sink = JSONLinesSink(path)
+            records = [_record(), _record(kind="download", error="boom")]
+            for record in records:
+                sink.record(record)
+            with open(path) as log_file:
+                self.assertEqual([json.loads(line) for line in log_file], records)
+
+
+class PrometheusTextfileSinkTest(unittest.TestCase):
+    def test_writes_counters_and_cumulative_histogram(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tgpt.prom")
+            sink = PrometheusTextfileSink(path, interval=1e9)
+            self.addCleanup(atexit.unregister, sink.close)
+            sink.record(_record(total_ms=70.0, retries=1))
+            sink.record(_record(total_ms=3000.0))
+            sink.record(_record(kind="download", status=None, error="boom", prompt_tokens=None, completion_tokens=None))
+            self.assertFalse(os.path.exists(path))
+            sink.close()
+
+            with open(path) as prom_file:
+                lines = prom_file.read().splitlines()
+        self.assertIn('tgpt_requests_total{kind="completion",status="200"} 2', lines)
+        self.assertIn('tgpt_requests_total{kind="download",status="error"} 1', lines)
+        self.assertIn('tgpt_retries_total{kind="completion"} 1', lines)
+        self.assertIn('tgpt_bytes_total{kind="completion",direction="in"} 600', lines)
+        self.assertIn('tgpt_tokens_total{kind="completion",type="completion"} 40', lines)
+        self.assertFalse(any(line.startswith('tgpt_tokens_total{kind="download"') for line in lines))
+        buckets = {line.split('le="')[1].split('"')[0]: int(line.split()[-1]) for line in lines
+                   if line.startswith('tgpt_request_duration_seconds_bucket{kind="completion"')}
+        self.assertEqual((buckets["0.05"], buckets["0.1"], buckets["2.5"], buckets["5"], buckets["+Inf"]), (0, 1, 1, 2, 2))
+        self.assertIn('tgpt_request_duration_seconds_sum{kind="completion"} 3.070000', lines)
+        self.assertIn('tgpt_request_duration_seconds_count{kind="completion"} 2', lines)
+
+
+class MetricsTest(unittest.TestCase):
+    def test_failing_sink_does_not_fail_the_request(self):
+        class BrokenSink:
+            def record(self, record):
+                raise OSError("disk full")
+
+            def close(self):
+                pass
+
+        metrics = Metrics([BrokenSink()])
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            metrics.record(_record())
+        self.assertIn("Error writing request metrics: disk full", stdout.getvalue())
+        self.assertEqual(metrics.histogram.summary()["completion"]["requests"], 1)
+
+    def test_make_record_of_a_failed_request(self):
+        record = make_record("completion", "POST", "https://api.openai.com/v1/chat/completions", time.perf_counter(),
+                             connect=0.002, queue=0.5, retries=3, error=TimeoutError("read timed out"))
+        self.assertEqual((record["host"], record["status"], record["error"]), ("api.openai.com", None, "read timed out"))
+        self.assertEqual((record["connect_ms"], record["queue_ms"], record["retries"]), (2.0, 500.0, 3))
+        self.assertIsNone(record["ttfb_ms"])
+        self.assertIsNone(record["prompt_tokens"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import io
+import time
+import unittest
+from email.utils import formatdate
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.deadline import Deadline, DeadlineExceeded
+from tgpt.gpt_client import GPTClient
+from tgpt.http_transport import HTTPTransport
+from tgpt.rate_limiter import RequestScheduler, TokenBucket, parse_duration, parse_retry_after, was_sent
+
+
+def _response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response.raw = io.BytesIO(b"")
+    return response
+
+
+class ParseTest(unittest.TestCase):
+    def test_parse_duration(self):
+        self.assertAlmostEqual(parse_duration("20ms"), 0.02)
+        self.assertAlmostEqual(parse_duration("1.5s"), 1.5)
+        self.assertAlmostEqual(parse_duration("6m0s"), 360)
+        self.assertAlmostEqual(parse_duration("1h2m"), 3720)
+        self.assertEqual(parse_duration("2"), 2)
+        self.assertIsNone(parse_duration(""))
+        self.assertIsNone(parse_duration("soon"))
+
+    def test_parse_retry_after(self):
+        self.assertAlmostEqual(parse_retry_after({"retry-after-ms": "250", "Retry-After": "9"}), 0.25)
+        self.assertEqual(parse_retry_after({"Retry-After": "3"}), 3)
+        self.assertEqual(parse_retry_after({"Retry-After": "-3"}), 0)
+        self.assertIsNone(parse_retry_after({}))
+        self.assertIsNone(parse_retry_after({"Retry-After": "later"}))
+        self.assertAlmostEqual(parse_retry_after({"Retry-After": formatdate(time.time() + 30, usegmt=True)}), 30, delta=2)
+        self.assertEqual(parse_retry_after({"Retry-After": formatdate(time.time() - 30, usegmt=True)}), 0)
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_unlimited_bucket_never_waits(self):
+        bucket = TokenBucket(0)
+        self.assertEqual(sum(bucket.acquire(1000) for _ in range(100)), 0)
+
+    def test_paces_once_empty(self):
+        bucket = TokenBucket(6000)
+        self.assertEqual(bucket.acquire(6000), 0)
+        start = time.monotonic()
+        waited = bucket.acquire(10)
+        elapsed = time.monotonic() - start
+        self.assertGreater(waited, 0.05)
+        self.assertGreaterEqual(elapsed, 0.09)
+        self.assertLess(elapsed, 0.5)
+
+    def test_sync_blocks_until_reset(self):
+        bucket = TokenBucket(6000)
+        bucket.sync(0, reset=0.2)
+        start = time.monotonic()
+        bucket.acquire(1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_wait_past_deadline_raises(self):
+        bucket = TokenBucket(60)
+        bucket.acquire(60)
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            bucket.acquire(30, Deadline(1))
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+class RequestSchedulerTest(unittest.TestCase):
+    def _send(self, scheduler, outcomes, deadline=None, idempotent=True):
+        outcomes = list(outcomes)
+        attempts = []
+
+        def send_request():
+            attempts.append(time.monotonic())
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        stats = {}
+        return scheduler.send(send_request, stats=stats, deadline=deadline, idempotent=idempotent), stats, attempts
+
+    def test_retries_rate_limited_request_after_retry_after(self):
+        scheduler = RequestScheduler(base_delay=5)
+        response, stats, attempts = self._send(scheduler, [_response(429, {"retry-after-ms": "100"}),
+                                                           _response(503, {"Retry-After": "0"}), _response(200)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stats["retries"], 2)
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.09)
+        self.assertLess(attempts[2] - attempts[1], 0.05)
+
+    def test_does_not_retry_client_errors(self):
+        response, stats, attempts = self._send(RequestScheduler(base_delay=0.01), [_response(400), _response(200)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(attempts), 1)
+
+    def test_gives_up_after_max_retries(self):
+        scheduler = RequestScheduler(max_retries=2, base_delay=0.01)
+        response, stats, attempts = self._send(scheduler, [_response(500)] * 3)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(attempts), 3)
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self._send(scheduler, [requests.exceptions.ConnectionError()] * 3)
+
+    def test_only_resends_unsafe_requests_that_were_never_sent(self):
+        refused = requests.exceptions.ConnectionError(MaxRetryError(None, "/", NewConnectionError(None, "refused")))
+        dropped = requests.exceptions.ConnectionError(ProtocolError("Connection aborted."))
+        self.assertFalse(was_sent(refused))
+        self.assertFalse(was_sent(requests.exceptions.ConnectTimeout()))
+        self.assertTrue(was_sent(dropped))
+        self.assertTrue(was_sent(requests.exceptions.ReadTimeout()))
+
+        scheduler = RequestScheduler(base_delay=0.01)
+        for error in (refused, requests.exceptions.ConnectTimeout()):
+            response, stats, _ = self._send(scheduler, [error, _response(200)], idempotent=False)
+            self.assertEqual((response.status_code, stats["retries"]), (200, 1))
+        for error in (dropped, requests.exceptions.ReadTimeout()):
+            with self.assertRaises(type(error)):
+                self._send(scheduler, [error, _response(200)], idempotent=False)
+            response, _, _ = self._send(scheduler, [error, _response(200)])
+            self.assertEqual(response.status_code, 200)
+
+    def test_backs_off_exponentially_with_jitter(self):
+        scheduler = RequestScheduler(base_delay=1, max_delay=4)
+        for attempt, (low, high) in enumerate([(0.5, 1), (1, 2), (2, 4), (2, 4)]):
+            delay = scheduler._backoff(attempt)
+            self.assertGreaterEqual(delay, low)
+            self.assertLessEqual(delay, high)
+
+    def test_returns_response_when_retry_would_pass_deadline(self):
+        start = time.monotonic()
+        response, _, attempts = self._send(RequestScheduler(), [_response(429, {"Retry-After": "10"}), _response(200)],
+                                           deadline=Deadline(1))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(attempts), 1)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_learns_limits_from_headers(self):
+        scheduler = RequestScheduler(tokens_per_minute=1000)
+        scheduler.update_from_headers({"x-ratelimit-limit-requests": "120", "x-ratelimit-remaining-requests": "0",
+                                       "x-ratelimit-reset-requests": "150ms", "x-ratelimit-limit-tokens": "5000"})
+        self.assertEqual(scheduler.requests_per_minute.rate, 120)
+        self.assertEqual(scheduler.tokens_per_minute.rate, 1000)
+        start = time.monotonic()
+        scheduler.requests_per_minute.acquire(1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.14)
+
+
+class RateLimitedServerTest(unittest.TestCase):
+    def test_slow_completion_is_not_sent_again(self):
+        with MockOpenAIServer(latency=0.5) as server:
+            transport = HTTPTransport(scheduler=RequestScheduler(base_delay=0.01), timeout=(1, 0.2))
+            client = GPTClient("test-key", transport=transport, api_base=server.api_base)
+            self.assertEqual(client.create_completion([{"role": "user", "content": "Hello"}]), [])
+            self.assertEqual(server.requests, 1)
+
+    def test_every_request_succeeds_despite_rate_limits(self):
+        with MockOpenAIServer(rate_limit_rate=0.3, error_rate=0.1, completion_words=5) as server:
+            transport = HTTPTransport(scheduler=RequestScheduler(max_retries=8, base_delay=0.01))
+            client = GPTClient("test-key", transport=transport, api_base=server.api_base)
+            for i in range(20):
+                self.assertEqual(len(client.create_completion([{"role": "user", "content": f"Question {i}"}],
+                                                              use_cache=False)), 1)
+            self.assertGreater(server.requests, 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import time
+import unittest
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.endpoint_pool import Endpoint, EndpointPool
+from tgpt.gpt_client import GPTClient
+from tgpt.http_transport import HTTPTransport
+from tgpt.response_cache import ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _cache(self, **kwargs):
+        return ResponseCache(self.directory.name, **kwargs)
+
+    def test_key_covers_request_fields_only(self):
+        payload = {"model": "gpt-4", "messages": [{"role": "user", "content": "Hi"}], "temperature": 0}
+        self.assertEqual(ResponseCache.make_key(payload), ResponseCache.make_key(dict(payload, stream=True)))
+        self.assertNotEqual(ResponseCache.make_key(payload), ResponseCache.make_key(dict(payload, n=2)))
+
+    def test_key_covers_endpoint(self):
+        payload = {"model": "gpt-4", "messages": [{"role": "user", "content": "Hi"}], "temperature": 0}
+        self.assertNotEqual(ResponseCache.make_key(payload, "https://a.example/v1/chat/completions"),
+                            ResponseCache.make_key(payload, "https://b.example/v1/chat/completions"))
+
+    def test_only_temperature_zero_is_cacheable(self):
+        self.assertTrue(ResponseCache.is_cacheable({"temperature": 0}))
+        self.assertTrue(ResponseCache.is_cacheable({"temperature": 0.0}))
+        self.assertFalse(ResponseCache.is_cacheable({"temperature": 0.7}))
+
+    def test_stores_and_expires_entries(self):
+        cache = self._cache(ttl=0.05)
+        cache.set("key", ["answer"])
+        self.assertEqual(cache.get("key"), ["answer"])
+        self.assertIsNone(cache.get("other"))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("key"))
+        self.assertFalse(os.path.exists(cache._path("key")))
+
+    def test_overwriting_an_entry_counts_its_size_once(self):
+        cache = self._cache()
+        for _ in range(3):
+            cache.set("first", ["x" * 100])
+            cache.set("key", ["x" * 1000])
+        self.assertEqual(cache._total_bytes, cache._scan_size())
+
+    def test_evicts_least_recently_used_entries(self):
+        cache = self._cache()
+        for key in ("a", "b", "c"):
+            cache.set(key, ["x" * 1000])
+            os.utime(cache._path(key), (time.time() - 100 + ord(key), time.time() - 100 + ord(key)))
+        # Room for three and a half entries, so the cache shrinks to three of them when full.
+        cache.max_bytes = int(os.path.getsize(cache._path("a")) * 3.5)
+        cache.get("a")
+        cache.set("d", ["x" * 1000])
+        self.assertEqual([key for key in "abcd" if os.path.exists(cache._path(key))], ["a", "c", "d"])
+        self.assertLessEqual(cache._total_bytes, cache.max_bytes * 0.9)
+
+        # Rewriting existing entries does not inflate the size and evict them.
+        for _ in range(10):
+            cache.set("d", ["x" * 1000])
+        self.assertTrue(os.path.exists(cache._path("a")))
+
+    def test_clear(self):
+        cache = self._cache()
+        cache.set("key", ["answer"])
+        cache.clear()
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache._total_bytes, 0)
+
+
+class CachedCompletionTest(unittest.TestCase):
+    def test_only_deterministic_requests_are_served_from_cache(self):
+        with tempfile.TemporaryDirectory() as directory, MockOpenAIServer(completion_words=5) as server:
+            client = GPTClient("test-key", transport=HTTPTransport(), cache=ResponseCache(directory),
+                               api_base=server.api_base)
+            messages = [{"role": "user", "content": "Hello"}]
+            first = client.create_completion(messages, temperature=0)
+            self.assertEqual(client.create_completion(messages, temperature=0), first)
+            self.assertEqual(list(client.create_completion(messages, temperature=0, stream=True)), [(0, first[0])])
+            self.assertEqual(server.requests, 1)
+
+            client.create_completion(messages, temperature=0.7)
+            client.create_completion(messages, temperature=0.7)
+            self.assertEqual(server.requests, 3)
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_routed_requests_are_keyed_on_the_whole_pool(self):
+        pool = EndpointPool([Endpoint("b", "https://b.example/v1", "key"), Endpoint("a", "https://a.example/v1", "key")])
+        client = GPTClient("test-key", transport=HTTPTransport(endpoints=pool), api_base="https://b.example/v1")
+        self.assertEqual(client._cache_endpoint(), ["https://a.example/v1/chat/completions",
+                                                    "https://b.example/v1/chat/completions"])
+        self.assertEqual(GPTClient("test-key")._cache_endpoint(), "https://api.openai.com/v1/chat/completions")
+
+    def test_answers_are_not_shared_between_backends(self):
+        with tempfile.TemporaryDirectory() as directory, MockOpenAIServer(completion_words=5) as first, \
+                MockOpenAIServer(completion_words=3) as second:
+            cache = ResponseCache(directory)
+            messages = [{"role": "user", "content": "Hello"}]
+            for server in (first, second):
+                client = GPTClient("test-key", transport=HTTPTransport(), cache=cache, api_base=server.api_base)
+                self.assertEqual(len(client.create_completion(messages, temperature=0)[0].split()),
+                                 server.completion_words)
+                self.assertEqual(server.requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
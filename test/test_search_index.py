@@ -0,0 +1,63 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from tgpt.main import open_search_index
+from tgpt.search_index import SearchIndex
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.index = SearchIndex(os.path.join(self.directory.name, "index.db"))
+
+    def tearDown(self):
+        self.index.close()
+        self.directory.cleanup()
+
+    def test_finds_records_by_stemmed_words(self):
+        self.index.add("text", "What is the capital of France?", "Paris is the capital of France.", model="gpt-4")
+        self.index.add("text", "Name a large river", "The Loire runs through France.")
+        results = self.index.search("capitals")
+        self.assertEqual([result["prompt"] for result in results], ["What is the capital of France?"])
+        self.assertIn("[capital]", results[0]["snippet"])
+        self.assertEqual(results[0]["model"], "gpt-4")
+        self.assertEqual(self.index.count(), 2)
+
+    def test_every_word_must_match(self):
+        self.index.add("text", "capital of France", "Paris")
+        self.index.add("text", "capital of Spain", "Madrid")
+        self.assertEqual(len(self.index.search("capital")), 2)
+        self.assertEqual([result["answer"] for result in self.index.search("capital spain")], ["Madrid"])
+
+    def test_ranks_prompt_matches_first(self):
+        self.index.add("text", "Tell me about rivers", "Many mention an ocean")
+        self.index.add("text", "Describe the ocean", "It is large")
+        self.assertEqual(self.index.search("ocean")[0]["prompt"], "Describe the ocean")
+
+    def test_filters_by_kind_and_keeps_paths(self):
+        self.index.add("text", "A sunset over the sea", "Orange light")
+        self.index.add("image", "A sunset over the sea", paths=["/tmp/sunset.png"])
+        results = self.index.search("sunset", kind="image")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["paths"], ["/tmp/sunset.png"])
+
+    def test_query_punctuation_is_not_fts_syntax(self):
+        self.index.add("text", "What does NOT mean?", "A negation")
+        self.assertEqual(SearchIndex.to_match_expression('not* "x" OR (y)'), '"not" "x" "OR" "y"')
+        self.assertEqual(len(self.index.search('NOT?')), 1)
+        self.assertEqual(self.index.search("?!"), [])
+
+
+class OpenSearchIndexTest(unittest.TestCase):
+    def test_goes_on_without_index_when_it_cannot_be_opened(self):
+        with tempfile.NamedTemporaryFile() as not_a_directory:
+            self.assertIsNone(open_search_index(os.path.join(not_a_directory.name, "index.db")))
+        with mock.patch("tgpt.search_index.SearchIndex.__init__", side_effect=sqlite3.OperationalError("no such module: fts5")):
+            self.assertIsNone(open_search_index("unused.db"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import contextlib
+import io
+import os
+import tempfile
+import time
+import unittest
+from configparser import ConfigParser
+from unittest import mock
+
+from tgpt.config_handler import ConfigHandler
+from tgpt.session_store import SessionStore, _iter_lines_reversed
+
+
+def _ten_tokens(message):
+    return 10
+
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = SessionStore(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _session(self, name, turns):
+        session = self.store.open(name)
+        for i in range(turns):
+            session.extend([{"role": "user", "content": f"u{i}"}, {"role": "assistant", "content": f"a{i}"}])
+        return session
+
+    def test_reads_newest_messages_within_budget(self):
+        session = self._session("chat", 5)
+        session.close()
+        # Five messages fit, but the tail must start with a user message.
+        tail = self.store.open("chat").read_tail(50, _ten_tokens)
+        self.assertEqual([message["content"] for message in tail], ["u3", "a3", "u4", "a4"])
+        self.assertEqual(self.store.open("chat").read_tail(1000, _ten_tokens)[0]["content"], "u0")
+
+    def test_reads_tail_across_blocks(self):
+        path = os.path.join(self.directory.name, "lines.txt")
+        with open(path, "wb") as lines_file:
+            lines_file.write(b"".join(f"line {i}\n".encode() for i in range(1000)))
+        lines = list(_iter_lines_reversed(path, block_size=7))
+        self.assertEqual(lines[0], b"line 999")
+        self.assertEqual(lines[-1], b"line 0")
+        self.assertEqual(len(lines), 1000)
+        self.assertEqual(list(_iter_lines_reversed(os.path.join(self.directory.name, "missing"))), [])
+
+    def test_skips_line_torn_by_crash(self):
+        session = self._session("torn", 1)
+        session.close()
+        with open(session.path, "ab") as log:
+            log.write(b'{"role": "user", "cont')
+        session = self.store.open("torn")
+        session.append("user", "after crash")
+        session.close()
+        contents = [message["content"] for message in session.read_tail(1000, _ten_tokens)]
+        self.assertEqual(contents, ["u0", "a0", "after crash"])
+
+    def test_keeps_pinned_messages(self):
+        session = self.store.open("pinned")
+        self.assertEqual(session.get_pinned(), [])
+        session.set_pinned([{"role": "system", "content": "Be brief."}])
+        self.assertEqual(self.store.open("pinned").get_pinned(), ["Be brief."])
+
+    def test_lists_sessions_newest_first(self):
+        self._session("old", 1).close()
+        time.sleep(0.02)
+        self._session("new", 1).close()
+        self.assertEqual([session["name"] for session in self.store.list_sessions()], ["new", "old"])
+        self.assertEqual(self.store.latest(), "new")
+        self.assertFalse(self.store.open("unsaved").exists())
+
+    def test_rejects_unsafe_names(self):
+        for name in ("../escape", ".hidden", "a/b", ""):
+            with self.assertRaises(ValueError):
+                self.store.open(name)
+
+
+class SessionsConfigTest(unittest.TestCase):
+    def test_sessions_are_off_by_default(self):
+        config = ConfigHandler.__new__(ConfigHandler)
+        config.config = ConfigParser()
+        self.assertFalse(config.get_sessions_enabled())
+
+        with tempfile.TemporaryDirectory() as directory:
+            config.config_file_path = os.path.join(directory, "config")
+            with mock.patch("builtins.input", return_value="test-key"), contextlib.redirect_stdout(io.StringIO()):
+                config._create_default_config()
+            config = ConfigHandler.__new__(ConfigHandler)
+            config.config = ConfigParser()
+            config.config.read(os.path.join(directory, "config"))
+            self.assertEqual(config.get_api_key(), "test-key")
+            self.assertFalse(config.get_sessions_enabled())
+
+
+if __name__ == "__main__":
+    unittest.main()
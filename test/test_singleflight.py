@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.async_client import AsyncGPTClient
+from tgpt.singleflight import SingleFlight, make_key
+
+
+class MakeKeyTest(unittest.TestCase):
+    def test_ignores_key_order_but_not_values(self):
+        self.assertEqual(make_key("url", {"a": 1, "b": 2}), make_key("url", {"b": 2, "a": 1}))
+        self.assertNotEqual(make_key("url", {"a": 1}), make_key("url", {"a": 2}))
+        self.assertNotEqual(make_key("url", {"a": 1}), make_key("other", {"a": 1}))
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_coalesces_concurrent_calls(self):
+        flight = SingleFlight()
+        runs = []
+        started = threading.Barrier(8)
+
+        def call(_):
+            started.wait()
+            return flight.do("key", lambda: runs.append(1) or time.sleep(0.2) or "answer")
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(call, range(8)))
+        self.assertEqual(results, ["answer"] * 8)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(flight.get_stats(), {"calls": 8, "shared": 7})
+
+    def test_keeps_nothing_once_finished(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("key", lambda: 1), 1)
+        self.assertEqual(flight.do("key", lambda: 2), 2)
+        self.assertEqual(flight.get_stats()["shared"], 0)
+
+    def test_shares_errors_with_waiters(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def fail():
+            release.wait()
+            raise ValueError("boom")
+
+        leader = ThreadPoolExecutor(max_workers=2)
+        first = leader.submit(flight.do, "key", fail)
+        time.sleep(0.05)
+        second = leader.submit(flight.do, "key", lambda: "unused")
+        time.sleep(0.05)
+        release.set()
+        for future in (first, second):
+            with self.assertRaises(ValueError):
+                future.result(timeout=2)
+        leader.shutdown()
+
+    def test_waiters_retry_when_leader_is_interrupted(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        outcome = {}
+
+        def interrupted():
+            release.wait()
+            raise KeyboardInterrupt
+
+        def lead():
+            try:
+                flight.do("key", interrupted)
+            except KeyboardInterrupt:
+                outcome["leader"] = "interrupted"
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        time.sleep(0.05)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            waiter = executor.submit(flight.do, "key", lambda: "retried")
+            time.sleep(0.05)
+            release.set()
+            self.assertEqual(waiter.result(timeout=2), "retried")
+        leader.join()
+        self.assertEqual(outcome, {"leader": "interrupted"})
+
+    def test_async_tasks_share_requests(self):
+        with MockOpenAIServer(latency=0.2, completion_words=5) as server:
+            async def run():
+                async with AsyncGPTClient("test-key", api_base=server.api_base) as client:
+                    return await asyncio.gather(*(client.completion("Hello") for _ in range(5)))
+
+            results = asyncio.run(run())
+            self.assertEqual(server.requests, 1)
+        self.assertEqual(len({tuple(result) for result in results}), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
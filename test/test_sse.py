@@ -0,0 +1,57 @@
+import unittest
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.gpt_client import GPTClient
+from tgpt.http_transport import HTTPTransport, iter_sse_data
+
+
+class _FakeResponse:
+    """
+    A stand-in for a streamed requests.Response, yielding the given raw lines.
+    """
+    def __init__(self, lines):
+        self.lines = lines
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+
+class IterSseDataTest(unittest.TestCase):
+    def _parse(self, text):
+        return list(iter_sse_data(_FakeResponse(text.encode("utf-8").split(b"\n"))))
+
+    def test_yields_each_event_until_done(self):
+        events = self._parse('data: {"a": 1}\n\ndata: {"a": 2}\n\ndata: [DONE]\n\ndata: {"a": 3}\n\n')
+        self.assertEqual(events, [{"a": 1}, {"a": 2}])
+
+    def test_joins_multiline_data_and_skips_other_fields(self):
+        events = self._parse(': keep-alive\nevent: delta\nid: 7\ndata: {"a":\ndata: 1}\n\n')
+        self.assertEqual(events, [{"a": 1}])
+
+    def test_accepts_data_without_space_and_unterminated_last_event(self):
+        self.assertEqual(self._parse('data:{"a": 1}\n\ndata: {"a": 2}'), [{"a": 1}, {"a": 2}])
+        self.assertEqual(self._parse('data: [DONE]'), [])
+
+    def test_counts_bytes_received(self):
+        response = _FakeResponse([b'data: {"a": 1}', b""])
+        list(iter_sse_data(response))
+        self.assertEqual(response.tgpt_bytes_in, len(b'data: {"a": 1}') + 2)
+
+
+class StreamCompletionTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockOpenAIServer(completion_words=10).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_streams_completion_deltas(self):
+        client = GPTClient("test-key", transport=HTTPTransport(), api_base=self.server.api_base)
+        deltas = list(client.create_completion([{"role": "user", "content": "Hello"}], stream=True, use_cache=False))
+        self.assertGreater(len(deltas), 1)
+        self.assertTrue(all(index == 0 for index, _ in deltas))
+        self.assertEqual(len("".join(delta for _, delta in deltas).split()), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import base64
+import os
+import tempfile
+import unittest
+
+from tgpt.gpt_client import GPTClient
+from tgpt.tokenizer import Tokenizer, get_context_size, get_encoding
+
+
+def _write_vocab(path):
+    """
+    Write a vocabulary of every single byte, plus the merges "ab" and "abc".
+    """
+    tokens = [bytes([i]) for i in range(256)] + [b"ab", b"abc"]
+    with open(path, "wb") as vocab_file:
+        for rank, token in enumerate(tokens):
+            vocab_file.write(base64.b64encode(token) + b" " + str(rank).encode() + b"\n")
+
+
+class ContextSizeTest(unittest.TestCase):
+    def test_known_models(self):
+        self.assertEqual(get_context_size("gpt-4"), 8192)
+        self.assertEqual(get_context_size("gpt-4-0613"), 8192)
+        self.assertEqual(get_context_size("gpt-4-32k-0613"), 32768)
+        self.assertEqual(get_context_size("gpt-4o"), 128000)
+        self.assertEqual(get_context_size("gpt-4o-2024-08-06"), 128000)
+        self.assertEqual(get_context_size("gpt-4o-mini"), 128000)
+        self.assertEqual(get_context_size("gpt-4o-mini-2024-07-18"), 128000)
+        self.assertEqual(get_context_size("gpt-4-turbo"), 128000)
+        self.assertEqual(get_context_size("gpt-4-turbo-2024-04-09"), 128000)
+        self.assertEqual(get_context_size("gpt-3.5-turbo-16k"), 16384)
+        self.assertEqual(get_context_size("gpt-3.5-turbo-0613"), 4096)
+
+    def test_unknown_models(self):
+        self.assertIsNone(get_context_size("llama-3-70b"))
+        self.assertIsNone(get_context_size("gpt-4.5-preview"))
+        self.assertIsNone(get_context_size("gpt-4ox"))
+
+    def test_encodings(self):
+        self.assertEqual(get_encoding("gpt-4-0613"), "cl100k_base")
+        self.assertEqual(get_encoding("gpt-3.5-turbo-16k"), "cl100k_base")
+        self.assertEqual(get_encoding("gpt-4o-mini-2024-07-18"), "o200k_base")
+        self.assertEqual(get_encoding("gpt-4.1-nano"), "o200k_base")
+        self.assertEqual(get_encoding("o3-mini"), "o200k_base")
+        self.assertIsNone(get_encoding("llama-3-70b"))
+
+
+class TokenizerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.vocab_path = os.path.join(self.directory.name, "vocab.tiktoken")
+        _write_vocab(self.vocab_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_estimates_without_vocabulary(self):
+        tokenizer = Tokenizer(vocab_path=os.path.join(self.directory.name, "missing"))
+        self.assertFalse(tokenizer.exact)
+        self.assertEqual(tokenizer.encode("hello"), [])
+        self.assertEqual(tokenizer.count(""), 0)
+        self.assertEqual(tokenizer.count("a" * 40), 10)
+
+    def test_merges_lowest_ranked_pairs(self):
+        tokenizer = Tokenizer(vocab_path=self.vocab_path)
+        self.assertTrue(tokenizer.exact)
+        self.assertEqual(tokenizer.encode("abc"), [257])
+        self.assertEqual(tokenizer.encode("abcab"), [257, 256])
+        self.assertEqual(tokenizer.encode("ba"), [ord("b"), ord("a")])
+        self.assertEqual(tokenizer.count("abc abc"), 3)
+        self.assertTrue(tokenizer.is_exact_for("gpt-4"))
+        self.assertFalse(tokenizer.is_exact_for("gpt-4o"))
+        self.assertFalse(tokenizer.is_exact_for("llama-3-70b"))
+
+    def test_counts_message_overhead(self):
+        tokenizer = Tokenizer(vocab_path=self.vocab_path)
+        message = {"role": "ab", "content": "abc"}
+        self.assertEqual(tokenizer.count_message(message), 3 + 1 + 1)
+        self.assertEqual(tokenizer.count_messages([message, message]), 2 * 5 + 3)
+
+
+class FitMaxTokensTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        vocab_path = os.path.join(self.directory.name, "vocab.tiktoken")
+        _write_vocab(vocab_path)
+        self.tokenizer = Tokenizer(vocab_path=vocab_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _fit(self, model, content, max_tokens=100):
+        client = GPTClient("test-key", model=model, tokenizer=self.tokenizer)
+        return client._fit_max_tokens([{"role": "user", "content": content}], model, max_tokens)
+
+    def test_shrinks_to_room_left(self):
+        max_tokens, prompt_tokens = self._fit("gpt-4", "x " * 4050)
+        self.assertEqual(max_tokens, 8192 - prompt_tokens)
+
+    def test_rejects_prompt_over_context(self):
+        max_tokens, _ = self._fit("gpt-4", "x " * 4500)
+        self.assertIsNone(max_tokens)
+        max_tokens, _ = self._fit("gpt-4o", "x " * 4500)
+        self.assertEqual(max_tokens, 100)
+
+    def test_other_encoding_is_left_to_the_api(self):
+        max_tokens, _ = self._fit("gpt-4o", "x " * 140000)
+        self.assertEqual(max_tokens, 100)
+
+    def test_estimated_counts_are_left_to_the_api(self):
+        client = GPTClient("test-key", tokenizer=Tokenizer(vocab_path=os.path.join(self.directory.name, "missing")))
+        max_tokens, _ = client._fit_max_tokens([{"role": "user", "content": "x" * 40000}], "gpt-4", 100)
+        self.assertEqual(max_tokens, 100)
+
+    def test_unknown_model_is_left_to_the_api(self):
+        max_tokens, prompt_tokens = self._fit("llama-3-70b", "x " * 4500)
+        self.assertEqual(max_tokens, 100)
+        self.assertGreater(prompt_tokens, 8192)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.mock_server import MockOpenAIServer
+from tgpt.gpt_client import GPTClient
+from tgpt.http_transport import HTTPTransport
+from tgpt.main import build_retriever
+from tgpt.vector_index import EmbeddingIndexer, Retriever, VectorIndex
+
+
+class _Config:
+    """
+    The configuration values build_retriever reads.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def get_embedding_index(self):
+        return self.path
+
+    def get_retrieval_top_k(self):
+        return 2
+
+
+class VectorIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "index")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_finds_most_similar_rows(self):
+        index = VectorIndex(self.path)
+        index.append([[1, 0, 0], [0, 2, 0], [1, 1, 0]], [{"text": "x"}, {"text": "y"}, {"text": "xy"}])
+        matches = index.search([1, 0.1, 0], k=2)
+        self.assertEqual([match["text"] for match in matches], ["x", "xy"])
+        self.assertAlmostEqual(matches[0]["score"], 0.995, places=3)
+        self.assertEqual(index.search([0, 1, 0], k=0), [])
+
+    def test_reopens_from_disk(self):
+        VectorIndex(self.path).append([[1, 0], [0, 1]], [{"text": "a"}, {"text": "b"}])
+        VectorIndex(self.path).append([[1, 1]], [{"text": "c"}])
+        index = VectorIndex(self.path)
+        self.assertEqual((index.count, index.dimensions), (3, 2))
+        self.assertEqual(index.search([0, 1], k=1)[0]["text"], "b")
+        self.assertEqual(index.search([1, 1], k=1)[0]["row"], 2)
+
+    def test_rejects_other_dimensions(self):
+        index = VectorIndex(self.path)
+        index.append([[1, 0]], [{"text": "a"}])
+        with self.assertRaises(ValueError):
+            index.append([[1, 0, 0]], [{"text": "b"}])
+
+    def test_drops_rows_of_interrupted_append(self):
+        index = VectorIndex(self.path)
+        index.append([[1, 0]], [{"text": "a"}])
+        with open(os.path.join(self.path, VectorIndex.VECTORS_NAME), "ab") as vectors_file:
+            vectors_file.write(b"\0" * 6)
+        index = VectorIndex(self.path)
+        index.append([[0, 1]], [{"text": "b"}])
+        self.assertEqual(os.path.getsize(os.path.join(self.path, VectorIndex.VECTORS_NAME)), 2 * 2 * 4)
+        self.assertEqual(index.search([0, 1], k=1)[0]["text"], "b")
+
+    def test_skips_rows_of_previous_versions(self):
+        index = VectorIndex(self.path)
+        index.append([[1, 0]], [{"text": "old", "source": "/doc", "run": 1}])
+        index.mark_source("/doc", {"mtime_ns": 1, "size": 1, "run": 1})
+        index.append([[1, 0.1]], [{"text": "new", "source": "/doc", "run": 2}])
+        index.mark_source("/doc", {"mtime_ns": 2, "size": 1, "run": 2})
+        self.assertEqual([match["text"] for match in index.search([1, 0], k=5)], ["new"])
+        self.assertTrue(index.is_current("/doc", 2, 1))
+        self.assertFalse(index.is_current("/doc", 1, 1))
+
+
+class EmbeddingIndexerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockOpenAIServer().start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.documents = os.path.join(self.directory.name, "docs")
+        os.makedirs(os.path.join(self.documents, ".git"))
+        self._write("cache.md", "The response cache keeps answers on disk for a day.")
+        self._write("timeouts.md", "Every request gives up after the read timeout.")
+        self._write(".git/HEAD", "ref: refs/heads/main")
+        with open(os.path.join(self.documents, "image.png"), "wb") as binary_file:
+            binary_file.write(b"\x89PNG\0\0")
+        self.client = GPTClient("test-key", transport=HTTPTransport(), api_base=self.server.api_base)
+        self.index_path = os.path.join(self.directory.name, "index")
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def _write(self, name, text):
+        with open(os.path.join(self.documents, name), "w") as document:
+            document.write(text)
+
+    def test_embeds_changed_files_only(self):
+        index = VectorIndex(self.index_path, dimensions=64)
+        stats = EmbeddingIndexer(self.client, index).run([self.documents])
+        self.assertEqual((stats["sources"], stats["skipped"], stats["failed"]), (2, 1, 0))
+
+        stats = EmbeddingIndexer(self.client, index).run([self.documents])
+        self.assertEqual((stats["sources"], stats["skipped"]), (0, 3))
+
+        self._write("cache.md", "The response cache now keeps answers for a week.")
+        stats = EmbeddingIndexer(self.client, index).run([self.documents])
+        self.assertEqual((stats["sources"], stats["skipped"]), (1, 2))
+        sources = [match["source"] for match in index.search([1.0] * 64, k=10)]
+        self.assertEqual(sorted(sources), sorted(os.path.join(self.documents, name) for name in ("cache.md", "timeouts.md")))
+
+    def test_retriever_injects_relevant_chunks(self):
+        EmbeddingIndexer(self.client, VectorIndex(self.index_path, dimensions=256)).run([self.documents])
+        retriever = build_retriever(_Config(self.index_path), self.client)
+        self.assertIsInstance(retriever, Retriever)
+        self.assertEqual(retriever.k, 2)
+        message = retriever.build_message("response cache keeps answers")
+        self.assertEqual(message["role"], "system")
+        self.assertIn("cache.md", message["content"])
+        self.assertNotIn("timeouts.md", message["content"])
+
+    def test_no_retriever_without_index(self):
+        self.assertIsNone(build_retriever(_Config(self.index_path), self.client))
+
+
+if __name__ == "__main__":
+    unittest.main()
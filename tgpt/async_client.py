@@ -0,0 +1,400 @@
+import asyncio
+import base64
+import json
+import os
+from datetime import datetime
+from .image_preprocessor import ImagePreprocessor
+from .singleflight import SingleFlight, make_key
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncTransport:
+    """
+    A shared asyncio HTTP transport with a pooled connector and a cap on in-flight requests.
+
+    Attributes:
+        pool_size (int): The maximum number of pooled connections.
+        max_in_flight (int): The maximum number of requests sent concurrently.
+        timeout (tuple): The seconds allowed to connect and the seconds allowed between bytes received.
+        deadline (float): The number of seconds a request may take in total, or 0 for no deadline.
+    """
+    def __init__(self, pool_size=100, max_in_flight=20, timeout=(10, 60), deadline=300):
+        """
+        Initialize the AsyncTransport. The underlying session is created on first use,
+        inside the running event loop.
+        """
+        if aiohttp is None:
+            raise ImportError("The async client requires aiohttp, install it with: pip install tgpt[async]")
+        self.pool_size = pool_size
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.deadline = deadline
+        self._session = None
+        self._semaphore = None
+
+    def _get_session(self):
+        """
+        Retrieve the shared session, creating it and the semaphore on first use. Every request
+        of the session times out when it cannot connect, stalls or runs past the deadline.
+
+        Returns:
+            aiohttp.ClientSession: The pooled session.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            connect, read = self.timeout
+            timeout = aiohttp.ClientTimeout(total=self.deadline or None, sock_connect=connect, sock_read=read)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._session
+
+    async def request_json(self, method, url, **kwargs):
+        """
+        Send a request and decode the JSON response body.
+
+        Returns:
+            dict: The decoded JSON response.
+        """
+        session = self._get_session()
+        async with self._semaphore:
+            async with session.request(method, url, **kwargs) as response:
+                response.raise_for_status()
+                return await response.json()
+
+    async def iter_sse_data(self, url, **kwargs):
+        """
+        Send a streaming POST request and yield the JSON payload of every server-sent event.
+
+        Yields:
+            dict: The decoded payload of each event, until the [DONE] sentinel is received.
+        """
+        session = self._get_session()
+        async with self._semaphore:
+            async with session.post(url, **kwargs) as response:
+                response.raise_for_status()
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        return
+                    yield json.loads(data)
+
+    async def download(self, url, file_path, chunk_size=65536):
+        """
+        Download the given URL to a file in chunks.
+
+        Returns:
+            str: The file path the download was written to.
+        """
+        session = self._get_session()
+        async with self._semaphore:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                with open(file_path, "wb") as out_file:
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        out_file.write(chunk)
+        return file_path
+
+    async def close(self):
+        """
+        Close the session and every pooled connection.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class AsyncImageHandler:
+    """
+    An asyncio handler for generating and saving images from the OpenAI API.
+
+    Attributes:
+        api_key (str): The OpenAI API key.
+        transport (AsyncTransport): The shared asyncio transport.
+        preprocessor (ImagePreprocessor): Prepares variation sources before they are uploaded.
+        singleflight (SingleFlight): Coalesces identical image generations in flight.
+    """
+    def __init__(self, api_key, transport=None, api_base="https://api.openai.com/v1", preprocessor=None):
+        """
+        Initialize the AsyncImageHandler with the given API key.
+        """
+        self.api_key = api_key
+        self.transport = transport if transport is not None else AsyncTransport()
+        api_base = api_base.rstrip("/")
+        self.endpoint_generation = f"{api_base}/images/generations"
+        self.endpoint_variation = f"{api_base}/images/variations"
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        self.image_sizes = {"small": "256x256", "medium": "512x512", "large": "1024x1024"}
+        self.preprocessor = preprocessor if preprocessor is not None else ImagePreprocessor()
+        self.singleflight = SingleFlight()
+
+    async def generate_image(self, prompt, size="medium", n=1, response_format="url", save_path=None):
+        """
+        Generate an image based on the given prompt and save it to the specified location.
+        Identical generations made while one is in flight share its images.
+
+        Returns:
+            list: A list of file paths where the generated images are saved.
+        """
+        key = make_key(self.endpoint_generation, prompt, size, n, response_format, save_path or os.getcwd())
+        return await self.singleflight.do_async(key, lambda: self._generate_image(prompt, size, n, response_format, save_path))
+
+    async def _generate_image(self, prompt, size, n, response_format, save_path):
+        """
+        Send a generation request and save its images.
+
+        Returns:
+            list: A list of file paths where the generated images are saved.
+        """
+        data = {
+            "model": "image-alpha-001",
+            "prompt": prompt,
+            "size": self.image_sizes[size],
+            "n": n,
+            "response_format": response_format,
+        }
+
+        try:
+            result = await self.transport.request_json("POST", self.endpoint_generation, headers=self.headers, json=data)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error making request to OpenAI API: {e}")
+            return []
+
+        return await self._save_all(result.get("data", []), "gpt-generate", save_path)
+
+    async def generate_variation(self, image_name, n=1, size="medium", response_format="url", save_path=None):
+        """
+        Generate a variation of the given image and save it to the specified location.
+
+        Returns:
+            list: A list of file paths where the generated image variations are saved.
+        """
+        image_path = image_name if os.path.isabs(image_name) else os.path.join(os.getcwd(), image_name)
+        try:
+            with open(image_path, "rb") as image_file:
+                image_bytes = self.preprocessor.prepare(image_file.read(), self.image_sizes[size])
+            form = aiohttp.FormData()
+            form.add_field("n", str(n))
+            form.add_field("size", self.image_sizes[size])
+            form.add_field("response_format", response_format)
+            form.add_field("image", image_bytes, filename=os.path.splitext(os.path.basename(image_path))[0] + ".png",
+                           content_type="image/png")
+            result = await self.transport.request_json("POST", self.endpoint_variation, headers=self.headers, data=form)
+        except (OSError, ValueError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error generating image variation: {e}")
+            return []
+
+        return await self._save_all(result.get("data", []), "gpt-variation", save_path)
+
+    async def _save_all(self, images, prefix, save_path):
+        """
+        Download every returned image concurrently, keeping the original order.
+
+        Returns:
+            list: A list of file paths where the images are saved.
+        """
+        timestamp = datetime.now().strftime("%Y:%m-%d-%H:%M:%S")
+        if not save_path:
+            save_path = os.getcwd()
+
+        downloads = [
+            self.save_image(image_url, os.path.join(save_path, f"{prefix}-{i}-{timestamp}.png"))
+            for i, image_url in enumerate(images)
+        ]
+        return list(await asyncio.gather(*downloads))
+
+    async def save_image(self, url, file_path):
+        """
+        Save the image from the provided URL to the specified file path.
+
+        Returns:
+            str: The file path where the image is saved.
+        """
+        try:
+            if "b64_json" in url:
+                self._write_b64(url["b64_json"], file_path)
+            else:
+                await self.transport.download(url["url"], file_path)
+            print(f"\nSaved image to {file_path}")
+            return file_path
+        except (OSError, ValueError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"An error occurred while saving the image: {e}")
+
+
+    @staticmethod
+    def _write_b64(encoded, file_path, chunk_size=64 * 1024):
+        """
+        Decode a base64 image to a file in chunks, so the decoded image is never held in full.
+        Line breaks within the value are ignored, as by the streaming decoder of ImageHandler.
+
+        Raises:
+            ValueError: If the value is not base64, or is truncated.
+        """
+        if not isinstance(encoded, str):
+            raise ValueError("Malformed b64_json value in the API response")
+        if "\n" in encoded or "\r" in encoded:
+            encoded = "".join(encoded.split())
+        if len(encoded) % 4:
+            raise ValueError("Truncated b64_json value in the API response")
+        try:
+            with open(f"{file_path}.part", "wb") as image_file:
+                for position in range(0, len(encoded), chunk_size):
+                    image_file.write(base64.b64decode(encoded[position:position + chunk_size], validate=True))
+            os.replace(f"{file_path}.part", file_path)
+        except (OSError, ValueError):
+            try:
+                os.remove(f"{file_path}.part")
+            except OSError:
+                pass
+            raise
+
+
+class AsyncGPTClient:
+    """
+    An asyncio GPT client mirroring GPTClient, for running many requests from one event loop.
+
+    Unlike GPTClient, no chat history is kept, so a single client can serve many concurrent prompts.
+
+    Attributes:
+        api_key (str): The OpenAI API key.
+        model (str): The name of the GPT model to use.
+        max_tokens (int): The maximum number of tokens for completions.
+        temperature (float): The temperature for completions.
+        transport (AsyncTransport): The asyncio transport shared with the AsyncImageHandler.
+        singleflight (SingleFlight): Coalesces identical completion requests in flight.
+    """
+    def __init__(self, api_key, model="gpt-3.5-turbo", max_tokens=100, temperature=0.7, transport=None, max_in_flight=20,
+                 api_base="https://api.openai.com/v1"):
+        """
+        Initialize the AsyncGPTClient with the given API key and model.
+        """
+        self.api_key = api_key
+        self.api_base = api_base.rstrip("/")
+        self.endpoint_completions = f"{self.api_base}/chat/completions"
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"}
+        self.transport = transport if transport is not None else AsyncTransport(max_in_flight=max_in_flight)
+        self.image_handler = AsyncImageHandler(self.api_key, transport=self.transport, api_base=self.api_base)
+        self.singleflight = SingleFlight()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def completion(self, prompt, n=1, top_p=1, frequency_penalty=0, presence_penalty=0, stop=None):
+        """
+        Generate a completion for the given prompt using the GPT model. Identical requests made
+        while one is in flight, from other tasks or threads, share its answer.
+
+        Returns:
+            list: A list containing the completion text.
+        """
+        payload = self._build_payload(prompt, n, top_p, frequency_penalty, presence_penalty, stop)
+        return await self.singleflight.do_async(make_key(self.endpoint_completions, payload),
+                                                lambda: self._request_completion(payload))
+
+    async def _request_completion(self, payload):
+        """
+        Send a completion request.
+
+        Returns:
+            list: A list containing the completion text, or an empty list if the request failed.
+        """
+        try:
+            result = await self.transport.request_json("POST", self.endpoint_completions, headers=self.headers, json=payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error making request to GPT API: {e}")
+            return []
+
+        try:
+            return [choice['message']['content'] for choice in result['choices']]
+        except Exception as e:
+            print(f"Error processing GPT API response: {e}")
+            return []
+
+    async def stream_completion(self, prompt, n=1, top_p=1, frequency_penalty=0, presence_penalty=0, stop=None):
+        """
+        Generate a completion for the given prompt and yield the text deltas as they arrive.
+
+        Yields:
+            tuple: The choice index and the text delta for that choice.
+        """
+        payload = self._build_payload(prompt, n, top_p, frequency_penalty, presence_penalty, stop)
+        payload["stream"] = True
+        try:
+            async for event in self.transport.iter_sse_data(self.endpoint_completions, headers=self.headers, json=payload):
+                for choice in event.get("choices", []):
+                    delta = choice.get("delta", {}).get("content")
+                    if delta:
+                        yield choice.get("index", 0), delta
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"Error processing GPT API stream: {e}")
+
+    def _build_payload(self, prompt, n, top_p, frequency_penalty, presence_penalty, stop):
+        """
+        Build the request payload for a single-prompt completion.
+
+        Returns:
+            dict: The completion request payload.
+        """
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": top_p,
+            "frequency_penalty": frequency_penalty,
+            "presence_penalty": presence_penalty,
+            "n": n,
+            "stop": stop
+        }
+
+    async def generate_image(self, prompt, size="medium", n=1, response_format="url", save_path=None):
+        """
+        Generate an image based on the prompt.
+
+        Returns:
+            list: A list of file paths where the generated images are saved.
+        """
+        return await self.image_handler.generate_image(prompt, n=n, response_format=response_format, size=size, save_path=save_path)
+
+    async def generate_variation(self, image_name, n=1, size="medium", response_format="url", save_path=None):
+        """
+        Generate a variation of the given image.
+
+        Returns:
+            list: A list of file paths where the generated image variations are saved.
+        """
+        return await self.image_handler.generate_variation(image_name, n=n, size=size, response_format=response_format, save_path=save_path)
+
+    async def close(self):
+        """
+        Close the shared transport.
+        """
+        await self.transport.close()
+
+
+if __name__ == "__main__":
+    async def _demo():
+        async with AsyncGPTClient(api_key="API_KEY", max_in_flight=8) as client:
+            prompts = [f"What is {i} + {i}?" for i in range(4)]
+            answers = await asyncio.gather(*(client.completion(prompt) for prompt in prompts))
+            print(answers)
+
+    try:
+        asyncio.run(_demo())
+    except Exception as e:
+        print(f"Error initializing AsyncGPTClient or making completion request: {e}")
@@ -0,0 +1,225 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from .deadline import DeadlineExecutor
+from .gpt_client import GPTClient
+
+
+class BatchRunner:
+    """
+    Run a JSONL file of prompts concurrently through a GPTClient, writing each result as it finishes.
+
+    Every input line is a JSON object with a "prompt" (or a list of chat "messages") and optional
+    "id", "model", "temperature", "max_tokens" and "n" keys. Finished line numbers are appended to a
+    checkpoint file, so an interrupted run resumes without redoing them. The output file is the
+    source of truth: lines it already holds are skipped on resume even if their checkpoint entry
+    was lost.
+
+    Attributes:
+        client (GPTClient): The GPTClient used to send the completions.
+        concurrency (int): The maximum number of requests in flight.
+        report_interval (float): The number of seconds between throughput reports.
+    """
+    def __init__(self, client, concurrency=8, report_interval=5.0):
+        """
+        Initialize the BatchRunner with a GPTClient and a concurrency limit.
+        """
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.report_interval = report_interval
+
+    def run(self, input_path, output_path, checkpoint_path=None, resume=True):
+        """
+        Process every unfinished line of the input file and append the results to the output file.
+
+        Args:
+            input_path (str): The path of the JSONL file with the prompts.
+            output_path (str): The path of the JSONL file the results are appended to.
+            checkpoint_path (str, optional): The path of the checkpoint file. Defaults to the output path with
+                a ".checkpoint" suffix.
+            resume (bool, optional): Whether to skip the lines recorded in the checkpoint. Defaults to True.
+
+        Returns:
+            dict: The number of completed, failed and skipped lines, the elapsed time and the throughput.
+        """
+        if checkpoint_path is None:
+            checkpoint_path = output_path + ".checkpoint"
+
+        done = self._load_checkpoint(checkpoint_path) | self._load_output(output_path) if resume else set()
+        if not resume:
+            open(output_path, "w").close()
+            open(checkpoint_path, "w").close()
+
+        stats = {"completed": 0, "failed": 0, "skipped": 0}
+        start = last_report = time.monotonic()
+        pending = set()
+
+        with open(input_path, "r", encoding="utf-8") as input_file, \
+                open(output_path, "a", encoding="utf-8") as output_file, \
+                open(checkpoint_path, "a", encoding="utf-8") as checkpoint_file, \
+                DeadlineExecutor(max_workers=self.concurrency) as executor:
+            for line_number, line in enumerate(input_file, start=1):
+                if not line.strip():
+                    continue
+                if line_number in done:
+                    stats["skipped"] += 1
+                    continue
+
+                if len(pending) >= self.concurrency * 2:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._write_results(finished, output_file, checkpoint_file, stats)
+
+                pending.add(executor.submit(self._process_line, line_number, line))
+
+                if time.monotonic() - last_report >= self.report_interval:
+                    self._report(stats, start)
+                    last_report = time.monotonic()
+
+            while pending:
+                finished, pending = wait(pending, timeout=self.report_interval, return_when=FIRST_COMPLETED)
+                self._write_results(finished, output_file, checkpoint_file, stats)
+                if time.monotonic() - last_report >= self.report_interval:
+                    self._report(stats, start)
+                    last_report = time.monotonic()
+
+        self._report(stats, start)
+
+        elapsed = time.monotonic() - start
+        stats["elapsed"] = elapsed
+        stats["throughput"] = stats["completed"] / elapsed if elapsed else 0.0
+        return stats
+
+    def _process_line(self, line_number, line):
+        """
+        Send the completion request for a single input line.
+
+        Returns:
+            dict: The result record for the line, with an "error" key if it failed.
+        """
+        try:
+            item = json.loads(line)
+            messages = item.get("messages") or [{"role": "user", "content": item["prompt"]}]
+            self._validate(item, messages)
+        except (ValueError, KeyError, AttributeError, TypeError) as e:
+            return {"line": line_number, "error": f"Invalid input line: {e}"}
+
+        try:
+            choices = self.client.create_completion(
+                messages,
+                n=item.get("n", 1),
+                model=item.get("model"),
+                max_tokens=item.get("max_tokens"),
+                temperature=item.get("temperature"),
+            )
+        except Exception as e:
+            return {"line": line_number, "id": item.get("id"), "error": f"Request failed: {e}"}
+
+        record = {"line": line_number, "id": item.get("id"), "model": item.get("model") or self.client.get_model()}
+        if not choices:
+            record["error"] = "No completion returned"
+        else:
+            record["choices"] = choices
+        return record
+
+    @staticmethod
+    def _validate(item, messages):
+        """
+        Check the types of the request fields of an input line.
+
+        Raises:
+            TypeError: If a field has the wrong type.
+            ValueError: If n is not a positive integer.
+        """
+        if not isinstance(messages, list) or not all(
+                isinstance(message, dict) and isinstance(message.get("content"), str) for message in messages):
+            raise TypeError('"prompt" must be a string and "messages" a list of messages with string content')
+        n = item.get("n", 1)
+        if not isinstance(n, int) or isinstance(n, bool):
+            raise TypeError('"n" must be an integer')
+        if n < 1:
+            raise ValueError('"n" must be at least 1')
+        max_tokens = item.get("max_tokens")
+        if max_tokens is not None and (not isinstance(max_tokens, int) or isinstance(max_tokens, bool)):
+            raise TypeError('"max_tokens" must be an integer')
+        temperature = item.get("temperature")
+        if temperature is not None and (not isinstance(temperature, (int, float)) or isinstance(temperature, bool)):
+            raise TypeError('"temperature" must be a number')
+        if item.get("model") is not None and not isinstance(item["model"], str):
+            raise TypeError('"model" must be a string')
+
+    @staticmethod
+    def _write_results(finished, output_file, checkpoint_file, stats):
+        """
+        Write the finished results and record their line numbers in the checkpoint.
+        Failed lines are reported but not checkpointed, so a resumed run retries them.
+        """
+        for future in finished:
+            record = future.result()
+            if "error" in record:
+                stats["failed"] += 1
+                sys.stderr.write(f"\nLine {record['line']} failed: {record['error']}\n")
+                continue
+            output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output_file.flush()
+            checkpoint_file.write(f"{record['line']}\n")
+            checkpoint_file.flush()
+            stats["completed"] += 1
+
+    @staticmethod
+    def _load_checkpoint(checkpoint_path):
+        """
+        Read the line numbers recorded as finished by a previous run.
+
+        Returns:
+            set: The finished line numbers.
+        """
+        if not os.path.exists(checkpoint_path):
+            return set()
+        with open(checkpoint_path, "r", encoding="utf-8") as checkpoint_file:
+            return {int(line) for line in checkpoint_file if line.strip().isdigit()}
+
+    @staticmethod
+    def _load_output(output_path):
+        """
+        Read the line numbers already written to the output file by a previous run. A last line
+        cut short by a crash is removed, so the results appended after it stay one per line.
+
+        Returns:
+            set: The line numbers with a result in the output file.
+        """
+        if not os.path.exists(output_path):
+            return set()
+        done = set()
+        end = 0
+        with open(output_path, "r+b") as output_file:
+            for line in output_file:
+                if not line.endswith(b"\n"):
+                    output_file.truncate(end)
+                    break
+                end += len(line)
+                try:
+                    done.add(json.loads(line)["line"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+        return done
+
+    @staticmethod
+    def _report(stats, start):
+        """
+        Write the current progress and throughput to stderr.
+        """
+        elapsed = time.monotonic() - start
+        rate = stats["completed"] / elapsed if elapsed else 0.0
+        sys.stderr.write(f"\rCompleted: {stats['completed']}, failed: {stats['failed']}, "
+                         f"skipped: {stats['skipped']}, {rate:.1f} req/s ")
+        sys.stderr.flush()
+
+
+if __name__ == "__main__":
+    try:
+        runner = BatchRunner(GPTClient(api_key="API_KEY"), concurrency=4)
+        print(runner.run("prompts.jsonl", "results.jsonl"))
+    except Exception as e:
+        print(f"Error initializing BatchRunner or processing batch: {e}")
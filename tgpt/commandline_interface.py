@@ -1,8 +1,101 @@
+import contextlib
+import json
+import os
 import sys
 import textwrap
 import threading
 import time
-from .gpt_client import GPTClient
+from datetime import datetime
+
+
+class StreamWrapper:
+    """
+    Write streamed text to stdout as it arrives, wrapping words at a fixed width.
+    
+    Attributes:
+        width (int): The maximum width for text wrapping.
+        column (int): The current output column.
+    """
+    def __init__(self, width):
+        """
+        Initialize the StreamWrapper with the given wrapping width.
+        """
+        self.width = width
+        self.column = 0
+        self._word = []
+        self._pending_space = False
+
+    def write(self, text):
+        """
+        Write a chunk of streamed text, holding back the last partial word until it is complete.
+        """
+        for char in text:
+            if char == "\n":
+                self._flush_word()
+                sys.stdout.write("\n")
+                self.column = 0
+                self._pending_space = False
+            elif char.isspace():
+                self._flush_word()
+                self._pending_space = self.column > 0
+            else:
+                self._word.append(char)
+        sys.stdout.flush()
+
+    def close(self):
+        """
+        Write out any buffered partial word.
+        """
+        self._flush_word()
+        sys.stdout.flush()
+
+    def _flush_word(self):
+        """
+        Write the buffered word, breaking the line first if it does not fit.
+        """
+        if not self._word:
+            return
+        word = "".join(self._word)
+        self._word = []
+        if self.column > 0 and self.column + len(word) + self._pending_space > self.width:
+            sys.stdout.write("\n")
+            self.column = 0
+        elif self._pending_space:
+            sys.stdout.write(" ")
+            self.column += 1
+        self._pending_space = False
+        sys.stdout.write(word)
+        self.column += len(word)
+
+
+class StderrCapture:
+    """
+    Pass text written to stdout through to stderr, remembering the last line written, so the error
+    a client printed can be reported in a JSON record.
+    
+    Attributes:
+        last_line (str): The last non-empty line written, or None.
+    """
+    def __init__(self):
+        """
+        Initialize the StderrCapture with no output seen.
+        """
+        self.last_line = None
+
+    def write(self, text):
+        """
+        Write text to stderr and remember its last non-empty line.
+        """
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if lines:
+            self.last_line = lines[-1]
+        return sys.stderr.write(text)
+
+    def flush(self):
+        """
+        Flush stderr.
+        """
+        sys.stderr.flush()
 
 
 class CommandLineInterface:
@@ -13,28 +106,58 @@ class CommandLineInterface:
         client (GPTClient): The GPTClient instance for making API calls.
         width (int): The maximum width for text wrapping.
         spinner_active (bool): Flag to control the spinner during API calls.
+        stream (bool): Whether chat mode streams answers as they are generated.
+        session_store (SessionStore): Where chat sessions are persisted, or None to keep them in memory only.
+        search_index (SearchIndex): Where answers and generated images are indexed for search, or None.
+        json_output (bool): Whether results are written as NDJSON, one object per line, instead of formatted text.
+            Failures are written as records of type "error".
+        batch_deadline (float): The number of seconds a file input or embedding run may take, or 0 for no deadline.
     """
-    def __init__(self, client):
+    def __init__(self, client, session_store=None, search_index=None, json_output=False, retriever=None,
+                 make_retriever=None):
         """
         Initialize the CommandLineInterface with a GPTClient instance.
         
         Args:
             client (GPTClient): The GPTClient instance for making API calls.
+            session_store (SessionStore, optional): Where chat sessions are persisted. Defaults to None.
+            search_index (SearchIndex, optional): Where answers and images are indexed. Defaults to None.
+            json_output (bool, optional): Whether to write results as NDJSON. Defaults to False.
+            retriever (Retriever, optional): Injects indexed documents into chat prompts when turned on. Defaults to None.
+            make_retriever (callable, optional): Builds the retriever the first time /retrieve turns retrieval on,
+                returning None if there is no embedding index. Defaults to None.
         """
         self.client = client
+        self.retriever = retriever
+        self.make_retriever = make_retriever
+        self.session_store = session_store
+        self.search_index = search_index
+        self.json_output = json_output
+        self._output = sys.stdout
         self.width = 80
         self.spinner_active = False
+        self.stream = True
+        self.batch_deadline = 0
 
     def run(self):
         """
         Start the main loop of the command line interface.
         """
+        self.client.warm_up()
+        if self.session_store is not None and self.client.session is None:
+            self.client.start_session(self.session_store.open())
         print(f"Welcome to TGPT! You are talking to model: {self.client.get_model()}")
         print("Type '/exit or /quit' to end the session, /help for more commands.")
+        if self.client.session is not None:
+            print(f"Session: {self.client.session.name}")
 
         while True:
             try:
                 user_input = input("\nYou: ")
+            except (EOFError, KeyboardInterrupt):
+                print("")
+                break
+            try:
                 if user_input.strip() == "":
                     continue
                 if user_input.startswith("/"):
@@ -43,8 +166,22 @@ class CommandLineInterface:
                     args = command_parts[1:]
                     if not self.handle_command(command, args):
                         break
+                elif self.stream:
+                    sys.stdout.write("\nGPT: ")
+                    writer = StreamWrapper(self.width)
+                    parts = []
+                    with self._command():
+                        for index, delta in self.client.completion(user_input, stream=True):
+                            writer.write(delta)
+                            parts.append(delta)
+                    writer.close()
+                    print("")
+                    if parts:
+                        self._index("text", user_input, ["".join(parts)])
                 else:
-                    response = self.client.completion(user_input)
+                    with self._command():
+                        response = self.client.completion(user_input)
+                    self._index("text", user_input, response)
                     wrapped_lines = []
                     lines = response[0].split("\n")
                     for line in lines:
@@ -53,37 +190,39 @@ class CommandLineInterface:
 
                     wrapped_completion = "\n".join(wrapped_lines)
                     print(f"\nGPT: {wrapped_completion}") 
+            except KeyboardInterrupt:
+                print("\nCancelled")
             except Exception as e:
                 print(f"An error occurred: {e}")
 
-    def handle_completion(self, prompt, n=1):
+    def handle_completion(self, prompt, n=1, stream=False):
         """
         Handle completion requests to the GPTClient.
         
         Args:
             prompt (str): The prompt to send to the GPTClient.
             n (int, optional): The number of responses to request. Defaults to 1.
+            stream (bool, optional): Whether to print the answer as it is generated. Defaults to False.
         
         Returns:
             bool: True if a response is received, False otherwise.
         """
         if not prompt:
             return ""
+        if self.json_output:
+            return self._handle_completion_json(prompt, n, stream)
 
         sys.stdout.write("Sending query... ")
         sys.stdout.flush()
 
-        self.spinner_active = True
-        spinner_thread = threading.Thread(target=self.spin_cursor)
-        spinner_thread.start()
-
-        response = self.client.completion(prompt, n=n, stop=None)
-
-        self.spinner_active = False
-        spinner_thread.join()
+        with self._spinner() as stop_spinner, self._command():
+            if stream:
+                return self._handle_stream(prompt, self.client.completion(prompt, n=n, stop=None, stream=True), n, stop_spinner)
+            response = self.client.completion(prompt, n=n, stop=None)
 
         if not isinstance(response, list):
             response = [response]
+        self._index("text", prompt, response)
 
         for i, completion in enumerate(response):
             wrapped_lines = []
@@ -105,6 +244,300 @@ class CommandLineInterface:
         print("")
         return True
 
+    def _handle_stream(self, prompt, chunks, n, stop_spinner):
+        """
+        Print a streamed completion, stopping the spinner at the first token.
+        
+        The first answer is printed as it arrives. With n > 1 the remaining answers are
+        buffered and printed once the stream has finished.
+        
+        Returns:
+            bool: True if a response is received, False otherwise.
+        """
+        writer = StreamWrapper(self.width)
+        answers = {}
+        received = False
+        try:
+            for index, delta in chunks:
+                if not received:
+                    received = True
+                    stop_spinner()
+                    print("\n\nAnswer 1:\n" if n > 1 else "\n")
+                if index == 0:
+                    writer.write(delta)
+                answers.setdefault(index, []).append(delta)
+        finally:
+            stop_spinner()
+        writer.close()
+
+        for index in sorted(answers):
+            if index == 0:
+                continue
+            wrapped_lines = [textwrap.fill(line, width=self.width) for line in "".join(answers[index]).split("\n")]
+            print(f"\n\nAnswer {index + 1}:")
+            print("\n" + "\n".join(wrapped_lines))
+
+        print("")
+        self._index("text", prompt, ["".join(answers[index]) for index in sorted(answers)])
+        return received
+
+    def handle_input(self, path, instruction=None, concurrency=4):
+        """
+        Apply an instruction to a file or stdin of any size, split into chunks that are processed
+        concurrently and combined into one answer. Progress is written to stderr, and each chunk's
+        result is printed as it finishes.
+        
+        Args:
+            path (str): The input file, or "-" for stdin.
+            instruction (str, optional): What to do with the input. Without one, small input is sent as the prompt.
+            concurrency (int, optional): The maximum number of requests in flight. Defaults to 4.
+        
+        Returns:
+            bool: True if an answer is received, False otherwise.
+        """
+        from .map_reduce import MapReduce, open_input
+
+        def on_partial(index, text):
+            if self.json_output:
+                self.emit({"type": "partial", "index": index, "text": text})
+            else:
+                wrapped_lines = [textwrap.fill(line, width=self.width) for line in text.split("\n")]
+                print(f"\n\nPart {index + 1}:\n\n" + "\n".join(wrapped_lines))
+
+        def on_progress(done, read):
+            sys.stderr.write(f"\rChunks done: {done} of {read} read ")
+            sys.stderr.flush()
+
+        try:
+            runner = MapReduce(self.client, concurrency=concurrency)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return False
+        with open_input(path) as source, self._command(self.batch_deadline), \
+                contextlib.redirect_stdout(sys.stderr) if self.json_output else contextlib.nullcontext():
+            result = runner.run(source, instruction, on_partial=on_partial, on_progress=on_progress)
+            if result["answer"] is not None:
+                self._index("text", instruction or result["answer"][:200], [result["answer"]])
+        if result["chunks"] > 1:
+            sys.stderr.write(f"\nProcessed {result['chunks']} chunks ({result['failed']} failed) with "
+                             f"{result['requests']} requests in {result['elapsed']:.1f}s\n")
+
+        if result["answer"] is None:
+            print("No answer received", file=sys.stderr)
+            if self.json_output:
+                self.emit_error("No answer received", kind="completion", prompt=instruction)
+            return False
+        if self.json_output:
+            self.emit({"type": "completion", "index": 0, "prompt": instruction, "text": result["answer"],
+                       "model": self.client.get_model(), "chunks": result["chunks"], "failed": result["failed"],
+                       "requests": result["requests"], "latency_ms": round(result["elapsed"] * 1000, 1)})
+        else:
+            wrapped_lines = [textwrap.fill(line, width=self.width) for line in result["answer"].split("\n")]
+            print("\n\nAnswer:\n\n" + "\n".join(wrapped_lines) + "\n")
+        return True
+
+    def embed(self, index, paths, concurrency=4, batch_size=256):
+        """
+        Embed files, directories or stdin into an embedding index, writing progress to stderr.
+        
+        Args:
+            index (VectorIndex): The index the vectors are appended to.
+            paths (list): Files, directories or "-" for stdin.
+            concurrency (int, optional): The maximum number of requests in flight. Defaults to 4.
+            batch_size (int, optional): The maximum number of chunks per request. Defaults to 256.
+        
+        Returns:
+            dict: The indexing statistics.
+        """
+        from .vector_index import EmbeddingIndexer
+
+        def on_progress(done, read):
+            sys.stderr.write(f"\rChunks embedded: {done} of {read} read ")
+            sys.stderr.flush()
+
+        indexer = EmbeddingIndexer(self.client, index, concurrency=concurrency, batch_size=batch_size)
+        with self._command(self.batch_deadline):
+            stats = indexer.run(paths, on_progress=on_progress)
+        print(f"\nIndexed {stats['sources']} sources, {stats['embedded']} chunks with {stats['requests']} requests "
+              f"({stats['failed']} failed, {stats['skipped']} unchanged or binary) in {stats['elapsed']:.1f}s, "
+              f"{index.count} chunks in the index")
+        return stats
+
+    def search_embeddings(self, index, query, k=5):
+        """
+        Print the indexed chunks most similar to a query.
+        
+        Returns:
+            list: The matches, best first.
+        """
+        from .vector_index import Retriever
+        matches = Retriever(self.client, index, k=k).search(query)
+        if not matches:
+            print(f"No results for: {query}")
+        for i, match in enumerate(matches, 1):
+            print(f"\n{i}. {match['score']:.3f}  {match['source']} (chunk {match['chunk'] + 1})")
+            print(textwrap.fill(" ".join(match["text"].split())[:400], width=self.width, initial_indent="   ",
+                                subsequent_indent="   "))
+        return matches
+
+    def _handle_completion_json(self, prompt, n, stream):
+        """
+        Send a completion without the spinner or wrapping and write one JSON object per answer,
+        or an error record if no answer is received. Anything the client prints goes to stderr,
+        so stdout only carries the JSON lines.
+        
+        Returns:
+            bool: True if a response is received, False otherwise.
+        """
+        start = time.perf_counter()
+        first_token = None
+        capture = StderrCapture()
+        try:
+            with contextlib.redirect_stdout(capture), self._command():
+                if stream:
+                    answers = {}
+                    for index, delta in self.client.completion(prompt, n=n, stop=None, stream=True):
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        answers.setdefault(index, []).append(delta)
+                    response = ["".join(answers[index]) for index in sorted(answers)]
+                else:
+                    response = self.client.completion(prompt, n=n, stop=None)
+                latency = time.perf_counter() - start
+                if not isinstance(response, list):
+                    response = [response]
+                self._index("text", prompt, response)
+        except Exception as e:
+            self.emit_error(e, kind="completion", prompt=prompt)
+            return False
+        if not response:
+            self.emit_error(capture.last_line or "No response received", kind="completion", prompt=prompt)
+            return False
+
+        for i, text in enumerate(response):
+            record = {"type": "completion", "index": i, "prompt": prompt, "text": text, "model": self.client.get_model(),
+                      "usage": getattr(self.client, "last_usage", None), "latency_ms": round(latency * 1000, 1)}
+            if first_token is not None:
+                record["ttft_ms"] = round(first_token * 1000, 1)
+            self.emit(record)
+        return bool(response)
+
+    def emit(self, record):
+        """
+        Write a result as a single JSON line and flush it, so consumers see it immediately.
+        """
+        self._output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._output.flush()
+
+    def emit_error(self, error, **fields):
+        """
+        Write a failure as a JSON line of type "error".
+        
+        Args:
+            error (Exception or str): What went wrong.
+            **fields: Identify what failed, for example its kind, prompt and index.
+        """
+        self.emit({"type": "error", **fields, "error": str(error)})
+
+    def emit_images(self, kind, source, paths, latency=None, size=None):
+        """
+        Write one JSON line per saved image, and an error record for each image that failed.
+        
+        Args:
+            kind (str): "image" or "variation".
+            source (str): The prompt, or the source image path of a variation.
+            paths (list): The saved image paths, with None for failed images.
+            latency (float, optional): The seconds taken to produce the images.
+            size (str, optional): The requested image size.
+        """
+        source_key = "prompt" if kind == "image" else "source"
+        for i, path in enumerate(paths):
+            if not path:
+                self.emit_error("The image could not be saved", kind=kind, index=i, **{source_key: source})
+                continue
+            record = {"type": kind, "index": i, source_key: source, "path": os.path.abspath(path), "size": size}
+            if latency is not None:
+                record["latency_ms"] = round(latency * 1000, 1)
+            self.emit(record)
+
+    def _generate_images_json(self, kind, source, size, generate):
+        """
+        Generate images without the spinner and write one JSON line per saved image, or an error
+        record if none are generated. Anything the client prints goes to stderr, so stdout only
+        carries the JSON lines.
+        
+        Returns:
+            list: The save paths of the generated images.
+        """
+        start = time.perf_counter()
+        capture = StderrCapture()
+        source_key = "prompt" if kind == "image" else "source"
+        try:
+            with contextlib.redirect_stdout(capture), self._command():
+                save_paths = generate()
+                latency = time.perf_counter() - start
+                self._index(kind, source, paths=[os.path.abspath(path) for path in save_paths or [] if path])
+        except Exception as e:
+            self.emit_error(e, kind=kind, **{source_key: source})
+            return []
+        if not save_paths:
+            self.emit_error(capture.last_line or "No images received", kind=kind, **{source_key: source})
+            return []
+        self.emit_images(kind, source, save_paths, latency=latency, size=size)
+        return save_paths
+
+    def _index(self, kind, prompt, answers=(), paths=None):
+        """
+        Add a completion or generated images to the search index, if there is one.
+        
+        Args:
+            kind (str): The kind of record: "text", "image" or "variation".
+            prompt (str): The prompt, or the source image of a variation.
+            answers (list, optional): The completion texts, indexed as one record each.
+            paths (list, optional): The saved image paths.
+        """
+        if self.search_index is None:
+            return
+        session = getattr(self.client, "session", None)
+        session_name = session.name if session is not None else None
+        try:
+            if kind == "text":
+                for answer in answers:
+                    self.search_index.add(kind, prompt, answer, model=self.client.get_model(), session=session_name)
+            elif paths:
+                self.search_index.add(kind, prompt, paths=paths, session=session_name)
+        except Exception as e:
+            print(f"Error updating the search index: {e}")
+
+    def search(self, query, limit=10, kind=None):
+        """
+        Print the indexed answers and images best matching the query.
+        
+        Args:
+            query (str): The words to search for.
+            limit (int, optional): The maximum number of results. Defaults to 10.
+            kind (str, optional): Only show records of this kind.
+        
+        Returns:
+            list: The search results.
+        """
+        if self.search_index is None:
+            print("Search is disabled, set SEARCH_INDEX in the config to enable it")
+            return []
+
+        results = self.search_index.search(query, limit=limit, kind=kind)
+        if not results:
+            print(f"No results for: {query}")
+        for i, result in enumerate(results, 1):
+            created = datetime.fromtimestamp(result["created"]).strftime("%Y-%m-%d %H:%M")
+            print(f"\n{i}. [{result['kind']}] {created}  {result['model'] or ''}")
+            print(textwrap.fill(f"Q: {result['prompt']}", width=self.width, subsequent_indent="   "))
+            if result["answer"]:
+                print(textwrap.fill(f"A: {' '.join(result['snippet'].split())}", width=self.width, subsequent_indent="   "))
+            for path in result["paths"]:
+                print(f"   {path}")
+        return results
+
 
     def handle_command(self, command, args=[]):
         """
@@ -146,11 +579,123 @@ class CommandLineInterface:
             self.set_width(width)
             print(f"New width set to {width} ")
             return True
+        elif command == "/system":
+            content = " ".join(args) if args else input("System message: ")
+            self.client.set_system_prompt(content)
+            print("System message pinned")
+            return True
+        elif command == "/context":
+            if len(args) > 0:
+                self.client.set_context_budget(int(args[0]), summarize=self.client.context.summarizer is not None)
+            context = self.client.context
+            print(f"History: {len(context.messages)} messages, ~{context.get_token_count()} tokens, "
+                  f"budget: {context.token_budget} tokens")
+            return True
+        elif command == "/tokens":
+            counts = self.client.count_tokens(" ".join(args))
+            kind = "" if counts["exact"] else "~"
+            context = f"{counts['context']}" if counts["context"] else "an unknown number of"
+            print(f"Next request: {kind}{counts['prompt']} of {context} context tokens "
+                  f"(history: {kind}{counts['history']} tokens)")
+            usage = self.client.last_usage
+            if usage:
+                print(f"Last response: {usage.get('prompt_tokens')} prompt + "
+                      f"{usage.get('completion_tokens')} completion = {usage.get('total_tokens')} tokens")
+            return True
+        elif command == "/stream":
+            self.stream = not self.stream
+            print(f"Streaming {'enabled' if self.stream else 'disabled'}")
+            return True
+        elif command == "/pool":
+            stats = self.client.get_connection_stats()
+            print(f"Connections opened: {stats['connections']}, requests sent: {stats['requests']}, "
+                  f"reused: {stats['reused']} ({stats['reuse_ratio']:.0%})")
+            for endpoint in self.client.get_endpoint_stats():
+                latency = f"{endpoint['latency_ms']:.0f} ms" if endpoint["latency_ms"] is not None else "unmeasured"
+                print(f"{endpoint['name']}: {endpoint['state']}, {latency}, error rate {endpoint['error_rate']:.0%}, "
+                      f"requests: {endpoint['requests']}")
+            return True
+        elif command == "/stats":
+            print(self.client.get_request_stats())
+            return True
+        elif command == "/search":
+            if not args:
+                print("Usage: /search WORDS")
+            else:
+                self.search(" ".join(args))
+            return True
+        elif command == "/retrieve":
+            if self.retriever is None and self.make_retriever is not None:
+                self.retriever = self.make_retriever()
+            if self.retriever is None:
+                print("No embedding index, build one with: tgpt embed PATH")
+            else:
+                self.client.retriever = None if self.client.retriever is not None else self.retriever
+                print(f"Retrieval is {'on' if self.client.retriever is not None else 'off'}")
+            return True
+        elif command in ("/save", "/load", "/sessions"):
+            if self.session_store is None:
+                print("Sessions are disabled, set SESSIONS = True in the config to enable them")
+                return True
+            try:
+                self._handle_session_command(command, args)
+            except (OSError, ValueError) as e:
+                print(f"Error accessing the session: {e}")
+            return True
         else:
             print("Invalid command, please use one of the following:")
             self._print_help()
             return True
 
+    def _handle_session_command(self, command, args):
+        """
+        Save, load or list the persisted chat sessions.
+        
+        Args:
+            command (str): One of /save, /load and /sessions.
+            args (list): The session name, if given.
+        """
+        current = self.client.session.name if self.client.session is not None else None
+        if command == "/sessions":
+            sessions = self.session_store.list_sessions()
+            if not sessions:
+                print("No saved sessions")
+            for session in sessions:
+                updated = datetime.fromtimestamp(session["updated"]).strftime("%Y-%m-%d %H:%M")
+                marker = "*" if session["name"] == current else " "
+                print(f"{marker} {session['name']:<30} {updated}  {session['size'] // 1024 + 1} KB")
+        elif command == "/save":
+            if not args:
+                print(f"Session is saved as {current}" if current else "Usage: /save NAME")
+                return
+            session = self.session_store.open(args[0])
+            if session.exists():
+                print(f"A session named {args[0]} already exists, use /load {args[0]} to continue it")
+                return
+            self.client.start_session(session)
+            print(f"Session saved as {session.name}")
+        elif command == "/load":
+            if not args:
+                print("Usage: /load NAME")
+                return
+            self.resume(args[0])
+
+    def resume(self, name=None):
+        """
+        Load a stored session, or the most recently updated one, into the chat history.
+        
+        Returns:
+            bool: True if the session was loaded, False otherwise.
+        """
+        name = name or self.session_store.latest()
+        session = self.session_store.open(name) if name else None
+        if session is None or not session.exists():
+            print(f"No session named {name}" if name else "No saved sessions to resume")
+            return False
+        loaded = self.client.load_session(session)
+        print(f"Loaded session {session.name}: {loaded} recent messages")
+        return True
+
     def generate_image(self, prompt, n=1, size="medium", response_format="url", save_path=None):
         """
         Generate an image using the GPTClient's image generation functionality.
@@ -165,24 +710,22 @@ class CommandLineInterface:
         Returns:
             list: A list of save paths of the generated images, or False if an error occurs.
         """
-        try:
-            sys.stdout.write("Generating image... ") 
-            sys.stdout.flush() 
+        if self.json_output:
+            return self._generate_images_json("image", prompt, size, lambda: self.client.generate_image(
+                prompt=prompt, n=n, size=size, response_format=response_format, save_path=save_path))
 
-            self.spinner_active = True
-            spinner_thread = threading.Thread(target=self.spin_cursor)
-            spinner_thread.start()
+        sys.stdout.write("Generating image... ") 
+        sys.stdout.flush() 
 
-            save_paths = self.client.generate_image(prompt=prompt, n=n, size=size, response_format=response_format, save_path=save_path)
+        try:
+            with self._spinner(), self._command():
+                save_paths = self.client.generate_image(prompt=prompt, n=n, size=size, response_format=response_format, save_path=save_path)
 
-            self.spinner_active = False
-            spinner_thread.join()
+            self._index("image", prompt, paths=[os.path.abspath(path) for path in save_paths if path])
 
             print("Image generated successfully.")  
 
         except Exception as e:
-            self.spinner_active = False
-            spinner_thread.join()
             print(f"\rError generating image: {e}")
             return False
         return save_paths
@@ -202,18 +745,18 @@ class CommandLineInterface:
         Returns:
             list: A list of save paths of the generated image variations, or False if an error occurs.
         """
-        try:
-            sys.stdout.write("Generating image variation... ") 
-            sys.stdout.flush()  
+        if self.json_output:
+            return self._generate_images_json("variation", os.path.abspath(image_name), size, lambda: self.client.generate_variation(
+                image_name, size=size, n=n, response_format=response_format, save_path=save_path))
 
-            self.spinner_active = True
-            spinner_thread = threading.Thread(target=self.spin_cursor)
-            spinner_thread.start()
+        sys.stdout.write("Generating image variation... ") 
+        sys.stdout.flush()  
 
-            save_paths = self.client.generate_variation(image_name, size=size, n=n, response_format=response_format, save_path=save_path)
+        try:
+            with self._spinner(), self._command():
+                save_paths = self.client.generate_variation(image_name, size=size, n=n, response_format=response_format, save_path=save_path)
 
-            self.spinner_active = False
-            spinner_thread.join()
+            self._index("variation", os.path.abspath(image_name), paths=[os.path.abspath(path) for path in save_paths if path])
             print("Image variation created successfully.")
         except Exception as e:
             print(f"Error generating image variation: {e}")
@@ -238,6 +781,43 @@ class CommandLineInterface:
             for cursor in '|/-\\':
                 yield cursor
 
+    @contextlib.contextmanager
+    def _spinner(self):
+        """
+        Show the spinning cursor while a request runs. The spinner thread is stopped and joined
+        however the request ends, including on errors and Ctrl-C.
+        
+        Yields:
+            callable: Stops the spinner before the request ends, for example at the first streamed token.
+        """
+        spinner_thread = threading.Thread(target=self.spin_cursor, daemon=True)
+
+        def stop_spinner():
+            self.spinner_active = False
+            spinner_thread.join()
+
+        self.spinner_active = True
+        spinner_thread.start()
+        try:
+            yield stop_spinner
+        finally:
+            stop_spinner()
+
+    def _command(self, seconds=None):
+        """
+        Run a command within a deadline, aborting its requests in flight if it is interrupted
+        with Ctrl-C. Clients without a transport, like the daemon client, run it as is.
+        
+        Args:
+            seconds (float, optional): The number of seconds the command may take. Defaults to the
+                deadline of the client's transport.
+        
+        Returns:
+            contextlib.AbstractContextManager: The context to run the command in.
+        """
+        transport = getattr(self.client, "transport", None)
+        return transport.command(seconds) if transport is not None else contextlib.nullcontext()
+
     def spin_cursor(self):
         """
         Display a spinning cursor animation while the spinner_active flag is True.
@@ -258,11 +838,23 @@ class CommandLineInterface:
         print("/temperature: set new temperature")
         print("/max-tokens: set new max tokens")
         print("/width: set new print width")
+        print("/system: pin a system message sent with every request")
+        print("/context: show the history size, or set a new token budget")
+        print("/tokens: show the token count of the next request and the last usage")
+        print("/stream: toggle streaming of answers")
+        print("/pool: show connection reuse and endpoint health statistics")
+        print("/stats: show request latency, size and token usage statistics")
+        print("/save: save the chat under a new session name")
+        print("/load: continue a saved session")
+        print("/sessions: list the saved sessions")
+        print("/search: search past answers and generated images")
+        print("/retrieve: toggle injecting relevant documents from the embedding index")
         print("/help: Show this help message")
 
 
 if __name__ == "__main__":
     try:
+        from .gpt_client import GPTClient
         client = GPTClient(api_key="API_KEY")
         cli = CommandLineInterface(client)
         cli.run()
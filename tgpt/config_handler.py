@@ -46,7 +46,41 @@ class ConfigHandler:
                 "TEMPERATURE": 0.7,
                 "WIDTH": 80,
                 "NUMBER": 1,
-                "IMAGE_SIZE": "medium"
+                "IMAGE_SIZE": "medium",
+                "POOL_SIZE": 10,
+                "BATCH_CONCURRENCY": 8,
+                "CACHE": False,
+                "CACHE_MAX_MB": 100,
+                "CACHE_TTL": 604800,
+                "DOWNLOAD_WORKERS": 4,
+                "CONTEXT_TOKENS": 3000,
+                "SUMMARIZE": False,
+                "TOKENIZER_FILE": "~/.tgpt/cl100k_base.tiktoken",
+                "RATE_LIMIT_RPM": 0,
+                "RATE_LIMIT_TPM": 0,
+                "MAX_RETRIES": 5,
+                "CONNECT_TIMEOUT": 10,
+                "READ_TIMEOUT": 60,
+                "DEADLINE": 300,
+                "BATCH_DEADLINE": 0,
+                "API_BASE": "https://api.openai.com/v1",
+                "DAEMON_SOCKET": "~/.tgpt/tgpt.sock",
+                "DAEMON_IDLE_TIMEOUT": 900,
+                "METRICS_LOG": "",
+                "METRICS_PROMETHEUS": "",
+                "SESSIONS": False,
+                "SEARCH_INDEX": "~/.tgpt/index.db",
+                "IMAGE_FIT": "crop",
+                "IMAGE_FORMAT": "url",
+                "HEDGE": False,
+                "HEDGE_PERCENTILE": 95,
+                "HEDGE_MAX_RATIO": 0.05,
+                "EMBEDDING_MODEL": "text-embedding-3-small",
+                "EMBEDDING_DIMENSIONS": 256,
+                "EMBEDDING_INDEX": "~/.tgpt/embeddings",
+                "EMBEDDING_BATCH": 256,
+                "RETRIEVAL": False,
+                "RETRIEVAL_TOP_K": 3
             }
 
             os.makedirs(os.path.dirname(self.config_file_path), exist_ok=True)
@@ -66,6 +100,15 @@ class ConfigHandler:
         """
         return self.config.get("DEFAULT", "API", fallback="")
 
+    def get_api_base(self):
+        """
+        Retrieve the base URL of the OpenAI-compatible API from the configuration file.
+        
+        Returns:
+            str: The API base URL.
+        """
+        return self.config.get("DEFAULT", "API_BASE", fallback="https://api.openai.com/v1")
+
     def get_model(self):
         """
         Retrieve the model name from the configuration file.
@@ -120,6 +163,308 @@ class ConfigHandler:
         """
         return self.config.get("DEFAULT", "IMAGE_SIZE", fallback="medium")
 
+    def get_pool_size(self):
+        """
+        Retrieve the HTTP connection pool size from the configuration file.
+        
+        Returns:
+            int: The maximum number of keep-alive connections per host.
+        """
+        return self.config.getint("DEFAULT", "POOL_SIZE", fallback=10)
+
+    def get_batch_concurrency(self):
+        """
+        Retrieve the number of concurrent requests for batch runs from the configuration file.
+        
+        Returns:
+            int: The batch concurrency limit.
+        """
+        return self.config.getint("DEFAULT", "BATCH_CONCURRENCY", fallback=8)
+
+    def get_cache_enabled(self):
+        """
+        Retrieve whether the on-disk response cache is enabled from the configuration file.
+        
+        Returns:
+            bool: True if completions are cached, False otherwise.
+        """
+        return self.config.getboolean("DEFAULT", "CACHE", fallback=False)
+
+    def get_cache_max_size(self):
+        """
+        Retrieve the size cap of the response cache from the configuration file.
+        
+        Returns:
+            int: The maximum cache size in bytes.
+        """
+        return self.config.getint("DEFAULT", "CACHE_MAX_MB", fallback=100) * 1024 * 1024
+
+    def get_cache_ttl(self):
+        """
+        Retrieve the time-to-live of cached responses from the configuration file.
+        
+        Returns:
+            int: The number of seconds a cached response stays valid, or 0 to never expire.
+        """
+        return self.config.getint("DEFAULT", "CACHE_TTL", fallback=604800)
+
+    def get_download_workers(self):
+        """
+        Retrieve the number of parallel image downloads from the configuration file.
+        
+        Returns:
+            int: The maximum number of images downloaded at once.
+        """
+        return self.config.getint("DEFAULT", "DOWNLOAD_WORKERS", fallback=4)
+
+    def get_context_tokens(self):
+        """
+        Retrieve the token budget for the chat history from the configuration file.
+        
+        Returns:
+            int: The maximum number of history tokens sent with a request.
+        """
+        return self.config.getint("DEFAULT", "CONTEXT_TOKENS", fallback=3000)
+
+    def get_summarize(self):
+        """
+        Retrieve whether older chat turns are summarized from the configuration file.
+        
+        Returns:
+            bool: True if dropped turns are folded into a rolling summary, False otherwise.
+        """
+        return self.config.getboolean("DEFAULT", "SUMMARIZE", fallback=False)
+
+    def get_tokenizer_file(self):
+        """
+        Retrieve the path of the tokenizer vocabulary file from the configuration file.
+        
+        Returns:
+            str: The path of the tiktoken vocabulary file.
+        """
+        return self.config.get("DEFAULT", "TOKENIZER_FILE", fallback="~/.tgpt/cl100k_base.tiktoken")
+
+    def get_rate_limits(self):
+        """
+        Retrieve the requests and tokens per minute limits from the configuration file.
+        A value of 0 means the limit is learned from the API response headers.
+        
+        Returns:
+            tuple: The requests per minute and tokens per minute limits.
+        """
+        return (self.config.getint("DEFAULT", "RATE_LIMIT_RPM", fallback=0),
+                self.config.getint("DEFAULT", "RATE_LIMIT_TPM", fallback=0))
+
+    def get_max_retries(self):
+        """
+        Retrieve the number of retries for failed API requests from the configuration file.
+        
+        Returns:
+            int: The maximum number of retries.
+        """
+        return self.config.getint("DEFAULT", "MAX_RETRIES", fallback=5)
+
+    def get_timeouts(self):
+        """
+        Retrieve the connect and read timeouts of every request from the configuration file.
+        
+        Returns:
+            tuple: The seconds allowed to connect and the seconds allowed between bytes received.
+        """
+        return (self.config.getfloat("DEFAULT", "CONNECT_TIMEOUT", fallback=10),
+                self.config.getfloat("DEFAULT", "READ_TIMEOUT", fallback=60))
+
+    def get_deadline(self):
+        """
+        Retrieve the overall deadline of a command, including its retries and downloads, from the configuration file.
+        
+        Returns:
+            float: The number of seconds a command may take, or 0 for no deadline.
+        """
+        return self.config.getfloat("DEFAULT", "DEADLINE", fallback=300)
+
+    def get_batch_deadline(self):
+        """
+        Retrieve the overall deadline of batch, bulk image, file input and embedding runs from the configuration file.
+        
+        Returns:
+            float: The number of seconds a run may take, or 0 for no deadline.
+        """
+        return self.config.getfloat("DEFAULT", "BATCH_DEADLINE", fallback=0)
+
+    def get_daemon_socket(self):
+        """
+        Retrieve the path of the daemon's Unix domain socket from the configuration file.
+        
+        Returns:
+            str: The socket path.
+        """
+        return self.config.get("DEFAULT", "DAEMON_SOCKET", fallback="~/.tgpt/tgpt.sock")
+
+    def get_daemon_idle_timeout(self):
+        """
+        Retrieve the number of idle seconds after which the daemon exits from the configuration file.
+        
+        Returns:
+            float: The idle timeout in seconds, or 0 to never exit.
+        """
+        return self.config.getfloat("DEFAULT", "DAEMON_IDLE_TIMEOUT", fallback=900)
+
+    def get_metrics_log(self):
+        """
+        Retrieve the path of the JSON-lines request metrics log from the configuration file.
+        
+        Returns:
+            str: The log path, or an empty string to disable the log.
+        """
+        return self.config.get("DEFAULT", "METRICS_LOG", fallback="")
+
+    def get_metrics_prometheus(self):
+        """
+        Retrieve the path of the Prometheus textfile for request metrics from the configuration file.
+        
+        Returns:
+            str: The .prom file path, or an empty string to disable it.
+        """
+        return self.config.get("DEFAULT", "METRICS_PROMETHEUS", fallback="")
+
+    def get_sessions_enabled(self):
+        """
+        Retrieve whether chat sessions are persisted under ~/.tgpt/sessions from the configuration file.
+        
+        Returns:
+            bool: True if chat sessions are saved, False otherwise.
+        """
+        return self.config.getboolean("DEFAULT", "SESSIONS", fallback=False)
+
+    def get_search_index(self):
+        """
+        Retrieve the path of the search index database from the configuration file.
+        
+        Returns:
+            str: The database path, or an empty string to disable indexing and search.
+        """
+        return self.config.get("DEFAULT", "SEARCH_INDEX", fallback="~/.tgpt/index.db")
+
+    def get_image_fit(self):
+        """
+        Retrieve how non-square images are made square before a variation from the configuration file.
+        
+        Returns:
+            str: "crop" to crop to the center, or "pad" to pad with transparency.
+        """
+        return self.config.get("DEFAULT", "IMAGE_FIT", fallback="crop")
+
+    def get_image_format(self):
+        """
+        Retrieve how generated images are returned by the API from the configuration file.
+        
+        Returns:
+            str: "url" to download every image from its URL, or "b64_json" to receive the images inline.
+        """
+        return self.config.get("DEFAULT", "IMAGE_FORMAT", fallback="url")
+
+    def get_hedge_enabled(self):
+        """
+        Retrieve whether slow completion requests are hedged from the configuration file.
+        
+        Returns:
+            bool: True if a slow request is sent a second time and the first answer is used.
+        """
+        return self.config.getboolean("DEFAULT", "HEDGE", fallback=False)
+
+    def get_hedge_percentile(self):
+        """
+        Retrieve the latency percentile after which a request is hedged from the configuration file.
+        
+        Returns:
+            float: The percentile of recent latencies, from 0 to 100.
+        """
+        return self.config.getfloat("DEFAULT", "HEDGE_PERCENTILE", fallback=95)
+
+    def get_hedge_max_ratio(self):
+        """
+        Retrieve the largest fraction of requests that may be hedged from the configuration file.
+        
+        Returns:
+            float: The fraction of requests, for example 0.05 for at most one hedge per 20 requests.
+        """
+        return self.config.getfloat("DEFAULT", "HEDGE_MAX_RATIO", fallback=0.05)
+
+    def get_embedding_model(self):
+        """
+        Retrieve the model used for embeddings from the configuration file.
+        
+        Returns:
+            str: The embedding model name.
+        """
+        return self.config.get("DEFAULT", "EMBEDDING_MODEL", fallback="text-embedding-3-small")
+
+    def get_embedding_dimensions(self):
+        """
+        Retrieve the length of the embedding vectors of a new index from the configuration file.
+        
+        Returns:
+            int: The number of dimensions, or 0 for the model's full length.
+        """
+        return self.config.getint("DEFAULT", "EMBEDDING_DIMENSIONS", fallback=256)
+
+    def get_embedding_index(self):
+        """
+        Retrieve the directory of the embedding index from the configuration file.
+        
+        Returns:
+            str: The index directory.
+        """
+        return self.config.get("DEFAULT", "EMBEDDING_INDEX", fallback="~/.tgpt/embeddings")
+
+    def get_embedding_batch(self):
+        """
+        Retrieve the number of texts sent per embedding request from the configuration file.
+        
+        Returns:
+            int: The batch size.
+        """
+        return self.config.getint("DEFAULT", "EMBEDDING_BATCH", fallback=256)
+
+    def get_retrieval_enabled(self):
+        """
+        Retrieve whether chat mode injects relevant indexed documents into prompts from the configuration file.
+        
+        Returns:
+            bool: True if retrieval is on when chat mode starts.
+        """
+        return self.config.getboolean("DEFAULT", "RETRIEVAL", fallback=False)
+
+    def get_retrieval_top_k(self):
+        """
+        Retrieve the number of indexed chunks injected into a chat prompt from the configuration file.
+        
+        Returns:
+            int: The number of chunks.
+        """
+        return self.config.getint("DEFAULT", "RETRIEVAL_TOP_K", fallback=3)
+
+    def get_endpoints(self):
+        """
+        Retrieve the endpoint pool from the [endpoint:NAME] sections of the configuration file.
+        Each section has a URL, and optionally a KEY (Default: API) and a WEIGHT (Default: 1).
+        
+        Returns:
+            list: A dict per endpoint with its name, url, key and weight, in configuration order.
+        """
+        endpoints = []
+        for section in self.config.sections():
+            if not section.startswith("endpoint:") or not self.config.get(section, "URL", fallback=""):
+                continue
+            endpoints.append({
+                "name": section[len("endpoint:"):].strip(),
+                "url": self.config.get(section, "URL"),
+                "key": self.config.get(section, "KEY", fallback=self.get_api_key()),
+                "weight": self.config.getfloat(section, "WEIGHT", fallback=1.0),
+            })
+        return endpoints
+
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,145 @@
+def estimate_tokens(message):
+    """
+    Estimate the number of tokens a chat message uses, at roughly four characters per token.
+
+    Returns:
+        int: The estimated token count, including the per-message overhead.
+    """
+    return len(message.get("content") or "") // 4 + 4
+
+
+class ContextWindow:
+    """
+    The chat history of a session, sent to the API within a fixed token budget.
+
+    The full history is kept, but each request only carries the pinned system messages, an optional
+    rolling summary of older turns and as many of the newest turns as fit in the budget.
+
+    Attributes:
+        messages (list): The full chat history.
+        token_budget (int): The maximum number of tokens of history sent with a request.
+        summarizer (callable): An optional function that folds dropped turns into the rolling summary.
+        count_tokens (callable): The function counting the tokens of a single message.
+    """
+    def __init__(self, token_budget=3000, summarizer=None, count_tokens=estimate_tokens):
+        """
+        Initialize the ContextWindow with a token budget.
+
+        Args:
+            token_budget (int, optional): The maximum number of history tokens per request. Defaults to 3000.
+            summarizer (callable, optional): Called as summarizer(summary, messages) to return a new summary
+                covering the previous summary and the given messages. Defaults to None, which drops old turns.
+            count_tokens (callable, optional): Counts the tokens of a message. Defaults to estimate_tokens.
+        """
+        self.messages = []
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.count_tokens = count_tokens
+        self.pinned = []
+        self.summary = None
+        self._counts = []
+        self._summarized = 0
+
+    def add(self, role, content):
+        """
+        Append a message to the history.
+        """
+        message = {"role": role, "content": content}
+        self.messages.append(message)
+        self._counts.append(self.count_tokens(message))
+
+    def pin(self, content):
+        """
+        Add a system message that is sent with every request, regardless of the budget.
+        """
+        self.pinned.append({"role": "system", "content": content})
+
+    def clear(self, keep_pinned=True):
+        """
+        Remove the history and the rolling summary.
+        """
+        self.messages = []
+        self._counts = []
+        self.summary = None
+        self._summarized = 0
+        if not keep_pinned:
+            self.pinned = []
+
+    def build(self, prompt, summarize=True):
+        """
+        Build the messages for a request: the pinned messages, the rolling summary, the newest turns
+        that fit in the token budget and the new prompt. With summarize=False the rolling summary
+        is not updated, which avoids a summarization request.
+
+        Returns:
+            list: The messages to send.
+        """
+        prompt_message = {"role": "user", "content": prompt}
+        fixed = sum(self.count_tokens(message) for message in self.pinned) + self.count_tokens(prompt_message)
+
+        start = self._window_start(fixed)
+        if summarize and self.summarizer is not None and start > self._summarized:
+            self.summary = self.summarizer(self.summary, self.messages[self._summarized:start])
+            self._summarized = start
+            start = max(start, self._window_start(fixed))
+
+        messages = list(self.pinned)
+        summary_message = self._summary_message()
+        if summary_message is not None:
+            messages.append(summary_message)
+        messages.extend(self.messages[start:])
+        messages.append(prompt_message)
+        return messages
+
+    def get_token_count(self):
+        """
+        Retrieve the number of tokens of the full history.
+
+        Returns:
+            int: The token count of every stored message.
+        """
+        return sum(self._counts)
+
+    def _window_start(self, fixed):
+        """
+        Find the index of the oldest message that still fits in the budget after the fixed messages and summary.
+
+        Returns:
+            int: The index of the first history message to send.
+        """
+        summary_message = self._summary_message()
+        remaining = self.token_budget - fixed
+        if summary_message is not None:
+            remaining -= self.count_tokens(summary_message)
+
+        start = len(self.messages)
+        while start > 0 and self._counts[start - 1] <= remaining:
+            remaining -= self._counts[start - 1]
+            start -= 1
+
+        if start < len(self.messages) and self.messages[start]["role"] == "assistant":
+            start += 1
+        return start
+
+    def _summary_message(self):
+        """
+        Retrieve the rolling summary as a system message.
+
+        Returns:
+            dict: The summary message, or None if there is no summary.
+        """
+        if not self.summary:
+            return None
+        return {"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}
+
+
+if __name__ == "__main__":
+    try:
+        window = ContextWindow(token_budget=50)
+        window.pin("You are a helpful assistant.")
+        for i in range(10):
+            window.add("user", f"Question number {i}")
+            window.add("assistant", f"Answer number {i}")
+        print(window.build("And the next question?"))
+    except Exception as e:
+        print(f"Error initializing ContextWindow or building messages: {e}")
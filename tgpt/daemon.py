@@ -0,0 +1,375 @@
+import contextlib
+import json
+import os
+import select
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+
+DEFAULT_SOCKET_PATH = "~/.tgpt/tgpt.sock"
+# Seconds a front end waits for the daemon on top of the request's own deadline.
+DAEMON_GRACE = 5
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A threaded Unix socket server, serving each connection on its own thread.
+    """
+    daemon_threads = True
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Read newline-delimited JSON requests from a connection and write the responses back.
+    """
+    def handle(self):
+        daemon = self.server.tgpt_daemon
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            daemon.begin_request()
+            try:
+                request = json.loads(line)
+                with daemon.command(request, self.connection):
+                    for message in daemon.dispatch(request):
+                        self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+                        self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                self.wfile.write(json.dumps({"error": str(e)}).encode("utf-8") + b"\n")
+            finally:
+                daemon.end_request()
+
+
+class TGPTDaemon:
+    """
+    A long-lived daemon that keeps a warm GPTClient, its connection pool and caches, and serves
+    tx, gi and gv requests from tgpt front ends over a Unix domain socket.
+
+    Attributes:
+        client (GPTClient): The warm client used for every request.
+        socket_path (str): The path of the Unix domain socket.
+        idle_timeout (float): The number of idle seconds after which the daemon exits, or 0 to never exit.
+    """
+    def __init__(self, client, socket_path=DEFAULT_SOCKET_PATH, idle_timeout=900):
+        """
+        Initialize the TGPTDaemon with a client and socket path.
+        """
+        self.client = client
+        self.socket_path = os.path.expanduser(socket_path)
+        self.idle_timeout = idle_timeout
+        self._active = 0
+        self._last_activity = time.monotonic()
+        self._lock = threading.Lock()
+
+    def serve_forever(self):
+        """
+        Listen on the socket until the idle timeout expires, then remove the socket.
+        """
+        if is_daemon_running(self.socket_path):
+            raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+
+        server = _DaemonServer(self.socket_path, _RequestHandler)
+        server.tgpt_daemon = self
+        server.timeout = 1.0
+        os.chmod(self.socket_path, 0o600)
+        self.client.warm_up()
+        try:
+            while not self._idle_expired():
+                server.handle_request()
+        finally:
+            server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def begin_request(self):
+        """
+        Mark the start of a request, so the daemon does not idle out while it runs.
+        """
+        with self._lock:
+            self._active += 1
+            self._last_activity = time.monotonic()
+
+    def end_request(self):
+        """
+        Mark the end of a request.
+        """
+        with self._lock:
+            self._active -= 1
+            self._last_activity = time.monotonic()
+
+    @contextlib.contextmanager
+    def command(self, request, connection):
+        """
+        Run a request within its own deadline, which is cancelled if the front end disconnects
+        before the request finishes, for example because it was interrupted with Ctrl-C.
+
+        Args:
+            request (dict): The request, whose optional "deadline" overrides the daemon's own.
+            connection (socket.socket): The connection of the front end that sent the request.
+
+        Yields:
+            Deadline: The deadline of the request.
+        """
+        with self.client.transport.command(request.get("deadline")) as deadline:
+            finished = threading.Event()
+            watcher = threading.Thread(target=_watch_disconnect, args=(connection, deadline, finished), daemon=True)
+            watcher.start()
+            try:
+                yield deadline
+            finally:
+                finished.set()
+
+    def dispatch(self, request):
+        """
+        Run a single request with the warm client.
+
+        Yields:
+            dict: The response messages: text deltas for streamed completions, then a final result or error.
+        """
+        command = request.get("command")
+        if command == "ping":
+            yield {"result": "pong"}
+        elif command == "tx":
+            messages = [{"role": "user", "content": request["prompt"]}]
+            options = dict(n=request.get("n", 1), stop=request.get("stop"), max_tokens=request.get("max_tokens"),
+                           temperature=request.get("temperature"), use_cache=request.get("use_cache", True))
+            if request.get("stream"):
+                for index, delta in self.client.create_completion(messages, stream=True, **options):
+                    yield {"index": index, "delta": delta}
+                yield {"result": None}
+            else:
+                yield {"result": self.client.create_completion(messages, **options)}
+        elif command == "gi":
+            yield {"result": self.client.generate_image(request["prompt"], n=request.get("n", 1), size=request.get("size", "medium"),
+                                                        response_format=request.get("response_format", "url"),
+                                                        save_path=request.get("save_path"))}
+        elif command == "gv":
+            yield {"result": self.client.generate_variation(request["image_name"], n=request.get("n", 1), size=request.get("size", "medium"),
+                                                            response_format=request.get("response_format", "url"),
+                                                            save_path=request.get("save_path"))}
+        else:
+            yield {"error": f"Unknown command: {command}"}
+
+    def _idle_expired(self):
+        """
+        Check whether the daemon has been idle for longer than the idle timeout.
+
+        Returns:
+            bool: True if the daemon should exit, False otherwise.
+        """
+        if not self.idle_timeout:
+            return False
+        with self._lock:
+            return self._active == 0 and time.monotonic() - self._last_activity > self.idle_timeout
+
+
+def _watch_disconnect(connection, deadline, finished, interval=0.2):
+    """
+    Cancel a request's deadline if its front end closes the connection before the request finishes.
+    Data the front end sends meanwhile is left for the handler to read. On Linux, where poll
+    reports a Unix socket whose peer is gone as hung up, the close is seen even behind such data;
+    elsewhere it is seen once the data is read.
+    """
+    poller = None
+    if sys.platform.startswith("linux"):
+        poller = select.poll()
+        poller.register(connection, select.POLLHUP)
+    while not finished.is_set():
+        try:
+            if poller is not None:
+                closed = bool(poller.poll(interval * 1000))
+            else:
+                readable, _, _ = select.select([connection], [], [], interval)
+                closed = bool(readable) and not connection.recv(1, socket.MSG_PEEK)
+                if readable and not closed:
+                    finished.wait(interval)
+        except (OSError, ValueError):
+            closed = True
+        if closed:
+            if not finished.is_set():
+                deadline.cancel()
+            return
+
+
+class RemoteGPTClient:
+    """
+    A stand-in for GPTClient that forwards requests to a running TGPTDaemon, so the
+    CommandLineInterface can use a warm daemon without any changes.
+
+    Attributes:
+        socket_path (str): The path of the daemon's Unix domain socket.
+        model (str): The model name reported to the user.
+        max_tokens (int): The maximum number of tokens, or None for the daemon's default.
+        temperature (float): The temperature, or None for the daemon's default.
+        cache (bool): Whether the daemon may answer from its response cache. Set to None to bypass it.
+        deadline (float): The number of seconds a request may take on the daemon, or None for the daemon's default.
+        timeout (float): The number of seconds to wait for the daemon to connect or send the next message.
+    """
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, model=None, deadline=None, timeout=None):
+        """
+        Initialize the RemoteGPTClient with the daemon's socket path. The timeout defaults to the
+        deadline plus a grace period, so a hung daemon cannot hang the front end.
+        """
+        self.socket_path = os.path.expanduser(socket_path)
+        self.model = model
+        self.deadline = deadline
+        self.timeout = timeout if timeout is not None else (deadline + DAEMON_GRACE if deadline else None)
+        self.max_tokens = None
+        self.temperature = None
+        self.cache = True
+
+    def completion(self, prompt, n=1, stop=None, stream=False, **kwargs):
+        """
+        Generate a completion for the given prompt on the daemon.
+
+        Returns:
+            list: A list containing the completion text, or a generator of (choice index, text delta)
+            tuples when stream is True.
+        """
+        request = {"command": "tx", "prompt": prompt, "n": n, "stop": stop, "stream": stream, "deadline": self.deadline,
+                   "max_tokens": self.max_tokens, "temperature": self.temperature, "use_cache": self.cache is not None}
+        if stream:
+            return self._stream(request)
+        return self._call(request) or []
+
+    def generate_image(self, prompt, size="medium", n=1, response_format="url", save_path=None):
+        """
+        Generate an image on the daemon, saving it relative to this process' working directory.
+
+        Returns:
+            list: A list of file paths where the generated images are saved.
+        """
+        request = {"command": "gi", "prompt": prompt, "n": n, "size": size, "response_format": response_format,
+                   "deadline": self.deadline, "save_path": os.path.abspath(save_path or os.getcwd())}
+        return self._print_saved(self._call(request) or [])
+
+    def generate_variation(self, image_name, n=1, size="medium", response_format="url", save_path=None):
+        """
+        Generate a variation of the given image on the daemon.
+
+        Returns:
+            list: A list of file paths where the generated image variations are saved.
+        """
+        request = {"command": "gv", "image_name": os.path.abspath(image_name), "n": n, "size": size,
+                   "response_format": response_format, "deadline": self.deadline,
+                   "save_path": os.path.abspath(save_path or os.getcwd())}
+        return self._print_saved(self._call(request) or [])
+
+    def set_max_tokens(self, max_tokens):
+        """
+        Set the maximum number of tokens for completions.
+        """
+        self.max_tokens = max_tokens
+
+    def set_temperature(self, temperature):
+        """
+        Set the temperature for completions.
+        """
+        self.temperature = temperature
+
+    def get_model(self):
+        """
+        Retrieve the GPT model name.
+
+        Returns:
+            str: The GPT model name.
+        """
+        return self.model
+
+    def _call(self, request):
+        """
+        Send a request and wait for its result.
+
+        Returns:
+            The result of the request, or None if the daemon reported an error.
+        """
+        for message in self._send(request):
+            if "result" in message:
+                return message["result"]
+        return None
+
+    def _stream(self, request):
+        """
+        Send a streaming request and yield the text deltas as they arrive.
+
+        Yields:
+            tuple: The choice index and the text delta for that choice.
+        """
+        for message in self._send(request):
+            if "delta" in message:
+                yield message["index"], message["delta"]
+
+    def _send(self, request):
+        """
+        Send a request over the socket and yield the response messages. The connection is closed
+        however the request ends, including Ctrl-C, which makes the daemon cancel the request.
+
+        Yields:
+            dict: Each response message, until the final result or error.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(self.timeout)
+            try:
+                connection.connect(self.socket_path)
+                connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+                with connection.makefile("rb") as reader:
+                    for line in reader:
+                        message = json.loads(line)
+                        if "error" in message:
+                            print(f"Error from tgpt daemon: {message['error']}")
+                            return
+                        yield message
+                        if "result" in message:
+                            return
+            except socket.timeout:
+                print(f"Error from tgpt daemon: no answer within {self.timeout:g}s")
+
+    @staticmethod
+    def _print_saved(paths):
+        """
+        Report the saved image paths, as the in-process ImageHandler does.
+
+        Returns:
+            list: The saved image paths.
+        """
+        for path in paths:
+            if path:
+                print(f"\nSaved image to {path}")
+        return paths
+
+
+def is_daemon_running(socket_path=DEFAULT_SOCKET_PATH, timeout=0.2):
+    """
+    Check whether a daemon is accepting connections on the given socket.
+
+    Returns:
+        bool: True if a daemon is listening, False otherwise.
+    """
+    socket_path = os.path.expanduser(socket_path)
+    if not os.path.exists(socket_path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(timeout)
+            connection.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+if __name__ == "__main__":
+    try:
+        if is_daemon_running():
+            print(RemoteGPTClient().completion("Hello, how are you?"))
+        else:
+            print("No tgpt daemon is running, start one with: tgpt serve")
+    except Exception as e:
+        print(f"Error connecting to the tgpt daemon: {e}")
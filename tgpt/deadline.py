@@ -0,0 +1,223 @@
+import socket
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """
+    Raised when a command runs past its deadline, so no further request, retry or wait is started.
+    """
+
+
+class Cancelled(requests.exceptions.RequestException):
+    """
+    Raised to the requests of a command that was cancelled, for example with Ctrl-C.
+    """
+
+
+_active = threading.local()
+
+
+class Deadline:
+    """
+    The time left to a command, shared by every request it sends, including retries and downloads.
+    The connections its requests are using are tracked, so cancelling the command aborts them.
+
+    Attributes:
+        seconds (float): The number of seconds the command may take, or 0 for no deadline.
+        cancelled (bool): Whether the command was cancelled.
+    """
+    def __init__(self, seconds=0):
+        """
+        Initialize the Deadline, counting from now.
+        """
+        self.seconds = seconds
+        self.cancelled = False
+        self._expires = time.monotonic() + seconds if seconds else None
+        self._connections = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """
+        Compute the time left before the deadline.
+
+        Returns:
+            float: The number of seconds left, or None if there is no deadline.
+        """
+        if self._expires is None:
+            return None
+        return max(0.0, self._expires - time.monotonic())
+
+    def allows(self, wait=0):
+        """
+        Tell whether the command may go on after waiting the given number of seconds.
+
+        Returns:
+            bool: False if the command was cancelled or the deadline would pass during the wait.
+        """
+        remaining = self.remaining()
+        return not self.cancelled and (remaining is None or remaining > wait)
+
+    def check(self, wait=0):
+        """
+        Make sure the command may go on after waiting the given number of seconds.
+
+        Raises:
+            Cancelled: If the command was cancelled.
+            DeadlineExceeded: If the deadline has passed, or would pass during the wait.
+        """
+        if self.cancelled:
+            raise Cancelled("Request cancelled")
+        if not self.allows(wait):
+            raise DeadlineExceeded(f"Deadline of {self.seconds:g}s exceeded")
+
+    def cap(self, timeout):
+        """
+        Shorten a requests timeout so a request cannot wait past the deadline.
+
+        Args:
+            timeout (float or tuple): The connect and read timeouts, or a single timeout for both.
+
+        Returns:
+            float or tuple: The timeout, with no part longer than the time left.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if isinstance(timeout, tuple):
+            return tuple(remaining if part is None else min(part, remaining) for part in timeout)
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def track(self, connection):
+        """
+        Record a connection taken from the pool by one of the command's requests. A connection
+        tracked after the command was cancelled is aborted right away.
+        """
+        with self._lock:
+            self._connections.add(connection)
+            cancelled = self.cancelled
+        if cancelled:
+            _abort(connection)
+
+    def release(self, connection):
+        """
+        Forget a connection returned to the pool.
+        """
+        with self._lock:
+            self._connections.discard(connection)
+
+    def cancel(self):
+        """
+        Cancel the command. No further request, wait or retry is started for it, and the
+        connections its requests are using are shut down, which aborts their reads at once.
+        """
+        with self._lock:
+            self.cancelled = True
+            connections = list(self._connections)
+        for connection in connections:
+            _abort(connection)
+
+
+def _abort(connection):
+    """
+    Shut down the socket of a connection in use, so a read blocked on it returns immediately.
+    """
+    sock = getattr(connection, "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def get_active_deadline():
+    """
+    Retrieve the deadline of the command the current thread works for.
+
+    Returns:
+        Deadline: The deadline, or None outside of a command.
+    """
+    return getattr(_active, "deadline", None)
+
+
+def set_active_deadline(deadline):
+    """
+    Make the current thread work for the command with the given deadline, or for none.
+
+    Returns:
+        Deadline: The deadline the thread worked for until now, to restore afterwards.
+    """
+    previous = get_active_deadline()
+    _active.deadline = deadline
+    return previous
+
+
+def propagate(function):
+    """
+    Bind a function to the deadline of the calling thread, so it runs within the same command
+    when it is called from a worker thread.
+
+    Returns:
+        callable: The function, running within the caller's deadline.
+    """
+    deadline = get_active_deadline()
+
+    def run(*args, **kwargs):
+        previous = set_active_deadline(deadline)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            set_active_deadline(previous)
+    return run
+
+
+class DeadlineExecutor(ThreadPoolExecutor):
+    """
+    A thread pool whose tasks run within the deadline of the thread submitting them.
+
+    If the block using the pool is interrupted, for example with Ctrl-C, the command is cancelled,
+    which aborts the requests of the running tasks, the queued tasks are dropped, and the block is
+    left without waiting for the pool to drain.
+    """
+    def __init__(self, max_workers=None):
+        """
+        Initialize the DeadlineExecutor within the deadline of the calling thread.
+        """
+        super().__init__(max_workers=max_workers)
+        self.deadline = get_active_deadline()
+        self._futures = weakref.WeakSet()
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Schedule a function to run within the deadline of the calling thread.
+
+        Returns:
+            concurrent.futures.Future: The future of the function's result.
+        """
+        future = super().submit(propagate(function), *args, **kwargs)
+        self._futures.add(future)
+        return future
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None or not issubclass(exc_type, KeyboardInterrupt):
+            return super().__exit__(exc_type, exc, traceback)
+        if self.deadline is not None:
+            self.deadline.cancel()
+        for future in list(self._futures):
+            future.cancel()
+        self.shutdown(wait=False)
+        return False
+
+
+if __name__ == "__main__":
+    try:
+        deadline = Deadline(0.2)
+        print(deadline.cap((10, 60)))
+        time.sleep(0.2)
+        deadline.check()
+    except Exception as e:
+        print(f"Error checking Deadline: {e}")
@@ -0,0 +1,179 @@
+import threading
+import time
+
+
+class Endpoint:
+    """
+    An OpenAI-compatible backend and its health as seen by the EndpointPool.
+
+    Attributes:
+        name (str): The endpoint name.
+        url (str): The API base URL, for example "https://api.openai.com/v1".
+        key (str): The API key sent to this endpoint.
+        weight (float): The relative share of traffic, a weight of 2 tolerates twice the latency.
+        latency (float): The moving average of the response time in seconds, or None before the first response.
+        error_rate (float): The moving average of failed requests, from 0 to 1.
+        failures (int): The number of consecutive failed requests.
+        in_flight (int): The number of requests currently sent to this endpoint.
+        open_until (float): The monotonic time until which the circuit is open, 0 when closed.
+        requests (int): The number of requests sent to this endpoint.
+        probing (bool): Whether a request is probing the endpoint after its cooldown.
+    """
+    def __init__(self, name, url, key, weight=1.0):
+        """
+        Initialize the Endpoint as healthy and unmeasured.
+        """
+        self.name = name
+        self.url = url.rstrip("/")
+        self.key = key
+        self.weight = weight if weight > 0 else 1.0
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.in_flight = 0
+        self.open_until = 0.0
+        self.requests = 0
+        self.probing = False
+
+
+class EndpointPool:
+    """
+    Route API requests over several OpenAI-compatible endpoints, sending each one to the
+    fastest healthy endpoint and failing over to the others when it fails.
+
+    Latency and error rate are tracked per endpoint with exponentially weighted moving averages.
+    An endpoint failing several times in a row, or failing too often overall, has its circuit
+    opened and gets no traffic for a cooldown period, after which a single request probes it:
+    a success closes the circuit, a failure opens it again for twice as long.
+
+    Attributes:
+        endpoints (list): The Endpoint objects, in configuration order.
+        alpha (float): The weight of the newest sample in the moving averages.
+        failure_threshold (int): The number of consecutive failures that opens a circuit.
+        error_threshold (float): The error rate that opens a circuit.
+        cooldown (float): The seconds a circuit stays open the first time.
+        max_cooldown (float): The longest a circuit stays open.
+    """
+    def __init__(self, endpoints, alpha=0.3, failure_threshold=3, error_threshold=0.5, cooldown=10.0, max_cooldown=300.0):
+        """
+        Initialize the EndpointPool with at least one endpoint.
+        """
+        if not endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._cooldowns = {endpoint.name: cooldown for endpoint in self.endpoints}
+        self._lock = threading.Lock()
+
+    def route(self, url):
+        """
+        Split a URL built on one of the endpoint base URLs into that base and the API path.
+
+        Returns:
+            str: The API path, for example "/chat/completions", or None if the URL is not an API URL of the pool.
+        """
+        for endpoint in self.endpoints:
+            if url.startswith(endpoint.url + "/"):
+                return url[len(endpoint.url):]
+        return None
+
+    def choose(self, exclude=()):
+        """
+        Pick the endpoint for the next request and count it as in flight: the healthy endpoint
+        with the lowest latency per unit of weight, scaled by the requests already in flight.
+        Unmeasured endpoints are tried first. If every circuit is open, the endpoint that has
+        been closed off the longest is used anyway, so requests are never refused.
+
+        Args:
+            exclude (collection): Endpoints already tried for this request.
+
+        Returns:
+            Endpoint: The chosen endpoint.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude] or self.endpoints
+            healthy = [endpoint for endpoint in candidates if endpoint.open_until <= now and not endpoint.probing]
+            if healthy:
+                endpoint = min(healthy, key=self._score)
+                if endpoint.open_until:
+                    # The cooldown has passed: this request probes whether the endpoint recovered.
+                    endpoint.probing = True
+            else:
+                endpoint = min(candidates, key=lambda candidate: candidate.open_until)
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def record(self, endpoint, latency, ok):
+        """
+        Record the outcome of a request sent to an endpoint and update its circuit.
+
+        Args:
+            endpoint (Endpoint): The endpoint returned by choose().
+            latency (float): The seconds until the response headers arrived.
+            ok (bool): Whether the endpoint answered without a connection error, 429 or 5xx.
+        """
+        with self._lock:
+            endpoint.in_flight = max(0, endpoint.in_flight - 1)
+            endpoint.error_rate += self.alpha * ((0.0 if ok else 1.0) - endpoint.error_rate)
+            if ok:
+                endpoint.latency = latency if endpoint.latency is None else endpoint.latency + self.alpha * (latency - endpoint.latency)
+                endpoint.failures = 0
+                if endpoint.open_until:
+                    endpoint.open_until = 0.0
+                    endpoint.error_rate = 0.0
+                    self._cooldowns[endpoint.name] = self.cooldown
+            else:
+                endpoint.failures += 1
+                if endpoint.probing or endpoint.failures >= self.failure_threshold or \
+                        (endpoint.requests >= 5 and endpoint.error_rate >= self.error_threshold):
+                    cooldown = self._cooldowns[endpoint.name]
+                    endpoint.open_until = time.monotonic() + cooldown
+                    self._cooldowns[endpoint.name] = min(self.max_cooldown, cooldown * 2)
+            endpoint.probing = False
+
+    def get_stats(self):
+        """
+        Report the health of every endpoint.
+
+        Returns:
+            list: A dict per endpoint with its name, URL, state, latency in milliseconds, error rate and request count.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "name": endpoint.name,
+                "url": endpoint.url,
+                "state": "open" if endpoint.open_until > now else ("half-open" if endpoint.open_until else "closed"),
+                "latency_ms": round(endpoint.latency * 1000, 1) if endpoint.latency is not None else None,
+                "error_rate": round(endpoint.error_rate, 3),
+                "requests": endpoint.requests,
+            } for endpoint in self.endpoints]
+
+    @staticmethod
+    def _score(endpoint):
+        """
+        Rank an endpoint for choose(), lower is better.
+
+        Returns:
+            float: The weighted latency, scaled by the requests in flight.
+        """
+        if endpoint.latency is None:
+            return -1.0 / endpoint.weight
+        return endpoint.latency * (1 + endpoint.in_flight) / endpoint.weight
+
+
+if __name__ == "__main__":
+    try:
+        pool = EndpointPool([Endpoint("openai", "https://api.openai.com/v1", "API_KEY"),
+                             Endpoint("local", "http://localhost:8000/v1", "", weight=2)])
+        endpoint = pool.choose()
+        pool.record(endpoint, 0.25, True)
+        print(pool.get_stats())
+    except Exception as e:
+        print(f"Error initializing EndpointPool or routing request: {e}")
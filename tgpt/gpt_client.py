@@ -1,6 +1,13 @@
+import itertools
+import threading
 import requests
 from typing import Union
-from .image_handler import ImageHandler
+from .deadline import propagate
+from .http_transport import HTTPTransport, iter_sse_data
+from .response_cache import ResponseCache
+from .singleflight import SingleFlight, make_key
+from .context_window import ContextWindow
+from .tokenizer import Tokenizer, get_context_size
 
 
 class GPTClient:
@@ -12,35 +19,100 @@ class GPTClient:
         model (str): The name of the GPT model to use.
         max_tokens (int): The maximum number of tokens for completions.
         temperature (float): The temperature for completions.
+        transport (HTTPTransport): The pooled HTTP transport shared with the ImageHandler.
+        cache (ResponseCache): The optional on-disk response cache.
+        context (ContextWindow): The chat history, sent within a token budget.
+        tokenizer (Tokenizer): The local tokenizer used for token accounting.
+        last_usage (dict): The token usage reported for the last completion.
+        session (Session): The session the chat history is persisted to, or None.
+        hedger (Hedger): Hedges slow completion requests, or None when hedging is off.
+        singleflight (SingleFlight): Coalesces identical completion requests in flight.
+        retriever (Retriever): Injects relevant indexed documents into chat prompts, or None.
     """
-    def __init__(self, api_key, model="gpt-3.5-turbo", max_tokens=100, temperature=0.7):
+    def __init__(self, api_key, model="gpt-3.5-turbo", max_tokens=100, temperature=0.7, transport=None, cache=None,
+                 tokenizer=None, api_base="https://api.openai.com/v1"):
         """
         Initialize the GPTClient with the given API key and model.
         """
         self.api_key = api_key
-        self.endpoint_completions = "https://api.openai.com/v1/chat/completions"
+        self.api_base = api_base.rstrip("/")
+        self.transport = transport if transport is not None else HTTPTransport()
+        self.endpoint_completions = f"{self.api_base}/chat/completions"
+        self.endpoint_embeddings = f"{self.api_base}/embeddings"
         self.model = model
-        self.chat_history = []
+        self.tokenizer = tokenizer if tokenizer is not None else Tokenizer()
+        self.context = ContextWindow(count_tokens=self.tokenizer.count_message)
+        self.last_usage = None
+        self.session = None
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"}
-        self.image_handler = ImageHandler(self.api_key)
+        self._image_handler = None
+        self._image_handler_lock = threading.Lock()
         self.max_tokens = max_tokens
         self.temperature = temperature
+        self.cache = cache
+        self.hedger = None
+        self.singleflight = SingleFlight()
+        self.retriever = None
 
-
-    def completion(self, prompt, n=1, top_p=1, frequency_penalty=0, presence_penalty=0, stop=None):
+    def completion(self, prompt, n=1, top_p=1, frequency_penalty=0, presence_penalty=0, stop=None, stream=False):
         """
         Generate a completion for the given prompt using the GPT model.
         
+        With stream=True, a generator is returned instead, yielding (choice index, text delta)
+        tuples as the server-sent events arrive. The chat history is updated once the stream finishes.
+        
+        With a retriever set, the indexed documents most relevant to the prompt are sent along with
+        it, without being added to the chat history.
+        
         Returns:
             list: A list containing the completion text.
         """
+        messages = self.context.build(prompt)
+        if self.retriever is not None:
+            retrieved = self.retriever.build_message(prompt)
+            if retrieved is not None:
+                messages.insert(len(messages) - 1, retrieved)
+
+        if stream:
+            chunks = self.create_completion(messages, n=n, top_p=top_p, frequency_penalty=frequency_penalty,
+                                            presence_penalty=presence_penalty, stop=stop, stream=True)
+            return self._record_stream(prompt, chunks)
+
+        text = self.create_completion(messages, n=n, top_p=top_p, frequency_penalty=frequency_penalty,
+                                      presence_penalty=presence_penalty, stop=stop)
+        if text:
+            self.add_to_chat_history(prompt, text)
+        return text
+
+    def create_completion(self, messages, n=1, top_p=1, frequency_penalty=0, presence_penalty=0, stop=None,
+                          model=None, max_tokens=None, temperature=None, stream=False, use_cache=True):
+        """
+        Generate a completion for the given messages without reading or updating the chat history,
+        so it can be called from several threads at once. Model, max_tokens and temperature
+        default to the client settings. If a response cache is set, identical requests at
+        temperature 0 are answered from the cache. Identical requests made while one is in flight, from other
+        threads or a daemon's other clients, share its answer instead of being sent again.
+        
+        The prompt is counted locally first: when its tokens can be counted exactly for the model,
+        max_tokens is reduced to what is left of the model context, and prompts that do not fit at
+        all are rejected without a round trip.
+        
+        Returns:
+            list: A list containing the completion text, or a generator of (choice index, text delta)
+            tuples when stream is True.
+        """
+        model = model if model is not None else self.model
+        max_tokens, prompt_tokens = self._fit_max_tokens(messages, model, max_tokens if max_tokens is not None else self.max_tokens)
+        if max_tokens is None:
+            return iter([]) if stream else []
+
         payload = {
-            "model": self.model,
-            "messages": [],
-            "max_tokens": self.max_tokens,
-            "temperature": self.temperature,
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature if temperature is not None else self.temperature,
             "top_p": top_p,
             "frequency_penalty": frequency_penalty,
             "presence_penalty": presence_penalty,
@@ -48,16 +120,30 @@ class GPTClient:
             "stop": stop
         }
 
-        if self.chat_history:
-            history = self.chat_history
-            history.append({"role": "user", "content": prompt})
-            payload["messages"] = history
-        else:
-            payload["messages"] = [{"role": "user", "content": prompt}]
+        cache_key = None
+        if self.cache is not None and use_cache and ResponseCache.is_cacheable(payload):
+            cache_key = ResponseCache.make_key(payload, self._cache_endpoint())
+            cached = self.cache.get(cache_key)
+            if cached:
+                return self._replay_cached(cached) if stream else cached
+
+        tokens = prompt_tokens + max_tokens * n
+        if stream:
+            payload["stream"] = True
+            return self._stream_completion(payload, cache_key, tokens, prompt_tokens)
+
+        return self.singleflight.do(make_key(self.endpoint_completions, payload),
+                                    lambda: self._request_completion(payload, cache_key, tokens))
+
+    def _request_completion(self, payload, cache_key=None, tokens=0):
+        """
+        Send a completion request and cache its answer.
         
+        Returns:
+            list: A list containing the completion text, or an empty list if the request failed.
+        """
         try:
-            response = requests.post(self.endpoint_completions, headers=self.headers, json=payload)
-            response.raise_for_status()
+            response, _ = self._post_completion(payload, tokens)
         except requests.exceptions.RequestException as e:
             print(f"Error making request to GPT API: {e}")
             return []
@@ -65,12 +151,326 @@ class GPTClient:
         try:
             result = response.json()
             text = [choice['message']['content'] for choice in result['choices']]
-            self.add_to_chat_history(prompt, text)
-            return text
+            self.last_usage = result.get('usage')
         except Exception as e:
             print(f"Error processing GPT API response: {e}")
             return []
+
+        if cache_key is not None:
+            self.cache.set(cache_key, text)
+        return text
+
+    def create_embeddings(self, texts, model="text-embedding-3-small", dimensions=None):
+        """
+        Embed texts with a single request.
+        
+        Args:
+            texts (list): The texts to embed.
+            model (str, optional): The embedding model. Defaults to "text-embedding-3-small".
+            dimensions (int, optional): The length of the vectors, for models that can shorten them.
+        
+        Returns:
+            list: The embedding of every text in order, or an empty list if the request failed.
+        """
+        payload = {"model": model, "input": texts}
+        if dimensions:
+            payload["dimensions"] = dimensions
+        tokens = sum(self.tokenizer.count(text) for text in texts)
+        try:
+            response = self.transport.api_request("POST", self.endpoint_embeddings, tokens=tokens, kind="embedding",
+                                                  headers=self.headers, json=payload)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"Error making request to embeddings API: {e}")
+            return []
+
+        try:
+            return [item["embedding"] for item in sorted(response.json()["data"], key=lambda item: item["index"])]
+        except Exception as e:
+            print(f"Error processing embeddings API response: {e}")
+            return []
+
+    def _stream_completion(self, payload, cache_key=None, tokens=0, prompt_tokens=None):
+        """
+        Send a streaming completion request and yield the text deltas as they arrive.
+        The assembled answer is cached once the stream finishes without errors. Streams carry no
+        usage block, so the tokens reported to the metrics are counted locally.
+        
+        Yields:
+            tuple: The choice index and the text delta for that choice.
+        """
+        try:
+            response, events = self._post_completion(payload, tokens, stream=True)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error making request to GPT API: {e}")
+            return
+
+        parts = {}
+        try:
+            with response:
+                for event in events:
+                    self.transport.check_deadline()
+                    for choice in event.get("choices", []):
+                        delta = choice.get("delta", {}).get("content")
+                        if delta:
+                            index = choice.get("index", 0)
+                            parts.setdefault(index, []).append(delta)
+                            yield index, delta
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error processing GPT API stream: {e}")
+            return
+        finally:
+            completion_tokens = sum(self.tokenizer.count("".join(chunks)) for chunks in parts.values())
+            self.last_usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                               "total_tokens": (prompt_tokens or 0) + completion_tokens}
+            self.transport.finish(response, {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens})
+
+        if cache_key is not None and parts:
+            self.cache.set(cache_key, ["".join(parts[index]) for index in sorted(parts)])
+
+    def _post_completion(self, payload, tokens, stream=False):
+        """
+        Send a completion request, hedged when hedging is on. A hedged stream counts as answered
+        once its first event arrives.
+        
+        Returns:
+            tuple: The response and, for a stream, an iterator over its events, otherwise None.
+        
+        Raises:
+            requests.exceptions.RequestException: If the request failed.
+        """
+        def send(kind):
+            response = self.transport.api_request("POST", self.endpoint_completions, tokens=tokens, kind=kind,
+                                                  headers=self.headers, json=payload, stream=stream)
+            response.raise_for_status()
+            return response, iter_sse_data(response) if stream else None
+
+        kind = "completion_stream" if stream else "completion"
+        if self.hedger is None:
+            return send(kind)
+
+        def send_until_first_event(kind):
+            response, events = send(kind)
+            if events is not None:
+                first = next(events, None)
+                events = itertools.chain([] if first is None else [first], events)
+            return response, events
+
+        return self.hedger.run(propagate(send_until_first_event), kind, cancel=self._discard_response)
+
+    def _discard_response(self, result):
+        """
+        Record and close the response of a hedged request that lost, which aborts a stream.
+        """
+        response, _ = result
+        self.transport.finish(response)
+        response.close()
+
+    def _cache_endpoint(self):
+        """
+        Retrieve the endpoint the cached answers of this client belong to.
+
+        Returns:
+            str or list: The completions URL, or the completions URLs of every endpoint of the
+            transport's pool, since a routed request may be answered by any of them.
+        """
+        endpoints = self.transport.endpoints
+        path = endpoints.route(self.endpoint_completions) if endpoints is not None else None
+        if path is None:
+            return self.endpoint_completions
+        return sorted(endpoint.url + path for endpoint in endpoints.endpoints)
+
+    def _fit_max_tokens(self, messages, model, max_tokens):
+        """
+        Size max_tokens to the room left in the model context after the prompt.
+        
+        Returns:
+            tuple: The max_tokens to request, or None if the prompt alone exceeds the context,
+            and the number of prompt tokens. Requests to models of unknown context size, or
+            whose tokens cannot be counted exactly, are left for the API to check.
+        """
+        context_size = get_context_size(model)
+        prompt_tokens = self.tokenizer.count_messages(messages)
+        if context_size is None or not self.tokenizer.is_exact_for(model):
+            return max_tokens, prompt_tokens
+        available = context_size - prompt_tokens
+        if available <= 0:
+            print(f"Error: the prompt uses {prompt_tokens} tokens, which exceeds the {context_size} token context of {model}")
+            return None, prompt_tokens
+        return min(max_tokens, available), prompt_tokens
+
+    def count_tokens(self, prompt=""):
+        """
+        Count the tokens the next request would send for the given prompt, including the history.
+        
+        Returns:
+            dict: The prompt tokens, the full history tokens, the model context size, or None if it is unknown,
+            and whether the counts are exact.
+        """
+        return {
+            "prompt": self.tokenizer.count_messages(self.context.build(prompt, summarize=False)),
+            "history": self.context.get_token_count(),
+            "context": get_context_size(self.model),
+            "exact": self.tokenizer.is_exact_for(self.model),
+        }
+
+    @staticmethod
+    def _replay_cached(texts):
+        """
+        Yield cached completion texts in the same shape as a streamed completion.
+        
+        Yields:
+            tuple: The choice index and the full text for that choice.
+        """
+        for index, text in enumerate(texts):
+            yield index, text
+
+    def _record_stream(self, prompt, chunks):
+        """
+        Pass streamed chunks through and add the assembled answer to the chat history once the stream finishes.
+        
+        Yields:
+            tuple: The choice index and the text delta for that choice.
+        """
+        parts = {}
+        for index, delta in chunks:
+            parts.setdefault(index, []).append(delta)
+            yield index, delta
+
+        if parts:
+            self.add_to_chat_history(prompt, ["".join(parts[index]) for index in sorted(parts)])
+
+    @property
+    def image_handler(self):
+        """
+        The ImageHandler sharing this client's transport, created on first use so that
+        text-only commands do not load the image stack. Concurrent first uses share one handler.
+        """
+        with self._image_handler_lock:
+            if self._image_handler is None:
+                from .image_handler import ImageHandler
+                self._image_handler = ImageHandler(self.api_key, transport=self.transport, api_base=self.api_base)
+        return self._image_handler
+
+    def warm_up(self):
+        """
+        Open a keep-alive connection to the API host ahead of the first request.
+        """
+        self.transport.warm(self.endpoint_completions)
+
+    def get_connection_stats(self):
+        """
+        Retrieve the connection reuse statistics of the shared transport.
+        
+        Returns:
+            dict: The connection reuse statistics.
+        """
+        return self.transport.get_stats()
+
+    def get_endpoint_stats(self):
+        """
+        Retrieve the health of every endpoint of the transport's endpoint pool.
+        
+        Returns:
+            list: The endpoint statistics, empty without an endpoint pool.
+        """
+        if self.transport.endpoints is None:
+            return []
+        return self.transport.endpoints.get_stats()
+
+    def get_request_stats(self):
+        """
+        Retrieve the latency, size and token usage summary of the requests sent so far.
         
+        Returns:
+            str: The summary table of the in-memory request histogram.
+        """
+        stats = self.transport.metrics.histogram.format()
+        coalesced = self.singleflight.get_stats()
+        if coalesced["shared"]:
+            stats += f"\nCoalesced {coalesced['shared']} of {coalesced['calls']} completions into requests already in flight"
+        if self.hedger is not None:
+            hedges = self.hedger.get_stats()
+            stats += (f"\nHedged {hedges['fired']} of {hedges['requests']} completions "
+                      f"({hedges['fired'] / max(1, hedges['requests']):.1%}), {hedges['won']} hedges answered first")
+        return stats
+
+    def set_hedging(self, percentile=95, max_ratio=0.05):
+        """
+        Hedge completion requests: a request slower than the given percentile of recent latencies
+        is sent a second time and the first answer is used.
+        
+        Args:
+            percentile (float, optional): The latency percentile after which a hedge is sent. Defaults to 95.
+            max_ratio (float, optional): The largest fraction of requests that may be hedged. Defaults to 0.05.
+        """
+        from .hedging import Hedger
+        self.hedger = Hedger(percentile=percentile, max_ratio=max_ratio)
+
+    def set_context_budget(self, token_budget, summarize=False):
+        """
+        Set the token budget for the chat history sent with each request.
+        
+        Args:
+            token_budget (int): The maximum number of history tokens per request.
+            summarize (bool, optional): Whether turns that no longer fit are folded into a rolling
+                summary instead of being dropped. Defaults to False.
+        """
+        self.context.token_budget = token_budget
+        self.context.summarizer = self._summarize if summarize else None
+
+    def set_system_prompt(self, content):
+        """
+        Pin a system message that is sent with every request.
+        """
+        self.context.pin(content)
+        if self.session is not None:
+            self.session.set_pinned(self.context.pinned)
+
+    def start_session(self, session):
+        """
+        Persist the chat history to the given session from now on, writing the turns so far first.
+        """
+        if self.context.messages:
+            session.extend(self.context.messages)
+        if self.context.pinned:
+            session.set_pinned(self.context.pinned)
+        self.session = session
+
+    def load_session(self, session):
+        """
+        Replace the chat history with a stored session and keep persisting to it. Only the newest
+        turns that fit in the context budget are read.
+
+        Returns:
+            int: The number of messages loaded.
+        """
+        self.context.clear(keep_pinned=False)
+        for content in session.get_pinned():
+            self.context.pin(content)
+        messages = session.read_tail(self.context.token_budget, self.tokenizer.count_message)
+        for message in messages:
+            self.context.add(message["role"], message["content"])
+        self.session = session
+        return len(messages)
+
+    def _summarize(self, summary, messages):
+        """
+        Fold older chat turns into a compact rolling summary.
+        
+        Returns:
+            str: The updated summary, or the previous summary if the request fails.
+        """
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        prompt = ("Summarize the following conversation in a few sentences, keeping the names, facts "
+                  "and decisions needed to continue it.")
+        if summary:
+            prompt += f"\n\nSummary so far:\n{summary}"
+        prompt += f"\n\nConversation:\n{transcript}"
+
+        text = self.create_completion([{"role": "user", "content": prompt}], temperature=0, use_cache=False)
+        return text[0] if text else summary
+
     def set_max_tokens(self, max_tokens):
         """
         Set the maximum number of tokens for completions.
@@ -110,6 +510,13 @@ class GPTClient:
         """
         return self.model
     
+    @property
+    def chat_history(self):
+        """
+        The full chat history, including turns no longer sent with requests.
+        """
+        return self.context.messages
+
     def get_chat_history(self):
         """
         Retrieve the chat history.
@@ -123,14 +530,13 @@ class GPTClient:
         """
         Add the prompt and response to the chat history.
         """
-        prompt_message = {'role': 'user', 'content': prompt}
-        
         if isinstance(response, list):
             response = response[0] 
 
-        response_message = {'role': 'assistant', 'content': response}
-        self.chat_history.append(prompt_message)
-        self.chat_history.append(response_message)
+        self.context.add('user', prompt)
+        self.context.add('assistant', response)
+        if self.session is not None:
+            self.session.extend(self.context.messages[-2:])
 
     def generate_image(self, prompt, size="medium", n=1, response_format="url", save_path = None):
         """
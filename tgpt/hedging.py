@@ -0,0 +1,225 @@
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from .metrics import percentile
+
+
+class Hedger:
+    """
+    Cut the latency tail of API requests by hedging: when a request has not answered within the
+    usual latency of its kind, a duplicate is sent, the first successful result is used and the
+    other one is cancelled.
+
+    The hedge delay is the given percentile of the recent latencies of each kind of request, so it
+    adapts to the model and the network. No hedge is sent until enough latencies have been seen,
+    and hedges are capped to a fraction of all requests, which bounds the extra load.
+
+    A request that cannot be hedged, because no delay is known yet or the budget is spent, runs
+    on the calling thread. Otherwise it runs on a reused worker thread while the caller waits for
+    the delay, and a thread for the hedge is only started once the delay expires.
+
+    Attributes:
+        percentile (float): The latency percentile after which a hedge is sent, from 0 to 100.
+        max_ratio (float): The largest fraction of requests that may be hedged.
+        min_samples (int): The number of latencies needed before hedging a kind of request.
+        requests (int): The number of requests sent through the Hedger.
+        fired (int): The number of hedges sent.
+        won (int): The number of hedges that answered first.
+    """
+    def __init__(self, percentile=95, max_ratio=0.05, min_samples=10, window=200):
+        """
+        Initialize the Hedger with no latencies seen.
+        """
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._tasks = queue.SimpleQueue()
+        self._idle = 0
+        self._lock = threading.Lock()
+
+    def run(self, call, kind, cancel=None):
+        """
+        Run a request, hedging it if it is slow.
+
+        Args:
+            call (callable): Sends the request and returns its result. Called with the kind of
+                request to report to the metrics, which is suffixed with "_hedge" for the duplicate.
+            kind (str): The kind of request whose latencies set the hedge delay.
+            cancel (callable, optional): Called with the result of the request that lost, to release it.
+
+        Returns:
+            object: The result of the first request that succeeded.
+
+        Raises:
+            Exception: The error of the last request if every request failed.
+        """
+        with self._lock:
+            self.requests += 1
+        delay = self.get_delay(kind)
+        if delay is None or not self._within_budget():
+            start = time.monotonic()
+            result = call(kind)
+            self._record(kind, time.monotonic() - start)
+            return result
+
+        primary = self._submit(call, kind)
+        primary.add_done_callback(self._observer(kind, time.monotonic()))
+        futures = [primary]
+        wait([primary], timeout=delay)
+        if not primary.done() and self._allow():
+            futures.append(self._start(call, f"{kind}_hedge"))
+
+        winner = None
+        error = None
+        pending = set(futures)
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                elif winner is None:
+                    winner = future
+
+        for future in futures:
+            if future is not winner and cancel is not None:
+                future.add_done_callback(lambda loser: loser.exception() is None and cancel(loser.result()))
+        if winner is None:
+            raise error
+        if winner is not primary:
+            with self._lock:
+                self.won += 1
+        return winner.result()
+
+    def get_delay(self, kind):
+        """
+        Compute how long a request of the given kind may take before it is hedged.
+
+        Returns:
+            float: The delay in seconds, or None if too few latencies have been seen.
+        """
+        with self._lock:
+            samples = list(self._latencies[kind])
+        if len(samples) < self.min_samples:
+            return None
+        return percentile(samples, self.percentile / 100)
+
+    def get_stats(self):
+        """
+        Report how often hedges were sent and how often they answered first.
+
+        Returns:
+            dict: The numbers of requests, hedges fired and hedges won.
+        """
+        with self._lock:
+            return {"requests": self.requests, "fired": self.fired, "won": self.won}
+
+    def _within_budget(self):
+        """
+        Check whether one more hedge would stay within the share of requests that may be hedged.
+        Without the lock held the answer is only a hint, which _allow confirms.
+
+        Returns:
+            bool: Whether a hedge may be sent.
+        """
+        return self.fired + 1 <= self.max_ratio * self.requests
+
+    def _allow(self):
+        """
+        Count a hedge if it stays within the share of requests that may be hedged.
+
+        Returns:
+            bool: Whether the hedge may be sent.
+        """
+        with self._lock:
+            if not self._within_budget():
+                return False
+            self.fired += 1
+            return True
+
+    def _record(self, kind, latency):
+        """
+        Record the latency of a successful first request.
+        """
+        with self._lock:
+            self._latencies[kind].append(latency)
+
+    def _observer(self, kind, start):
+        """
+        Build the callback recording the latency of a successful first request, whether or not it
+        was hedged, so the delay follows the latencies of unhedged requests.
+
+        Returns:
+            callable: The done callback for the request's future.
+        """
+        def observe(future):
+            if future.exception() is None:
+                self._record(kind, time.monotonic() - start)
+        return observe
+
+    def _submit(self, call, kind):
+        """
+        Run a request that may be hedged on a reused worker thread, starting a worker only when
+        none is idle. Workers are daemon threads, so a request that lost to its hedge never holds
+        up the exit.
+
+        Returns:
+            concurrent.futures.Future: The future of the request's result.
+        """
+        future = Future()
+        with self._lock:
+            self._tasks.put((future, call, kind))
+            if self._idle:
+                self._idle -= 1
+                return future
+        threading.Thread(target=self._work, daemon=True).start()
+        return future
+
+    def _work(self):
+        """
+        Run the submitted requests one after the other, for as long as the process runs.
+        """
+        while True:
+            future, call, kind = self._tasks.get()
+            _run(future, call, kind)
+            with self._lock:
+                self._idle += 1
+
+    @staticmethod
+    def _start(call, kind):
+        """
+        Run a hedge on its own thread. Hedges are rare, so they are not worth a pool.
+
+        Returns:
+            concurrent.futures.Future: The future of the request's result.
+        """
+        future = Future()
+        threading.Thread(target=_run, args=(future, call, kind), daemon=True).start()
+        return future
+
+
+def _run(future, call, kind):
+    """
+    Run a request and set its outcome on its future, unless the future was cancelled.
+    """
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        future.set_result(call(kind))
+    except BaseException as e:
+        future.set_exception(e)
+
+
+if __name__ == "__main__":
+    try:
+        hedger = Hedger(min_samples=1, max_ratio=0.5)
+        for latency in (0.01, 0.01, 0.2):
+            print(hedger.run(lambda kind, latency=latency: time.sleep(latency) or kind, "demo"))
+        print(hedger.get_stats())
+    except Exception as e:
+        print(f"Error initializing Hedger or running requests: {e}")
@@ -0,0 +1,392 @@
+import contextlib
+import json
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from .deadline import Deadline, get_active_deadline, set_active_deadline
+from .metrics import (Metrics, TimedHTTPConnectionPool, TimedHTTPSConnectionPool, get_connect_time, make_record,
+                      reset_connect_time)
+from .rate_limiter import RETRY_STATUSES, RequestScheduler, was_sent
+
+
+class HTTPTransport:
+    """
+    A shared HTTP transport holding a pooled, keep-alive session for all API and download traffic.
+
+    Attributes:
+        session (requests.Session): The pooled session used for every request.
+        pool_size (int): The maximum number of keep-alive connections kept per host.
+        scheduler (RequestScheduler): Paces and retries the API requests.
+        metrics (Metrics): Receives the timings, sizes and token usage of every request.
+        endpoints (EndpointPool): Routes the API requests over several endpoints, or None to send them as addressed.
+        timeout (tuple): The connect and read timeouts of requests sent without their own, in seconds.
+        deadline (float): The number of seconds a command may take, see command(), or 0 for no deadline.
+        current_deadline (Deadline): The deadline of the command the calling thread works for, or None.
+    """
+    def __init__(self, pool_size=10, pool_block=False, scheduler=None, metrics=None, endpoints=None, timeout=(10, 60),
+                 deadline=0):
+        """
+        Initialize the HTTPTransport with a pooled session.
+
+        Args:
+            pool_size (int, optional): The maximum number of connections kept alive per host. Defaults to 10.
+            pool_block (bool, optional): Whether to block when the pool is exhausted instead of opening
+                extra, non-pooled connections. Defaults to False.
+            scheduler (RequestScheduler, optional): Paces and retries the API requests. Defaults to a
+                scheduler learning the rate limits from the server.
+            metrics (Metrics, optional): Receives a record of every request. Defaults to Metrics
+                with the in-memory histogram only.
+            endpoints (EndpointPool, optional): Routes the API requests over several endpoints. Defaults to None.
+            timeout (tuple, optional): The connect and read timeouts, in seconds. Defaults to (10, 60).
+            deadline (float, optional): The number of seconds a command may take. Defaults to 0, no deadline.
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.deadline = deadline
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.endpoints = endpoints
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=pool_block)
+        self._adapter.poolmanager.pool_classes_by_scheme = {
+            "http": TrackedHTTPConnectionPool, "https": TrackedHTTPSConnectionPool}
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+    def request(self, method, url, kind=None, **kwargs):
+        """
+        Send a request through the pooled session.
+
+        Args:
+            kind (str, optional): The kind of request reported to the metrics. Defaults to the method name.
+
+        Returns:
+            requests.Response: The response to the request. Streamed responses are recorded once
+            finish() is called.
+        """
+        deadline = self.current_deadline
+        return self._send(kind or method.lower(), method, url, kwargs,
+                          lambda stats: self.session.request(method, url, **self._with_timeout(kwargs, deadline)))
+
+    def api_request(self, method, url, tokens=0, kind="api", idempotent=None, **kwargs):
+        """
+        Send an API request through the scheduler, which paces it against the rate limits and
+        retries it on connection errors, 429 and 5xx responses. With an endpoint pool, URLs on
+        any of its endpoints are sent to the best endpoint instead.
+
+        Args:
+            tokens (int, optional): The estimated number of tokens the request uses. Defaults to 0.
+            kind (str, optional): The kind of request reported to the metrics. Defaults to "api".
+            idempotent (bool, optional): Whether the request may be sent again after a read timeout
+                or a dropped connection, which could have reached the server. Defaults to True for
+                every method but POST and PATCH.
+
+        Returns:
+            requests.Response: The final response to the request. Streamed responses are recorded
+            once finish() is called.
+        """
+        deadline = self.current_deadline
+        if idempotent is None:
+            idempotent = method.upper() not in ("POST", "PATCH")
+        path = self.endpoints.route(url) if self.endpoints is not None else None
+        if path is not None:
+            send_request = lambda: self._send_routed(method, path, kwargs, deadline, idempotent)
+        else:
+            send_request = lambda: self.session.request(method, url, **self._with_timeout(kwargs, deadline))
+        return self._send(kind, method, url, kwargs,
+                          lambda stats: self.scheduler.send(send_request, tokens=tokens, stats=stats, deadline=deadline,
+                                                            idempotent=idempotent))
+
+    @property
+    def current_deadline(self):
+        """
+        The deadline of the command the calling thread works for, or None.
+        """
+        return get_active_deadline()
+
+    @contextlib.contextmanager
+    def command(self, seconds=None):
+        """
+        Run a command within a deadline shared by all of its requests, retries and downloads.
+        If the command is interrupted, for example with Ctrl-C, its requests still in flight are
+        aborted. A command started within another one runs within the outer deadline.
+
+        The deadline belongs to the calling thread. Work handed to other threads runs within it
+        when it is submitted through a DeadlineExecutor or wrapped with deadline.propagate.
+
+        Args:
+            seconds (float, optional): The number of seconds the command may take. Defaults to the
+                deadline attribute, 0 meaning no deadline.
+
+        Yields:
+            Deadline: The deadline of the command.
+        """
+        if self.current_deadline is not None:
+            yield self.current_deadline
+            return
+
+        deadline = Deadline(self.deadline if seconds is None else seconds)
+        set_active_deadline(deadline)
+        try:
+            yield deadline
+        except KeyboardInterrupt:
+            deadline.cancel()
+            raise
+        finally:
+            set_active_deadline(None)
+
+    def check_deadline(self):
+        """
+        Make sure the running command may go on, for long reads that check between chunks.
+
+        Raises:
+            DeadlineExceeded: If the deadline of the command has passed.
+            Cancelled: If the command was cancelled.
+        """
+        deadline = self.current_deadline
+        if deadline is not None:
+            deadline.check()
+
+    def cancel(self):
+        """
+        Cancel the command the calling thread works for: no further request or retry is started
+        for it and the connections of its requests in flight are shut down, which aborts them.
+        """
+        deadline = self.current_deadline
+        if deadline is not None:
+            deadline.cancel()
+
+    def _with_timeout(self, kwargs, deadline):
+        """
+        Add the default timeouts to the arguments of a request sent without its own, or with None,
+        shortened to the time left to the deadline.
+
+        Returns:
+            dict: The arguments to send the request with.
+
+        Raises:
+            DeadlineExceeded: If the deadline has already passed.
+            Cancelled: If the command was cancelled.
+        """
+        timeout = kwargs.get("timeout") or self.timeout
+        if deadline is not None:
+            deadline.check()
+            timeout = deadline.cap(timeout)
+        return dict(kwargs, timeout=timeout)
+
+    def _send_routed(self, method, path, kwargs, deadline=None, idempotent=True):
+        """
+        Send an API request to the best endpoint of the pool with that endpoint's key, failing over
+        to the next best endpoint right away on connection errors and retryable statuses. Requests
+        that are not idempotent only fail over on errors raised before they were sent.
+
+        Returns:
+            requests.Response: The first successful response, or the last response if every endpoint failed.
+
+        Raises:
+            requests.exceptions.RequestException: If the last endpoint tried could not be reached.
+        """
+        tried = []
+        while True:
+            request_kwargs = self._with_timeout(kwargs, deadline)
+            endpoint = self.endpoints.choose(exclude=tried)
+            tried.append(endpoint)
+            headers = dict(kwargs.get("headers") or {})
+            if endpoint.key:
+                headers["Authorization"] = f"Bearer {endpoint.key}"
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, endpoint.url + path, **dict(request_kwargs, headers=headers))
+            except requests.exceptions.RequestException as e:
+                self.endpoints.record(endpoint, time.perf_counter() - start, False)
+                if len(tried) >= len(self.endpoints.endpoints) or (not idempotent and was_sent(e)):
+                    raise
+                continue
+
+            ok = response.status_code not in RETRY_STATUSES
+            self.endpoints.record(endpoint, time.perf_counter() - start, ok)
+            if ok or len(tried) >= len(self.endpoints.endpoints):
+                return response
+            response.close()
+
+    def _send(self, kind, method, url, kwargs, send):
+        """
+        Send a request and record it. Responses that are not streamed are recorded right away,
+        including the token usage of a JSON body.
+
+        Returns:
+            requests.Response: The response to the request.
+        """
+        stats = {}
+        start = time.perf_counter()
+        reset_connect_time()
+        try:
+            response = send(stats)
+        except requests.exceptions.RequestException as e:
+            self.metrics.record(make_record(kind, method, url, start, get_connect_time(), stats.get("queue", 0.0),
+                                            stats.get("retries", 0), error=e))
+            raise
+
+        response.tgpt_timing = (kind, method, response.url or url, start, get_connect_time(), stats.get("queue", 0.0), stats.get("retries", 0))
+        if not kwargs.get("stream"):
+            usage = None
+            if b'"usage"' in response.content:
+                try:
+                    usage = response.json().get("usage")
+                except (ValueError, AttributeError):
+                    pass
+            self.finish(response, usage)
+        return response
+
+    def finish(self, response, usage=None):
+        """
+        Record a request once its response body has been read. Calling it again has no effect.
+
+        Args:
+            response (requests.Response): The response returned by request() or api_request().
+            usage (dict, optional): The usage block reported by the API.
+        """
+        timing = getattr(response, "tgpt_timing", None)
+        if timing is None:
+            return
+        response.tgpt_timing = None
+        kind, method, url, start, connect, queue, retries = timing
+        self.metrics.record(make_record(kind, method, url, start, connect, queue, retries, response=response, usage=usage))
+
+    def post(self, url, **kwargs):
+        """
+        Send a POST request through the pooled session.
+
+        Returns:
+            requests.Response: The response to the request.
+        """
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """
+        Send a GET request through the pooled session.
+
+        Returns:
+            requests.Response: The response to the request.
+        """
+        return self.request("GET", url, **kwargs)
+
+    def warm(self, url, timeout=5):
+        """
+        Open a connection to the host of the given URL in the background, so the first real
+        request does not pay for the TCP and TLS handshake.
+
+        Returns:
+            threading.Thread: The background thread performing the warm-up.
+        """
+        def _warm():
+            try:
+                self.session.head(url, timeout=timeout).close()
+            except requests.exceptions.RequestException:
+                pass
+
+        thread = threading.Thread(target=_warm, daemon=True)
+        thread.start()
+        return thread
+
+    def get_stats(self):
+        """
+        Report how often pooled connections have been reused.
+
+        Returns:
+            dict: The number of hosts, connections opened, requests sent, reused requests and the reuse ratio.
+        """
+        hosts = connections = requests_sent = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts += 1
+            connections += pool.num_connections
+            requests_sent += pool.num_requests
+
+        reused = max(requests_sent - connections, 0)
+        return {
+            "hosts": hosts,
+            "connections": connections,
+            "requests": requests_sent,
+            "reused": reused,
+            "reuse_ratio": reused / requests_sent if requests_sent else 0.0,
+        }
+
+    def close(self):
+        """
+        Close the session and every pooled connection.
+        """
+        self.session.close()
+
+
+class _DeadlinePoolMixin:
+    """
+    Track the connections taken from the pool by the deadline of the thread taking them, so
+    cancelling a command aborts its requests even before their responses arrive.
+    """
+    def _get_conn(self, timeout=None):
+        connection = super()._get_conn(timeout)
+        deadline = get_active_deadline()
+        if deadline is not None:
+            connection.tgpt_deadline = deadline
+            deadline.track(connection)
+        return connection
+
+    def _put_conn(self, conn):
+        deadline = getattr(conn, "tgpt_deadline", None)
+        if deadline is not None:
+            conn.tgpt_deadline = None
+            deadline.release(conn)
+        super()._put_conn(conn)
+
+
+class TrackedHTTPConnectionPool(_DeadlinePoolMixin, TimedHTTPConnectionPool):
+    pass
+
+
+class TrackedHTTPSConnectionPool(_DeadlinePoolMixin, TimedHTTPSConnectionPool):
+    pass
+
+
+def iter_sse_data(response):
+    """
+    Parse a server-sent events stream and yield the JSON payload of every data event.
+
+    Args:
+        response (requests.Response): A response opened with stream=True.
+
+    Yields:
+        dict: The decoded payload of each event, until the [DONE] sentinel is received.
+    """
+    data_lines = []
+    response.tgpt_bytes_in = 0
+    for raw_line in response.iter_lines():
+        response.tgpt_bytes_in += len(raw_line) + 1
+        line = raw_line.decode("utf-8")
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip(" "))
+            continue
+        if line or not data_lines:
+            continue
+
+        data = "\n".join(data_lines)
+        data_lines = []
+        if data == "[DONE]":
+            return
+        yield json.loads(data)
+
+    if data_lines and data_lines != ["[DONE]"]:
+        yield json.loads("\n".join(data_lines))
+
+
+if __name__ == "__main__":
+    try:
+        transport = HTTPTransport(pool_size=4)
+        transport.get("https://api.openai.com/v1/models").close()
+        print(transport.get_stats())
+    except Exception as e:
+        print(f"Error initializing HTTPTransport or sending request: {e}")
@@ -1,7 +1,13 @@
+import base64
 import requests
 import os
-import urllib
+import time
 from datetime import datetime
+from .deadline import Cancelled, DeadlineExceeded, DeadlineExecutor
+from .http_transport import HTTPTransport
+from .image_preprocessor import ImagePreprocessor
+from .rate_limiter import RETRY_STATUSES
+from .singleflight import SingleFlight, make_key
 
 
 class ImageHandler:
@@ -10,77 +16,116 @@ class ImageHandler:
     
     Attributes:
         api_key (str): The OpenAI API key.
+        transport (HTTPTransport): The pooled HTTP transport used for API calls and downloads.
+        download_workers (int): The maximum number of images downloaded in parallel.
+        download_retries (int): The number of times a failed download is retried.
+        preprocessor (ImagePreprocessor): Prepares variation sources before they are uploaded.
+        singleflight (SingleFlight): Coalesces identical image generations in flight.
     """
-    def __init__(self, api_key):
+    def __init__(self, api_key, transport=None, download_workers=4, download_retries=3, api_base="https://api.openai.com/v1",
+                 preprocessor=None):
         """
         Initialize the ImageHandler with the given API key.
         """
         self.api_key = api_key
-        self.endpoint_generation = "https://api.openai.com/v1/images/generations"
-        self.endpoint_variation = "https://api.openai.com/v1/images/variations"
+        self.transport = transport if transport is not None else HTTPTransport()
+        api_base = api_base.rstrip("/")
+        self.endpoint_generation = f"{api_base}/images/generations"
+        self.endpoint_variation = f"{api_base}/images/variations"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}"
         }
         self.image_sizes = {"small": "256x256", "medium": "512x512", "large": "1024x1024"}
+        self.download_workers = download_workers
+        self.download_retries = download_retries
+        self.preprocessor = preprocessor if preprocessor is not None else ImagePreprocessor()
+        self.singleflight = SingleFlight()
 
-    def _send_request(self, endpoint, data, files=None):
+    def request_images(self, n=1, size="medium", response_format="url", prompt=None, image=None, path_for=None):
         """
-        Send a request to the OpenAI API endpoint with the provided data.
+        Send a single generation request, or a variation request when a source image is given,
+        without downloading the results.
+        
+        Args:
+            n (int, optional): The number of images to request. Defaults to 1.
+            size (str, optional): "small", "medium" or "large". Defaults to "medium".
+            response_format (str, optional): "url" or "b64_json". Defaults to "url".
+            prompt (str, optional): The prompt of a generation.
+            image (tuple, optional): The file name and the prepared PNG bytes of a variation source.
+            path_for (callable, optional): Returns the file path of the image at the given index,
+                required with "b64_json".
         
         Returns:
-            list: A list containing the JSON response data.
+            list: With "url", the image entries of the response, to pass to save_images.
+            With "b64_json", the file paths where the images are saved.
+        
+        Raises:
+            requests.exceptions.RequestException: If the request fails.
+            ValueError: If the response cannot be read.
         """
-        try:
-            headers = self.headers.copy()
+        headers = self.headers.copy()
+        data = {
+            "size": self.image_sizes[size],
+            "n": n,
+            "response_format": response_format,
+        }
+        if image is None:
+            data["model"] = "image-alpha-001"
+            data["prompt"] = prompt
             headers["Content-Type"] = "application/json"
-            response = requests.post(endpoint, headers=headers, json=data, files=files)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            print(f"Error making request to OpenAI API: {e}")
-            return []
+            endpoint, kind, kwargs = self.endpoint_generation, "image_generation", {"json": data}
+        else:
+            files = {"image": (image[0], image[1], "image/png")}
+            endpoint, kind, kwargs = self.endpoint_variation, "image_variation", {"data": data, "files": files}
+
+        if response_format == "b64_json":
+            return self._save_b64_images(endpoint, kind, path_for, headers=headers, **kwargs)
 
+        response = self.transport.api_request("POST", endpoint, kind=kind, headers=headers, **kwargs)
+        response.raise_for_status()
         try:
             return response.json()["data"]
-        except Exception as e:
-            print(f"Error processing OpenAI API response: {e}")
-            return []
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Error processing OpenAI API response: {e}")
 
     def generate_image(self, prompt, size="medium", n=1, response_format="url", save_path=None):
         """
         Generate an image based on the given prompt and save it to the specified location.
+        With response_format="b64_json" the images are decoded from the response as it arrives,
+        without a download per image. Identical generations made while one is in flight share
+        its images instead of being sent again.
         
         Returns:
             list: A list of file paths where the generated images are saved.
         """
-        data = {
-            "model": "image-alpha-001",
-            "prompt": prompt,
-            "size": self.image_sizes[size],
-            "n": n,
-            "response_format": response_format,
-        }
+        save_path = save_path or os.getcwd()
+        key = make_key(self.endpoint_generation, prompt, size, n, response_format, save_path)
+        return self.singleflight.do(key, lambda: self._generate_image(prompt, size, n, response_format, save_path))
 
-        try:
-            response = self._send_request(self.endpoint_generation, data)
-        except Exception as e:
-            print(f"Error generating image: {e}")
-            return []
+    def _generate_image(self, prompt, size, n, response_format, save_path):
+        """
+        Send a generation request and save its images.
         
+        Returns:
+            list: A list of file paths where the generated images are saved.
+        """
         timestamp = datetime.now().strftime("%Y:%m-%d-%H:%M:%S")
-        save_paths = []
-
-        if save_path is None:
-            save_path = os.getcwd()
+        path_for = lambda i: os.path.join(save_path, f"gpt-generate-{i}-{timestamp}.png")
 
-        if response:
-            for i, image_url in enumerate(response):
-                save_paths.append(self.save_image(image_url, os.path.join(save_path, f"gpt-generate-{i}-{timestamp}.png")))
+        try:
+            images = self.request_images(n, size, response_format, prompt=prompt, path_for=path_for)
+        except (requests.exceptions.RequestException, OSError, ValueError) as e:
+            print(f"Error generating image: {e}")
+            return []
 
-        return save_paths
+        if response_format == "b64_json":
+            return images
+        return self.save_images(images, [path_for(i) for i in range(len(images))])
 
     def generate_variation(self, image_name, n=1, size="medium", response_format="url", save_path=None):
         """
         Generate a variation of the given image and save it to the specified location.
+        The image is made square, downscaled to the requested size and encoded as PNG before upload.
         
         Returns:
             list: A list of file paths where the generated image variations are saved.
@@ -90,47 +135,321 @@ class ImageHandler:
         else:
             current_folder = os.getcwd()
             image_path = os.path.join(current_folder, image_name)
+        timestamp = datetime.now().strftime("%Y:%m-%d-%H:%M:%S")
+        save_path = save_path or os.getcwd()
+        path_for = lambda i: os.path.join(save_path, f"gpt-variation-{i}-{timestamp}.png")
+
         try:
-            with open(image_path, 'rb') as image_file:
-                data = {
-                    "n": n,
-                    "size": self.image_sizes[size],
-                    "response_format": response_format,
-                }
-                files = {"image": image_file}
-                headers = self.headers.copy()
-                response = requests.post(self.endpoint_variation, headers=headers, data=data, files=files)
-                response.raise_for_status()
-
-                timestamp = datetime.now().strftime("%Y:%m-%d-%H:%M:%S")
-                save_paths = []
-
-                if save_path is None:
-                    save_path = os.getcwd()
-
-                if response.json()["data"]:
-                    for i, image_url in enumerate(response.json()["data"]):
-                        save_paths.append(self.save_image(image_url, os.path.join(save_path, f"gpt-variation-{i}-{timestamp}.png")))
-
-            return save_paths
+            images = self.request_images(n, size, response_format, image=self.prepare_source(image_path, size),
+                                         path_for=path_for)
         except Exception as e:
             print(f"Error generating image variation: {e}")
             return []
 
-    def save_image(self, url, file_path, timeout=30):
+        if response_format == "b64_json":
+            return images
+        return self.save_images(images, [path_for(i) for i in range(len(images))])
+
+    def prepare_source(self, image_path, size="medium"):
+        """
+        Read a variation source and prepare it for upload.
+        
+        Returns:
+            tuple: The upload file name and the PNG bytes.
+        
+        Raises:
+            OSError: If the image cannot be read.
+            ValueError: If the image cannot be used for a variation.
+        """
+        with open(image_path, 'rb') as image_file:
+            image_bytes = self.preprocessor.prepare(image_file.read(), self.image_sizes[size])
+        return os.path.splitext(os.path.basename(image_path))[0] + ".png", image_bytes
+
+    def _save_b64_images(self, endpoint, kind, path_for, chunk_size=64 * 1024, **kwargs):
+        """
+        Send an image request with response_format="b64_json" and decode every image in the
+        streamed response straight to its file, so the base64 payload is never held in memory.
+        
+        Args:
+            path_for (callable): Returns the file path of the image at the given index.
+        
+        Returns:
+            list: The file paths where the images are saved.
+        """
+        response = self.transport.api_request("POST", endpoint, kind=kind, stream=True, **kwargs)
+        writer = _Base64ImageWriter(path_for)
+        try:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                self.transport.check_deadline()
+                writer.feed(chunk)
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+        finally:
+            self.transport.finish(response)
+            response.close()
+        return writer.paths
+
+    def save_images(self, urls, file_paths):
+        """
+        Download several images in parallel with a bounded thread pool, within the deadline of
+        the calling command. Ctrl-C aborts the downloads in flight and drops the queued ones.
+        
+        Returns:
+            list: The file paths where the images are saved, in the order of the given URLs.
+        """
+        if len(urls) <= 1 or self.download_workers <= 1:
+            return [self.save_image(url, file_path) for url, file_path in zip(urls, file_paths)]
+
+        with DeadlineExecutor(max_workers=min(self.download_workers, len(urls))) as executor:
+            return list(executor.map(self.save_image, urls, file_paths))
+
+    def save_image(self, url, file_path, timeout=None):
         """
         Save the image from the provided URL to the specified file path.
         
+        The image is streamed to a temporary ".part" file and renamed into place once complete.
+        Downloads failing with a connection error, a timeout, a truncated transfer or a retryable
+        status are retried, resuming partial transfers with an HTTP Range request, as long as the
+        deadline of the command allows. The timeout defaults to the transport's.
+        
         Returns:
             str: The file path where the image is saved.
         """
-        try:
-            with urllib.request.urlopen(url['url'], timeout=timeout) as response, open(file_path,'wb') as out_file:
-                out_file.write(response.read())
+        part_path = f"{file_path}.part"
+        for attempt in range(self.download_retries + 1):
+            try:
+                self._download(url['url'], part_path, timeout)
+                os.replace(part_path, file_path)
                 print(f"\nSaved image to {file_path}")
                 return file_path
-        except Exception as e:
-            print(f"An error occurred while saving the image: {e}")
+            except (requests.exceptions.RequestException, OSError) as e:
+                delay = 0.5 * 2 ** attempt
+                deadline = self.transport.current_deadline
+                if attempt == self.download_retries or not _is_retryable(e) or \
+                        (deadline is not None and not deadline.allows(delay)):
+                    print(f"An error occurred while saving the image: {e}")
+                    break
+                time.sleep(delay)
+
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+
+    def _download(self, url, part_path, timeout, chunk_size=64 * 1024):
+        """
+        Stream a download to the given file in chunks, continuing from the bytes already on disk.
+        """
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        with self.transport.get(url, kind="download", headers=headers, stream=True, timeout=timeout) as response:
+            if offset and response.status_code == 416:
+                self.transport.finish(response)
+                return
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0
+
+            expected = None if "Content-Encoding" in response.headers else response.headers.get("Content-Length")
+            written = 0
+            try:
+                with open(part_path, "ab" if offset else "wb") as out_file:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        self.transport.check_deadline()
+                        out_file.write(chunk)
+                        written += len(chunk)
+            finally:
+                self.transport.finish(response)
+
+            if expected is not None and written < int(expected):
+                raise IncompleteDownload(f"Incomplete download, received {written} of {expected} bytes")
+
+
+class IncompleteDownload(IOError):
+    """
+    Raised when a download ends before the announced number of bytes was received.
+    """
+
+
+def _is_retryable(error):
+    """
+    Tell whether a failed download may succeed when tried again: after a connection error, a
+    timeout, a truncated transfer or a status the API requests are retried on, but not after a
+    client error such as an expired URL, a local file error, the deadline passing or Ctrl-C.
+
+    Returns:
+        bool: True if the download should be retried.
+    """
+    if isinstance(error, (DeadlineExceeded, Cancelled)):
+        return False
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUSES
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                              requests.exceptions.ChunkedEncodingError, IncompleteDownload))
+
+
+# The JSON string escapes and what they stand for. Only "\/" and line breaks are expected in base64.
+_JSON_ESCAPES = {b"/": b"/", b"\\": b"\\", b'"': b'"', b"b": b"\b", b"f": b"\f", b"n": b"\n", b"r": b"\r", b"t": b"\t"}
+
+
+class _Base64ImageWriter:
+    """
+    Scan an image API response body chunk by chunk and decode every "b64_json" value into its own
+    file as it arrives. Each image goes to a ".part" file that is renamed into place once complete.
+    JSON escapes and line breaks within the value are resolved, even when split across chunks, and
+    anything else that is not base64 is rejected.
+    
+    Attributes:
+        path_for (callable): Returns the file path of the image at the given index.
+        paths (list): The file paths of the images saved so far.
+    """
+    MARKER = b'"b64_json"'
+
+    def __init__(self, path_for):
+        """
+        Initialize the _Base64ImageWriter.
+        """
+        self.path_for = path_for
+        self.paths = []
+        self._pending = b""
+        self._carry = b""
+        self._escape = b""
+        self._state = "search"
+        self._file = None
+        self._path = None
+
+    def feed(self, chunk):
+        """
+        Process the next chunk of the response body.
+        """
+        data = self._pending + chunk
+        self._pending = b""
+        position = 0
+        while position < len(data):
+            if self._state == "search":
+                found = data.find(self.MARKER, position)
+                if found == -1:
+                    self._pending = data[max(position, len(data) - len(self.MARKER) + 1):]
+                    return
+                position = found + len(self.MARKER)
+                self._state = "value"
+            elif self._state == "value":
+                while position < len(data) and data[position] in b" \t\r\n:":
+                    position += 1
+                if position == len(data):
+                    return
+                if data[position] != ord('"'):
+                    raise ValueError("Malformed b64_json value in the API response")
+                position += 1
+                self._start_image()
+            else:
+                end = data.find(b'"', position)
+                payload = data[position:] if end == -1 else data[position:end]
+                self._write(payload)
+                if end == -1:
+                    return
+                self._finish_image()
+                position = end + 1
+
+    def close(self):
+        """
+        Check that the response did not end in the middle of an image.
+
+        Raises:
+            ValueError: If the response ended before the last image was complete.
+        """
+        if self._state != "search":
+            raise ValueError("Truncated b64_json value in the API response")
+
+    def abort(self):
+        """
+        Close and remove the image being written.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            try:
+                os.remove(f"{self._path}.part")
+            except OSError:
+                pass
+
+    def _start_image(self):
+        """
+        Open the file of the next image.
+        """
+        self._path = self.path_for(len(self.paths))
+        self._file = open(f"{self._path}.part", "wb")
+        self._carry = b""
+        self._state = "string"
+
+    def _write(self, payload):
+        """
+        Decode whole base64 quads of the payload and keep the remainder for the next chunk.
+
+        Raises:
+            ValueError: If the payload is not base64.
+        """
+        data = self._carry + b"".join(self._unescape(payload).split())
+        usable = len(data) - len(data) % 4
+        self._file.write(base64.b64decode(data[:usable], validate=True))
+        self._carry = data[usable:]
+
+    def _unescape(self, payload):
+        """
+        Resolve the JSON escapes of a piece of a string value. An escape cut off at the end of the
+        piece is kept for the next one.
+
+        Returns:
+            bytes: The unescaped piece.
+
+        Raises:
+            ValueError: If the piece holds an invalid escape.
+        """
+        data = self._escape + payload
+        self._escape = b""
+        if b"\\" not in data:
+            return data
+        unescaped = bytearray()
+        position = 0
+        while True:
+            found = data.find(b"\\", position)
+            if found == -1:
+                unescaped += data[position:]
+                return bytes(unescaped)
+            unescaped += data[position:found]
+            kind = data[found + 1:found + 2]
+            length = 6 if kind == b"u" else 2
+            if found + length > len(data):
+                self._escape = data[found:]
+                return bytes(unescaped)
+            if kind == b"u":
+                try:
+                    unescaped += chr(int(data[found + 2:found + 6], 16)).encode("utf-8")
+                except ValueError:
+                    raise ValueError("Malformed escape in the b64_json value of the API response")
+            elif kind in _JSON_ESCAPES:
+                unescaped += _JSON_ESCAPES[kind]
+            else:
+                raise ValueError("Malformed escape in the b64_json value of the API response")
+            position = found + length
+
+    def _finish_image(self):
+        """
+        Write the last bytes of the image and move it into place.
+        """
+        if self._carry or self._escape:
+            raise ValueError("Truncated b64_json value in the API response")
+        self._file.close()
+        self._file = None
+        os.replace(f"{self._path}.part", self._path)
+        print(f"\nSaved image to {self._path}")
+        self.paths.append(self._path)
+        self._state = "search"
+
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,263 @@
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from .deadline import DeadlineExecutor
+from .image_handler import ImageHandler
+
+
+# The most images the API returns for one request, larger counts are split over several requests.
+MAX_IMAGES_PER_REQUEST = 10
+
+SOURCE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif")
+
+
+class ImagePipeline:
+    """
+    Generate images for a file of prompts, or variations of every image in a directory, keeping
+    the API busy: source preparation, API requests and downloads run as overlapping stages on
+    their own bounded thread pools, so a download never holds up the next request.
+
+    Output files are named after their input, for example "0003-a-red-fox-1.png" for the second
+    image of the prompt on line 3, and every finished input is recorded in "manifest.jsonl" in the
+    output directory with its image count and size. A rerun skips the inputs of the manifest made
+    with the same count and size whose files still exist.
+
+    Attributes:
+        handler (ImageHandler): The ImageHandler used for the requests and downloads.
+        concurrency (int): The maximum number of API requests in flight.
+        download_workers (int): The maximum number of downloads in flight.
+        max_per_request (int): The most images requested at once.
+        on_complete (callable): Called with the manifest record and the elapsed seconds of every
+            finished input, as soon as it finishes.
+        on_error (callable): Called with the prompt or source path, the error message and the
+            elapsed seconds of every failed input.
+    """
+    MANIFEST_NAME = "manifest.jsonl"
+
+    def __init__(self, handler, concurrency=4, download_workers=8, max_per_request=MAX_IMAGES_PER_REQUEST,
+                 on_complete=None, on_error=None):
+        """
+        Initialize the ImagePipeline with an ImageHandler and its concurrency limits.
+        """
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.download_workers = max(1, download_workers)
+        self.max_per_request = max(1, max_per_request)
+        self.on_complete = on_complete
+        self.on_error = on_error
+
+    def generate(self, prompts_path, output_dir, n=1, size="medium", response_format="url", resume=True):
+        """
+        Generate n images for every prompt of a text file, one prompt per line. Blank lines and
+        lines starting with "#" are skipped.
+
+        Returns:
+            dict: The number of completed, failed and skipped inputs, the number of images and the elapsed time.
+        """
+        inputs = []
+        with open(prompts_path, "r", encoding="utf-8") as prompts_file:
+            for line_number, line in enumerate(prompts_file, start=1):
+                prompt = line.strip()
+                if prompt and not prompt.startswith("#"):
+                    inputs.append((f"{line_number:04d}-{_slug(prompt)}", prompt))
+        return self._run(inputs, output_dir, n, size, response_format, resume, variation=False)
+
+    def vary(self, input_dir, output_dir, n=1, size="medium", response_format="url", resume=True):
+        """
+        Generate n variations of every image in a directory, in file name order.
+
+        Returns:
+            dict: The number of completed, failed and skipped inputs, the number of images and the elapsed time.
+        """
+        names = sorted(name for name in os.listdir(input_dir)
+                       if name.lower().endswith(SOURCE_EXTENSIONS) and os.path.isfile(os.path.join(input_dir, name)))
+        stems = [os.path.splitext(name)[0] for name in names]
+        inputs = []
+        for name, stem in zip(names, stems):
+            # Sources sharing a stem, like cat.png and cat.jpg, keep their extension in the output name.
+            key = _slug(stem if stems.count(stem) == 1 else name)
+            inputs.append((key, os.path.abspath(os.path.join(input_dir, name))))
+        return self._run(inputs, output_dir, n, size, response_format, resume, variation=True)
+
+    def _run(self, inputs, output_dir, n, size, response_format, resume, variation):
+        """
+        Run every unfinished input through the stages and record each one in the manifest when
+        all of its images are saved.
+
+        Args:
+            inputs (list): The (key, prompt or source path) of every input, in order.
+            variation (bool): Whether the inputs are variation sources rather than prompts.
+
+        Returns:
+            dict: The number of completed, failed and skipped inputs, the number of images and the elapsed time.
+
+        Raises:
+            ValueError: If n is less than 1.
+        """
+        if n < 1:
+            raise ValueError(f"The number of images must be at least 1, got {n}")
+        os.makedirs(output_dir, exist_ok=True)
+        manifest_path = os.path.join(output_dir, self.MANIFEST_NAME)
+        manifest = self._load_manifest(manifest_path, output_dir) if resume else {}
+
+        stats = {"completed": 0, "failed": 0, "skipped": 0, "images": 0}
+        start = time.monotonic()
+        queue = []
+        for key, source in inputs:
+            record = manifest.get(key)
+            if record is not None and (record.get("n"), record.get("size")) == (n, size):
+                stats["skipped"] += 1
+            else:
+                queue.append(_Item(key, source, [os.path.join(output_dir, f"{key}-{i}.png") for i in range(n)], size))
+        queue.reverse()
+
+        pending = {}
+        active = 0
+        with open(manifest_path, "a" if resume else "w", encoding="utf-8") as manifest_file, \
+                DeadlineExecutor(max_workers=self.concurrency) as prepare_executor, \
+                DeadlineExecutor(max_workers=self.concurrency) as api_executor, \
+                DeadlineExecutor(max_workers=self.download_workers) as download_executor:
+            while queue or pending:
+                # Keep a second round of inputs ready, so a finished request is replaced at once.
+                while queue and active < self.concurrency * 2:
+                    item = queue.pop()
+                    item.start = time.monotonic()
+                    active += 1
+                    if variation:
+                        pending[prepare_executor.submit(self.handler.prepare_source, item.source, size)] = ("prepare", item, None)
+                    else:
+                        self._submit_requests(api_executor, pending, item, size, response_format, None)
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, item, offset = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        item.error = item.error or f"{stage} failed: {e}"
+                        result = None
+
+                    if stage == "prepare" and result is not None:
+                        self._submit_requests(api_executor, pending, item, size, response_format, result)
+                    elif stage == "request" and result is not None and response_format == "url":
+                        for i, image in enumerate(result[:len(item.paths) - offset]):
+                            pending[download_executor.submit(self.handler.save_image, image, item.paths[offset + i])] = ("download", item, None)
+                    elif stage == "request" and result is not None:
+                        item.saved += [path for path in result if path]
+                    elif stage == "download" and result is not None:
+                        item.saved.append(result)
+
+                    if not any(entry[1] is item for entry in pending.values()):
+                        active -= 1
+                        self._finish(item, manifest_file, stats)
+
+        self._write_manifest(manifest_path, inputs, output_dir)
+        stats["elapsed"] = time.monotonic() - start
+        return stats
+
+    def _submit_requests(self, executor, pending, item, size, response_format, image):
+        """
+        Submit the API requests of an input, split so none asks for more than max_per_request images.
+        """
+        for offset in range(0, len(item.paths), self.max_per_request):
+            count = min(self.max_per_request, len(item.paths) - offset)
+            path_for = lambda i, offset=offset: item.paths[offset + i]
+            future = executor.submit(self.handler.request_images, count, size, response_format,
+                                     prompt=None if image else item.source, image=image, path_for=path_for)
+            pending[future] = ("request", item, offset)
+
+    def _finish(self, item, manifest_file, stats):
+        """
+        Record a finished input in the manifest, or report it as failed. Failed inputs are not
+        recorded, so a rerun retries them.
+        """
+        if item.error or len(item.saved) < len(item.paths):
+            stats["failed"] += 1
+            error = item.error or f"{len(item.saved)} of {len(item.paths)} images saved"
+            sys.stderr.write(f"\n{item.key} failed: {error}\n")
+            if self.on_error is not None:
+                self.on_error(item.source, error, time.monotonic() - item.start)
+            return
+        record = {"key": item.key, "input": item.source, "n": len(item.paths), "size": item.size,
+                  "outputs": [os.path.basename(path) for path in item.paths]}
+        manifest_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        manifest_file.flush()
+        if self.on_complete is not None:
+            self.on_complete(record, time.monotonic() - item.start)
+        stats["completed"] += 1
+        stats["images"] += len(item.paths)
+
+    @staticmethod
+    def _load_manifest(manifest_path, output_dir):
+        """
+        Read the inputs finished by previous runs whose output files still exist. An input run
+        again with another count or size keeps only its latest record.
+
+        Returns:
+            dict: The manifest records, keyed by input key.
+        """
+        records = {}
+        if not os.path.exists(manifest_path):
+            return records
+        with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+            for line in manifest_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if all(os.path.exists(os.path.join(output_dir, name)) for name in record.get("outputs", [])):
+                    records[record["key"]] = record
+        return records
+
+    @classmethod
+    def _write_manifest(cls, manifest_path, inputs, output_dir):
+        """
+        Rewrite the manifest in input order, so the same inputs always give the same manifest
+        whatever order the requests finished in.
+        """
+        records = cls._load_manifest(manifest_path, output_dir)
+        order = {key: index for index, (key, _) in enumerate(inputs)}
+        ordered = sorted(records.values(), key=lambda record: (order.get(record["key"], len(order)), record["key"]))
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as manifest_file:
+            for record in ordered:
+                manifest_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+
+class _Item:
+    """
+    The progress of one input through the pipeline.
+    """
+    def __init__(self, key, source, paths, size):
+        """
+        Initialize the _Item with its key, prompt or source path, output paths and image size.
+        """
+        self.key = key
+        self.source = source
+        self.paths = paths
+        self.size = size
+        self.saved = []
+        self.error = None
+        self.start = None
+
+
+def _slug(text, max_length=40):
+    """
+    Turn text into a short file name part.
+
+    Returns:
+        str: The lowercase words of the text joined by "-".
+    """
+    slug = "-".join(re.findall(r"\w+", text.lower()))[:max_length].strip("-_")
+    return slug or "image"
+
+
+if __name__ == "__main__":
+    try:
+        pipeline = ImagePipeline(ImageHandler("API_KEY"))
+        print(pipeline.generate("prompts.txt", "images", n=4))
+    except Exception as e:
+        print(f"Error initializing ImagePipeline or generating images: {e}")
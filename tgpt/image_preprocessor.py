@@ -0,0 +1,205 @@
+import hashlib
+import io
+import os
+import struct
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# The largest image the variations endpoint accepts.
+MAX_UPLOAD_BYTES = 4 * 1024 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def read_image_header(data):
+    """
+    Read the format and dimensions of an image from its header, without decoding it.
+
+    Returns:
+        tuple: The format name ("PNG", "JPEG", "GIF" or "WEBP") and the width and height,
+        which are None if they could not be read. The format is None for unknown files.
+    """
+    if data.startswith(PNG_SIGNATURE) and data[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", data[16:24])
+        return "PNG", width, height
+    if data.startswith(b"GIF87a") or data.startswith(b"GIF89a"):
+        width, height = struct.unpack("<HH", data[6:10])
+        return "GIF", width, height
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP", None, None
+    if data.startswith(b"\xff\xd8"):
+        position = 2
+        while position + 9 < len(data):
+            if data[position] != 0xFF:
+                break
+            marker = data[position + 1]
+            length = struct.unpack(">H", data[position + 2:position + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[position + 5:position + 9])
+                return "JPEG", width, height
+            position += 2 + length
+        return "JPEG", None, None
+    return None, None, None
+
+
+class ImagePreprocessor:
+    """
+    Prepare source images for the variations endpoint before they are uploaded: validate them,
+    make them square, downscale them to the requested size and encode them as PNG in memory.
+
+    Results are cached on disk by the hash of the source image and the settings, so repeated
+    variations of the same image skip the work. Without Pillow, images are only validated from
+    their header and uploaded unchanged.
+
+    Attributes:
+        fit (str): How non-square images are made square: "crop" to the center or "pad" with transparency.
+        cache_dir (str): The directory of cached results, or None to disable the cache.
+        max_cache_entries (int): The number of cached results kept.
+    """
+    FITS = ("crop", "pad")
+
+    def __init__(self, fit="crop", cache_dir="~/.tgpt/cache/images", max_cache_entries=256):
+        """
+        Initialize the ImagePreprocessor.
+        """
+        if fit not in self.FITS:
+            raise ValueError(f"Unknown image fit: {fit}, use one of {', '.join(self.FITS)}")
+        self.fit = fit
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        self.max_cache_entries = max_cache_entries
+
+    def prepare(self, data, size):
+        """
+        Turn source image bytes into the square PNG to upload.
+
+        Args:
+            data (bytes): The source image file contents.
+            size (str): The target size, for example "512x512".
+
+        Returns:
+            bytes: The PNG to upload.
+
+        Raises:
+            ValueError: If the image cannot be used for a variation.
+        """
+        if Image is None:
+            return self._validate(data)
+
+        key = hashlib.sha256(data + f"|{size}|{self.fit}".encode()).hexdigest()
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        result = self._process(data, int(size.split("x")[0]))
+        self._cache_set(key, result)
+        return result
+
+    def _process(self, data, target):
+        """
+        Decode, square, downscale and re-encode an image with Pillow.
+
+        Returns:
+            bytes: The encoded PNG.
+        """
+        try:
+            image = Image.open(io.BytesIO(data))
+            # JPEGs are decoded at the smallest scale still covering the target, which is much faster.
+            image.draft("RGB", (target, target))
+            image.load()
+        except Exception as e:
+            raise ValueError(f"Unreadable image: {e}")
+        if not image.width or not image.height:
+            raise ValueError("The image is empty")
+
+        transparent = self.fit == "pad" or "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if transparent else "RGB")
+        side = min(image.width, image.height) if self.fit == "crop" else max(image.width, image.height)
+        if self.fit == "crop":
+            left = (image.width - side) // 2
+            top = (image.height - side) // 2
+            image = image.crop((left, top, left + side, top + side))
+        elif image.width != image.height:
+            canvas = Image.new("RGBA", (side, side), (0, 0, 0, 0))
+            canvas.paste(image, ((side - image.width) // 2, (side - image.height) // 2))
+            image = canvas
+
+        if side > target:
+            image = image.resize((target, target), Image.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, format="PNG")
+        result = output.getvalue()
+        if len(result) > MAX_UPLOAD_BYTES:
+            raise ValueError(f"The processed image is {len(result) // 1024} KB, over the {MAX_UPLOAD_BYTES // 1024 // 1024} MB limit")
+        return result
+
+    @staticmethod
+    def _validate(data):
+        """
+        Check an image from its header when Pillow is not available.
+
+        Returns:
+            bytes: The unchanged image.
+        """
+        image_format, width, height = read_image_header(data)
+        if image_format is None:
+            raise ValueError("Unsupported image format, use a PNG")
+        if image_format != "PNG":
+            raise ValueError(f"{image_format} images must be converted to PNG first, or install Pillow to convert them automatically")
+        if width != height:
+            raise ValueError(f"The image is {width}x{height} but must be square, or install Pillow to crop it automatically")
+        if len(data) > MAX_UPLOAD_BYTES:
+            raise ValueError(f"The image is {len(data) // 1024} KB, over the {MAX_UPLOAD_BYTES // 1024 // 1024} MB limit")
+        return data
+
+    def _cache_get(self, key):
+        """
+        Retrieve a cached result, marking it as recently used.
+
+        Returns:
+            bytes: The cached PNG, or None on a cache miss.
+        """
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self.cache_dir, f"{key}.png")
+        try:
+            with open(path, "rb") as cached_file:
+                data = cached_file.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _cache_set(self, key, data):
+        """
+        Store a result in the cache and drop the least recently used entries over the limit.
+        """
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = os.path.join(self.cache_dir, f"{key}.png")
+            with open(f"{path}.tmp", "wb") as cached_file:
+                cached_file.write(data)
+            os.replace(f"{path}.tmp", path)
+
+            entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".png")]
+            if len(entries) > self.max_cache_entries:
+                entries.sort(key=lambda entry: entry.stat().st_mtime)
+                for entry in entries[:len(entries) - self.max_cache_entries]:
+                    os.remove(entry.path)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    try:
+        preprocessor = ImagePreprocessor()
+        with open("path/to/image.png", "rb") as image_file:
+            print(len(preprocessor.prepare(image_file.read(), "512x512")))
+    except Exception as e:
+        print(f"Error initializing ImagePreprocessor or preparing image: {e}")
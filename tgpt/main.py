@@ -1,7 +1,14 @@
 import argparse
-from .gpt_client import GPTClient
-from .commandline_interface import CommandLineInterface
-from .config_handler import ConfigHandler
+import contextlib
+import os
+import sys
+
+
+SUBCOMMANDS = ("tx", "gi", "gv", "batch", "serve", "search", "embed")
+
+# Subcommands forwarded to a running daemon when one is available.
+DAEMON_COMMANDS = ("tx", "gi", "gv")
+
 
 class CustomArgumentParser(argparse.ArgumentParser):
     """
@@ -15,29 +22,156 @@ class CustomArgumentParser(argparse.ArgumentParser):
         print("\nError: {}\n".format(message))
         self.exit()
 
-def main():
+
+def _add_tx_arguments(parser_tx):
     """
-    The main function for the command-line interface to interact with OpenAI's GPT-3.5 API.
-    This function handles command-line arguments and calls the appropriate methods based on the input.
+    Add the arguments of the tx subcommand.
     """
-    
-    # Read config file and load values
-    try:
-        config = ConfigHandler()
-        api_key = config.get_api_key()
-        model = config.get_model()
-        tokens = config.get_max_tokens()
-        temperature = config.get_temperature()
-        image_size = config.get_image_size()
-        width = config.get_width()
-        number = config.get_number()
-        client = GPTClient(api_key, model)
-        cli = CommandLineInterface(client)
-    except Exception as e:
-        print(f"Error loading config values, initializing GPTClient or CommandLineInterface: {e}")
-        return
+    parser_tx.description = ("Query GPT with a question or statement and get an answer.\n"
+                             "Use - as the prompt to read it from stdin, or --file to apply the prompt to a file of any size:\n"
+                             "large input is split into chunks processed concurrently, and their results combined.")
+    parser_tx.formatter_class = argparse.RawDescriptionHelpFormatter
+    parser_tx.usage = "usage: tgpt tx prompt [-h] [-n NUM] [-t TEMP] [-m MAX] [--stream] [--no-cache] [--json] [--file PATH] [-j JOBS]"
+    parser_tx.add_argument("prompt", type=str, help="Text query to send to GPT-3.5, or - to read the input from stdin")
+    parser_tx.add_argument("-n", "--num", type=int, default=None, help="Number of responses to generate (Default: NUMBER in config)")
+    parser_tx.add_argument("-t", "--temp", type=float, default=None, help="Sampling temperature for generating responses (Default: TEMPERATURE in config)")
+    parser_tx.add_argument("--json", action="store_true", help="Write one JSON object per result line (Default when stdout is not a terminal)")
+    parser_tx.add_argument("-m", "--max", type=int, default=None, help="The maximum number of tokens to generate for completions (Default: MAX_TOKENS in config)")
+    parser_tx.add_argument("--stream", action="store_true", help="Print the answer as it is generated")
+    parser_tx.add_argument("--no-cache", action="store_true", help="Bypass the response cache for this request")
+    parser_tx.add_argument("--file", type=str, default=None, metavar="PATH", help="Apply the prompt to a file, or - for stdin")
+    parser_tx.add_argument("-j", "--jobs", type=int, default=None, help="Number of chunks processed concurrently for large input (Default: BATCH_CONCURRENCY in config)")
+
+
+def _add_gi_arguments(parser_gi):
+    """
+    Add the arguments of the gi subcommand.
+    """
+    parser_gi.description = ("Generate images from text prompt.\n"
+                             "With --from-file, generate images for every line of a prompt file into the output directory, recording\n"
+                             "them in its manifest.jsonl so interrupted runs resume where they stopped.")
+    parser_gi.formatter_class = argparse.RawDescriptionHelpFormatter
+    parser_gi.usage = ("usage: tgpt gi prompt [save_path] [-h] [-s {small,medium,large}] [-n NUM] [-t TEMP] [--json]\n"
+                       "       tgpt gi --from-file FILE [-o DIR] [-j JOBS] [--restart] ...")
+    parser_gi.add_argument("prompt", nargs="?", default=None, help="The text prompt to generate an image")
+    parser_gi.add_argument("save_path", nargs="?", default=None, help="Path to save the generated image (default: current directory)")
+    parser_gi.add_argument("-s", "--size", choices=["small", "medium", "large"], default=None, help="The size of the generated image (default: IMAGE_SIZE in config)")
+    parser_gi.add_argument("-n", "--num", type=int, default=None, help="The number of images to generate (default: NUMBER in config)")
+    parser_gi.add_argument("-t", "--temp", type=float, default=None, help="Sampling temperature for generating responses (Default: TEMPERATURE in config)")
+    parser_gi.add_argument("--json", action="store_true", help="Write one JSON object per result line (Default when stdout is not a terminal)")
+    parser_gi.add_argument("-f", "--format", choices=["url", "b64_json"], default=None, help="How the API returns the images (Default: IMAGE_FORMAT in config)")
+    parser_gi.add_argument("--from-file", type=str, default=None, metavar="FILE", help="Generate images for every prompt of a text file, one per line")
+    _add_bulk_arguments(parser_gi)
+
+
+def _add_gv_arguments(parser_gv):
+    """
+    Add the arguments of the gv subcommand.
+    """
+    parser_gv.description = ("Generate variations of already existing image.\n"
+                             "With --dir, generate variations of every image in a directory into the output directory, recording\n"
+                             "them in its manifest.jsonl so interrupted runs resume where they stopped.")
+    parser_gv.formatter_class = argparse.RawDescriptionHelpFormatter
+    parser_gv.usage = ("usage: tgpt gv image_path [save_path] [-h] [-s {small,medium,large}] [-n NUM] [-t TEMP] [--json]\n"
+                       "       tgpt gv --dir DIR [-o DIR] [-j JOBS] [--restart] ...")
+    parser_gv.add_argument("image_name", type=str, nargs="?", default=None, help="Path to the input image for generating a variation")
+    parser_gv.add_argument("save_path", type=str, nargs="?", default="", help="Optional save path for the generated images (default: current directory)")
+    parser_gv.add_argument("-s", "--size", type=str, choices=["small", "medium", "large"], default=None, help="Size of the generated image (Default: IMAGE_SIZE in config)")
+    parser_gv.add_argument("-n", "--num", type=int, default=None, help="Number of image variations to generate (Default: NUMBER in config)")
+    parser_gv.add_argument("-t", "--temp", type=float, default=None, help="Sampling temperature for generating responses (Default: TEMPERATURE in config)")
+    parser_gv.add_argument("--json", action="store_true", help="Write one JSON object per result line (Default when stdout is not a terminal)")
+    parser_gv.add_argument("-f", "--format", choices=["url", "b64_json"], default=None, help="How the API returns the images (Default: IMAGE_FORMAT in config)")
+    parser_gv.add_argument("--dir", type=str, default=None, help="Generate variations of every image in a directory")
+    _add_bulk_arguments(parser_gv)
+
+
+def _add_bulk_arguments(parser):
+    """
+    Add the arguments shared by the bulk modes of the gi and gv subcommands.
+    """
+    parser.add_argument("-o", "--output-dir", type=str, default=None, metavar="DIR", help="Directory to write the images and manifest to in bulk mode (Default: current directory)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of API requests to run concurrently in bulk mode (Default: BATCH_CONCURRENCY in config)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the manifest and regenerate every image in bulk mode")
+
+
+def _add_batch_arguments(parser_batch):
+    """
+    Add the arguments of the batch subcommand.
+    """
+    parser_batch.description = ("Send every prompt in a JSONL file and write the answers to an output JSONL file.\n"
+                                "Each line holds a \"prompt\" and optional \"id\", \"model\", \"temperature\", \"max_tokens\" and \"n\" keys.\n"
+                                "Interrupted runs resume from the checkpoint next to the output file.")
+    parser_batch.formatter_class = argparse.RawDescriptionHelpFormatter
+    parser_batch.usage = "usage: tgpt batch input output [-h] [-j JOBS] [-t TEMP] [-m MAX] [--restart] [--no-cache]"
+    parser_batch.add_argument("input", type=str, help="Path to the JSONL file with the prompts")
+    parser_batch.add_argument("output", type=str, help="Path to the JSONL file to write the results to")
+    parser_batch.add_argument("-j", "--jobs", type=int, default=None, help="Number of requests to run concurrently (Default: BATCH_CONCURRENCY in config)")
+    parser_batch.add_argument("-t", "--temp", type=float, default=None, help="Sampling temperature for lines without one (Default: TEMPERATURE in config)")
+    parser_batch.add_argument("-m", "--max", type=int, default=None, help="The maximum number of tokens for lines without one (Default: MAX_TOKENS in config)")
+    parser_batch.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    parser_batch.add_argument("--no-cache", action="store_true", help="Bypass the response cache for this run")
+
+
+def _add_serve_arguments(parser_serve):
+    """
+    Add the arguments of the serve subcommand.
+    """
+    parser_serve.description = ("Run a daemon that keeps warm clients, connections and caches, and serves tx, gi and gv\n"
+                                "requests from other tgpt invocations over a Unix domain socket.")
+    parser_serve.formatter_class = argparse.RawDescriptionHelpFormatter
+    parser_serve.usage = "usage: tgpt serve [-h] [--socket PATH] [--idle-timeout SECONDS]"
+    parser_serve.add_argument("--socket", type=str, default=None, help="Path of the Unix domain socket (Default: DAEMON_SOCKET in config)")
+    parser_serve.add_argument("--idle-timeout", type=float, default=None, help="Exit after this many idle seconds, 0 to never exit (Default: DAEMON_IDLE_TIMEOUT in config)")
+
+
+def _add_search_arguments(parser_search):
+    """
+    Add the arguments of the search subcommand.
+    """
+    parser_search.description = "Search past answers and generated images, best matches first"
+    parser_search.usage = "usage: tgpt search query [-h] [-l LIMIT] [-k {text,image,variation}]"
+    parser_search.add_argument("query", nargs="+", help="The words to search for")
+    parser_search.add_argument("-l", "--limit", type=int, default=10, help="The maximum number of results (Default: 10)")
+    parser_search.add_argument("-k", "--kind", choices=["text", "image", "variation"], default=None, help="Only show results of this kind")
+
+
+def _add_embed_arguments(parser_embed):
+    """
+    Add the arguments of the embed subcommand.
+    """
+    parser_embed.description = ("Embed files, directories or stdin into the embedding index used for retrieval in chat mode.\n"
+                                "Files already indexed are skipped unless they changed. With --query, search the index instead.")
+    parser_embed.formatter_class = argparse.RawDescriptionHelpFormatter
+    parser_embed.usage = "usage: tgpt embed [paths ...] [-h] [-j JOBS] [--rebuild]\n       tgpt embed --query QUERY [-k K]"
+    parser_embed.add_argument("paths", nargs="*", help="Files or directories to embed, or - for stdin (Default: stdin)")
+    parser_embed.add_argument("-j", "--jobs", type=int, default=None, help="Number of requests to run concurrently (Default: BATCH_CONCURRENCY in config)")
+    parser_embed.add_argument("--rebuild", action="store_true", help="Empty the index before embedding")
+    parser_embed.add_argument("-q", "--query", type=str, default=None, help="Search the index for the chunks most similar to a query")
+    parser_embed.add_argument("-k", "--top", type=int, default=5, help="The number of search results (Default: 5)")
+
+
+SUBCOMMAND_PARSERS = {
+    "tx": ("Send a text query to GPT-3.5", _add_tx_arguments),
+    "gi": ("Generate an image based on the given text prompt", _add_gi_arguments),
+    "gv": ("Generate a variation of an existing image", _add_gv_arguments),
+    "batch": ("Run a JSONL file of prompts concurrently", _add_batch_arguments),
+    "serve": ("Run a daemon that serves requests from other tgpt invocations", _add_serve_arguments),
+    "search": ("Search past answers and generated images", _add_search_arguments),
+    "embed": ("Embed documents for retrieval in chat mode", _add_embed_arguments),
+}
+
+
+def build_parser(argv=None):
+    """
+    Build the argument parser. Only the subcommand named on the command line gets its arguments,
+    the others are registered with their help text alone.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    selected = next((arg for arg in argv if not arg.startswith("-")), None)
 
-    # Create an ArgumentParser object to handle command line arguments
     parser = argparse.ArgumentParser(
         description="A command-line interface to chat with OpenAI GPT-3.5, and generate images based on prompts or variations.\n\n"
                     "To see detailed help for each subcommand, run: tgpt <subcommand> -h\n"
@@ -46,84 +180,294 @@ def main():
         formatter_class=argparse.RawTextHelpFormatter,
         add_help=False,
     )
-    subparsers = parser.add_subparsers(dest="subparser_name", title="subcommands", metavar="{tx, gi, gv}")
-
-    # Add subparser for text query
-    parser_tx = subparsers.add_parser("tx", help="Send a text query to GPT-3.5")
-    parser_tx.description = "Query GPT with a question or statement and get an answer"
-    parser_tx.usage = "usage: tgpt tx prompt [-h] [-n NUM] [-t TEMP] [-m MAX]"
-    parser_tx.add_argument("prompt", type=str, help="Text query to send to GPT-3.5")
-    parser_tx.add_argument("-n", "--num", type=int, default=1, help="Number of responses to generate (Default: 1)")
-    parser_tx.add_argument("-t", "--temp", type=float, default=temperature, help=f"Sampling temperature for generating responses (Default: {temperature})")
-    parser_tx.add_argument("-m", "--max", type=int, default=tokens, help=f"The maximum number of tokens to generate for completions(Default: {tokens})")
-
-    parser_gi = subparsers.add_parser("gi", help="Generate an image based on the given text prompt", formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser_gi.description = "Generate images from text prompt"
-    parser_gi.usage = "usage: tgpt gi prompt [save_path] [-h] [-s {small,medium,large}] [-n NUM] [-t TEMP]"
-    parser_gi.add_argument("prompt", help="The text prompt to generate an image")
-    parser_gi.add_argument("save_path", nargs="?", default=None, help="Path to save the generated image (default: current directory)")
-    parser_gi.add_argument("-s", "--size", choices=["small", "medium", "large"], default="medium", help=f"The size of the generated image (default: {image_size})")
-    parser_gi.add_argument("-n", "--num", type=int, default=1, help="The number of images to generate (default: 1)")
-    parser_gi.add_argument("-t", "--temp", type=float, default=temperature, help=f"Sampling temperature for generating responses (Default: {temperature})")
-
-    parser_gv = subparsers.add_parser("gv", help="Generate a variation of an existing image")
-    parser_gv.description = "Generate variations of already existing image"
-    parser_gv.usage = "usage: tgpt gv image_path [save_path] [-h] [-s {small,medium,large}] [-n NUM] [-t TEMP]"
-    parser_gv.add_argument("image_name", type=str, help="Path to the input image for generating a variation")
-    parser_gv.add_argument("save_path", type=str, nargs="?", default="", help="Optional save path for the generated images (default: current directory)")
-    parser_gv.add_argument("-s", "--size", type=str, choices=["small", "medium", "large"], default="medium", help=f"Size of the generated image (Default: {image_size})")
-    parser_gv.add_argument("-n", "--num", type=int, default=1, help="Number of image variations to generate (Default: 1)")
-    parser_gv.add_argument("-t", "--temp", type=float, default=temperature, help=f"Sampling temperature for generating responses (Default: {temperature})")
-    
+    subparsers = parser.add_subparsers(dest="subparser_name", title="subcommands", metavar="{" + ", ".join(SUBCOMMANDS) + "}")
+    for name in SUBCOMMANDS:
+        help_text, add_arguments = SUBCOMMAND_PARSERS[name]
+        if name == "gi":
+            subparser = subparsers.add_parser(name, help=help_text, formatter_class=argparse.RawDescriptionHelpFormatter)
+        else:
+            subparser = subparsers.add_parser(name, help=help_text)
+        if name == selected:
+            add_arguments(subparser)
+
     # Add top-level options
     parser.add_argument("-c", "--chat", action="store_true", help="Enter chat mode")
-    
+    parser.add_argument("--resume", nargs="?", const="", default=None, metavar="SESSION",
+                        help="Enter chat mode continuing a saved session (Default: the most recent one).\n"
+                             "Needs SESSIONS = True in the config")
+    parser.add_argument("--no-daemon", action="store_true", help="Run in this process even if a tgpt daemon is running")
+    parser.add_argument("--timings", action="store_true", help="Print request latency, size and token usage statistics when done\n"
+                                                               "(runs in this process, without the daemon)")
+    return parser
+
+
+def open_search_index(path):
+    """
+    Open the search index, or go on without one if it cannot be opened, for example when
+    SQLite was built without FTS5 or the home directory is read-only.
+
+    Returns:
+        SearchIndex: The index, or None if it is unavailable.
+    """
+    import sqlite3
+    from .search_index import SearchIndex
+    try:
+        return SearchIndex(path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Search index unavailable, continuing without it: {e}", file=sys.stderr)
+        return None
+
+
+def build_retriever(config, client):
+    """
+    Build a Retriever over the embedding index built with tgpt embed.
+
+    Returns:
+        Retriever: The retriever, or None if there is no embedding index.
+    """
+    from .vector_index import Retriever, VectorIndex
+    index = VectorIndex(config.get_embedding_index())
+    if not index.count:
+        return None
+    return Retriever(client, index, k=config.get_retrieval_top_k())
+
+
+def build_client(config, pool_size=None):
+    """
+    Build a GPTClient and its transport from the configuration values.
+
+    Returns:
+        GPTClient: The configured client.
+    """
+    from .gpt_client import GPTClient
+    from .http_transport import HTTPTransport
+    from .metrics import JSONLinesSink, Metrics, PrometheusTextfileSink
+    from .rate_limiter import RequestScheduler
+    from .tokenizer import Tokenizer
+
+    requests_per_minute, tokens_per_minute = config.get_rate_limits()
+    scheduler = RequestScheduler(requests_per_minute, tokens_per_minute, max_retries=config.get_max_retries())
+    sinks = []
+    if config.get_metrics_log():
+        sinks.append(JSONLinesSink(config.get_metrics_log()))
+    if config.get_metrics_prometheus():
+        sinks.append(PrometheusTextfileSink(config.get_metrics_prometheus()))
+    api_key, api_base = config.get_api_key(), config.get_api_base()
+    endpoints = None
+    if config.get_endpoints():
+        from .endpoint_pool import Endpoint, EndpointPool
+        endpoints = EndpointPool([Endpoint(**endpoint) for endpoint in config.get_endpoints()])
+        # The client addresses the first endpoint, the transport routes each request to the best one.
+        api_key, api_base = endpoints.endpoints[0].key, endpoints.endpoints[0].url
+    transport = HTTPTransport(pool_size=pool_size or config.get_pool_size(), scheduler=scheduler, metrics=Metrics(sinks),
+                              endpoints=endpoints, timeout=config.get_timeouts(), deadline=config.get_deadline())
+    cache = None
+    if config.get_cache_enabled():
+        from .response_cache import ResponseCache
+        cache = ResponseCache(max_bytes=config.get_cache_max_size(), ttl=config.get_cache_ttl())
+    tokenizer = Tokenizer(config.get_tokenizer_file())
+    client = GPTClient(api_key, config.get_model(), transport=transport, cache=cache, tokenizer=tokenizer,
+                       api_base=api_base)
+    client.set_max_tokens(config.get_max_tokens())
+    client.set_temperature(config.get_temperature())
+    client.set_context_budget(config.get_context_tokens(), summarize=config.get_summarize())
+    if config.get_hedge_enabled():
+        client.set_hedging(config.get_hedge_percentile(), config.get_hedge_max_ratio())
+    return client
+
+
+def main():
+    """
+    The main function for the command-line interface to interact with OpenAI's GPT-3.5 API.
+    This function handles command-line arguments and calls the appropriate methods based on the input.
+
+    Arguments are parsed before the config is read, and the HTTP and image modules are only
+    imported for the subcommand that needs them, which keeps one-shot invocations fast.
+    """
+    parser = build_parser()
     try:
         args = parser.parse_args()
     except SystemExit:
         return
-    
-    # Set persistent default values to GPTClient and CommandLineInterface
-    client.set_max_tokens(tokens)
-    client.set_temperature(temperature)
-    cli.set_width(width)
-    
-    
+
+    command = args.subparser_name if args.subparser_name else ("chat" if args.chat or args.resume is not None else None)
+    if command is None:
+        parser.print_help()
+        return
+    if command == "gi" and args.prompt is None and not args.from_file:
+        print("Error: gi needs a prompt or --from-file")
+        return
+    if command == "gv" and args.image_name is None and not args.dir:
+        print("Error: gv needs an image path or --dir")
+        return
+    if command == "gi" and args.from_file and args.prompt is not None:
+        print("Error: gi --from-file takes no prompt, use -o/--output-dir to choose the output directory")
+        return
+    if command == "gv" and args.dir and args.image_name is not None:
+        print("Error: gv --dir takes no image path, use -o/--output-dir to choose the output directory")
+        return
+    if command == "embed" and not args.paths and args.query is None and sys.stdin.isatty():
+        print("Error: embed needs paths, input on stdin or --query")
+        return
+
+    # Read config file and load values
+    try:
+        from .config_handler import ConfigHandler
+        config = ConfigHandler()
+        batch_concurrency = config.get_batch_concurrency()
+        if getattr(args, "jobs", None) is not None:
+            batch_concurrency = args.jobs
+        search_index = None
+        if config.get_search_index() and command in ("tx", "chat", "gi", "gv", "search"):
+            search_index = open_search_index(config.get_search_index())
+
+        bulk = bool(getattr(args, "from_file", None) or getattr(args, "dir", None))
+        file_input = command == "tx" and (args.prompt == "-" or args.file is not None)
+        client = None
+        if command in DAEMON_COMMANDS and not (args.no_daemon or args.timings or bulk or file_input):
+            from .daemon import RemoteGPTClient, is_daemon_running
+            if is_daemon_running(config.get_daemon_socket()):
+                client = RemoteGPTClient(config.get_daemon_socket(), model=config.get_model(), deadline=config.get_deadline())
+        if client is None and command != "search":
+            pool_size = None
+            if command in ("batch", "embed"):
+                pool_size = max(config.get_pool_size(), batch_concurrency)
+            elif bulk:
+                pool_size = max(config.get_pool_size(), batch_concurrency + config.get_download_workers())
+            client = build_client(config, pool_size=pool_size)
+
+        session_store = None
+        if command == "chat" and config.get_sessions_enabled():
+            from .session_store import SessionStore
+            session_store = SessionStore()
+
+        retriever = None
+        if command == "chat" and config.get_retrieval_enabled():
+            retriever = client.retriever = build_retriever(config, client)
+
+        from .commandline_interface import CommandLineInterface
+        json_output = command in ("tx", "gi", "gv") and (args.json or not sys.stdout.isatty())
+        cli = CommandLineInterface(client, session_store=session_store, search_index=search_index, json_output=json_output,
+                                   retriever=retriever, make_retriever=lambda: build_retriever(config, client))
+        cli.set_width(config.get_width())
+        cli.batch_deadline = config.get_batch_deadline()
+    except Exception as e:
+        print(f"Error loading config values, initializing GPTClient or CommandLineInterface: {e}")
+        return
+
     # Set values passed from CLI if present
-    if hasattr(args, 'max') and args.max != tokens:
-        client.max_tokens = args.max
-    if hasattr(args, 'temperature') and args.temperature != temperature:
-        client.temperature = args.temperature
-    if hasattr(args, 'num') and args.num != number:
-        number = args.num
-    if hasattr(args, 'size') and args.size != image_size:
-        image_size = args.size
-    
-    # Check if a question was provided as an argument
+    if getattr(args, 'max', None) is not None:
+        client.set_max_tokens(args.max)
+    if getattr(args, 'temp', None) is not None:
+        client.set_temperature(args.temp)
+    if getattr(args, 'no_cache', False):
+        client.cache = None
+    number = args.num if getattr(args, 'num', None) is not None else config.get_number()
+    image_size = getattr(args, 'size', None) or config.get_image_size()
+    image_format = getattr(args, 'format', None) or config.get_image_format()
+    if command in ("gi", "gv") and number < 1:
+        print(f"Error: the number of images must be at least 1, got {number}")
+        return
+    if command in ("gi", "gv", "serve") and hasattr(client, "image_handler"):
+        client.image_handler.download_workers = config.get_download_workers()
+        client.image_handler.preprocessor.fit = config.get_image_fit()
+
     try:
         # Check if query was provided with subcommand
-        if args.subparser_name == "tx":
-            cli.handle_completion(args.prompt, n=number)
+        if file_input:
+            instruction = args.prompt if args.file is not None and args.prompt != "-" else None
+            cli.handle_input(args.file or "-", instruction, concurrency=batch_concurrency)
+
+        elif command == "tx":
+            cli.handle_completion(args.prompt, n=number, stream=args.stream)
 
         # Check if chat mode was specified
-        elif args.chat:
+        elif command == "chat":
+            if args.resume is not None:
+                if session_store is not None:
+                    cli.resume(args.resume or None)
+                else:
+                    print("Sessions are disabled, set SESSIONS = True in the config to resume a saved chat. "
+                          "Starting a new chat.", file=sys.stderr)
             cli.run()
 
+        # Check if a bulk image mode was specified
+        elif bulk:
+            from .image_pipeline import ImagePipeline
+            output_dir = args.output_dir or os.getcwd()
+            on_complete = on_error = None
+            if json_output:
+                kind = "image" if command == "gi" else "variation"
+                on_complete = lambda record, elapsed: cli.emit_images(
+                    kind, record["input"], [os.path.join(output_dir, name) for name in record["outputs"]], latency=elapsed, size=image_size)
+                on_error = lambda source, error, elapsed: cli.emit_error(
+                    error, kind=kind, **{"prompt" if kind == "image" else "source": source})
+            pipeline = ImagePipeline(client.image_handler, concurrency=batch_concurrency, download_workers=config.get_download_workers(),
+                                     on_complete=on_complete, on_error=on_error)
+            with client.transport.command(config.get_batch_deadline()), \
+                    contextlib.redirect_stdout(sys.stderr) if json_output else contextlib.nullcontext():
+                if command == "gi":
+                    stats = pipeline.generate(args.from_file, output_dir, n=number, size=image_size, response_format=image_format,
+                                              resume=not args.restart)
+                else:
+                    stats = pipeline.vary(args.dir, output_dir, n=number, size=image_size, response_format=image_format,
+                                          resume=not args.restart)
+                print(f"\nCompleted {stats['completed']} inputs, {stats['images']} images ({stats['failed']} failed, "
+                      f"{stats['skipped']} already done) in {stats['elapsed']:.1f}s")
+
         # Check if generate image mode was specified
-        elif args.subparser_name == "gi":
-            cli.generate_image(args.prompt, n=number, size=image_size, save_path=args.save_path)
+        elif command == "gi":
+            cli.generate_image(args.prompt, n=number, size=image_size, response_format=image_format, save_path=args.save_path)
 
         # Check if generate variation mode was specified
-        elif args.subparser_name == "gv":
-            image_name = args.image_name
-            cli.generate_variation(image_name, n=number, size=image_size, save_path=args.save_path)
+        elif command == "gv":
+            cli.generate_variation(args.image_name, n=number, size=image_size, response_format=image_format,
+                                   save_path=args.save_path)
 
-        # Print help message if no arguments are provided
-        else:
-            parser.print_help()
+        # Check if batch mode was specified
+        elif command == "batch":
+            from .batch_runner import BatchRunner
+            runner = BatchRunner(client, concurrency=batch_concurrency)
+            with client.transport.command(config.get_batch_deadline()):
+                stats = runner.run(args.input, args.output, resume=not args.restart)
+            print(f"\nCompleted {stats['completed']} prompts ({stats['failed']} failed, {stats['skipped']} already done) "
+                  f"in {stats['elapsed']:.1f}s, {stats['throughput']:.1f} req/s")
+
+        # Check if embed mode was specified
+        elif command == "embed":
+            from .vector_index import VectorIndex
+            if args.rebuild and args.query is None:
+                VectorIndex(config.get_embedding_index()).clear()
+            index = VectorIndex(config.get_embedding_index(), model=config.get_embedding_model(),
+                                dimensions=config.get_embedding_dimensions() or None)
+            if args.query is not None:
+                cli.search_embeddings(index, args.query, k=args.top)
+            else:
+                cli.embed(index, args.paths or ["-"], concurrency=batch_concurrency, batch_size=config.get_embedding_batch())
+
+        # Check if search mode was specified
+        elif command == "search":
+            cli.search(" ".join(args.query), limit=args.limit, kind=args.kind)
 
+        # Check if daemon mode was specified
+        elif command == "serve":
+            from .daemon import TGPTDaemon
+            socket_path = args.socket or config.get_daemon_socket()
+            idle_timeout = args.idle_timeout if args.idle_timeout is not None else config.get_daemon_idle_timeout()
+            daemon = TGPTDaemon(client, socket_path=socket_path, idle_timeout=idle_timeout)
+            print(f"tgpt daemon listening on {daemon.socket_path}")
+            daemon.serve_forever()
+
+    except KeyboardInterrupt:
+        print("\nCancelled", file=sys.stderr)
     except Exception as e:
-        print(f"Error handling command line arguments or processing request: {e}")
+        if json_output:
+            cli.emit_error(f"Error processing request: {e}")
+        else:
+            print(f"Error handling command line arguments or processing request: {e}")
+
+    if args.timings and hasattr(client, "get_request_stats"):
+        print(client.get_request_stats(), file=sys.stderr)
 
 
 if __name__ == "__main__":
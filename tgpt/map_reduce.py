@@ -0,0 +1,305 @@
+import mmap
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from .deadline import DeadlineExecutor
+from .gpt_client import GPTClient
+from .tokenizer import DEFAULT_CONTEXT, get_context_size
+
+
+# Chunks are sized in bytes before they are tokenized. Dense input such as logs and code averages
+# close to 3 bytes per token, so this keeps chunks inside their token budget.
+BYTES_PER_TOKEN = 3
+
+# Tokens reserved for the instructions wrapped around every chunk.
+PROMPT_OVERHEAD = 200
+
+# The smallest chunk worth a request of its own.
+MIN_CHUNK_TOKENS = 256
+
+# Split points tried from the end of a chunk, best first: paragraphs, lines, sentences, words.
+BOUNDARIES = (b"\n\n", b"\n", b". ", b" ")
+
+DEFAULT_INSTRUCTION = "Summarize the input."
+
+MAP_PROMPT = ("You are given one part of a larger input that was split into consecutive parts. Apply the "
+              "instruction to this part only. Your result will be combined with the results for the other parts.\n\n"
+              "Instruction: {instruction}")
+
+REDUCE_PROMPT = ("You are given the results of an instruction applied separately to consecutive parts of a larger "
+                 "input, in order. Combine them into a single result for the whole input, as if the instruction had "
+                 "been applied to all of it at once.\n\nInstruction: {instruction}")
+
+
+@contextmanager
+def open_input(path):
+    """
+    Open an input for chunked reading: "-" for stdin, otherwise a file, memory-mapped so that
+    multi-gigabyte files are read through the page cache instead of into memory.
+
+    Yields:
+        object: A binary source with a read(size) method.
+    """
+    if path == "-":
+        yield sys.stdin.buffer
+        return
+    with open(path, "rb") as input_file:
+        if os.fstat(input_file.fileno()).st_size == 0:
+            yield input_file
+            return
+        mapped = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mapped, "madvise"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def iter_chunks(source, max_bytes):
+    """
+    Read a binary source in chunks of at most max_bytes, splitting each one on the best natural
+    boundary in its second half. Only one chunk is held at a time.
+
+    Yields:
+        str: The text of each chunk that is not blank.
+    """
+    buffer = b""
+    eof = False
+    while True:
+        if not eof and len(buffer) < max_bytes:
+            wanted = max_bytes - len(buffer)
+            data = source.read(wanted)
+            eof = len(data) < wanted
+            buffer += data
+        if not buffer:
+            return
+        cut = len(buffer) if eof else _find_boundary(buffer)
+        chunk, buffer = buffer[:cut], buffer[cut:]
+        text = chunk.decode("utf-8", errors="replace")
+        if text.strip():
+            yield text
+        if eof and not buffer:
+            return
+
+
+def _find_boundary(buffer):
+    """
+    Find where to split a full buffer: after the last boundary in its second half, or failing
+    that at the end, backing off so a UTF-8 character is not cut in two.
+
+    Returns:
+        int: The length of the chunk to take.
+    """
+    for boundary in BOUNDARIES:
+        position = buffer.rfind(boundary, len(buffer) // 2)
+        if position != -1:
+            return position + len(boundary)
+    cut = len(buffer)
+    while cut > len(buffer) - 4 and 0x80 <= buffer[cut - 1] < 0xC0:
+        cut -= 1
+    if cut > len(buffer) - 4 and buffer[cut - 1] >= 0xC0:
+        cut -= 1
+    return cut if cut > 0 else len(buffer)
+
+
+class MapReduce:
+    """
+    Apply an instruction to an input too large for one request: the input is split into chunks
+    that fit the model context, the chunks are sent concurrently, and the partial results are
+    combined by further requests into one answer.
+
+    Partial results are combined as they arrive, in input order, whenever enough of them have
+    accumulated to fill a request, so memory stays bounded however long the input is.
+
+    Attributes:
+        client (GPTClient): The GPTClient used to send the requests.
+        concurrency (int): The maximum number of requests in flight.
+        chunk_tokens (int): The token budget of every chunk and of every combining request.
+    """
+    def __init__(self, client, concurrency=4, chunk_tokens=None):
+        """
+        Initialize the MapReduce. The chunk budget defaults to, and is capped at, what the model
+        context leaves after the completion tokens and the instructions.
+
+        Raises:
+            ValueError: If the context leaves too little room for a chunk, or for two partial
+                results to be combined.
+        """
+        self.client = client
+        self._lock = threading.Lock()
+        self.concurrency = max(1, concurrency)
+        model = client.get_model()
+        context_size = get_context_size(model) or DEFAULT_CONTEXT
+        available = context_size - client.max_tokens - PROMPT_OVERHEAD
+        self.chunk_tokens = available if chunk_tokens is None else min(chunk_tokens, available)
+        if self.chunk_tokens < max(2 * client.max_tokens, MIN_CHUNK_TOKENS):
+            room = context_size - PROMPT_OVERHEAD
+            raise ValueError(f"The {context_size} token context of {model} leaves {max(self.chunk_tokens, 0)} tokens per "
+                             f"chunk after {client.max_tokens} completion tokens, too few to split the input. Lower max "
+                             f"tokens to at most {min(room // 3, room - MIN_CHUNK_TOKENS)}.")
+
+    def run(self, source, instruction=None, on_partial=None, on_progress=None):
+        """
+        Process every chunk of the source and combine the results. Input that fits in one chunk is
+        sent as a single request.
+
+        Args:
+            source (object): A binary source with a read(size) method, see open_input.
+            instruction (str, optional): What to do with the input. Without one, input that fits in a
+                single chunk is sent as the prompt itself, and larger input is summarized.
+            on_partial (callable, optional): Called with the chunk index and result of every chunk as it finishes.
+            on_progress (callable, optional): Called with the number of chunks finished and read so far.
+
+        Returns:
+            dict: The final "answer" (None if nothing could be processed), and the numbers of
+            "chunks", "failed" chunks and "requests", and the "elapsed" seconds.
+        """
+        start = time.monotonic()
+        chunks = iter_chunks(source, self.chunk_tokens * BYTES_PER_TOKEN)
+        first = next(chunks, None)
+        second = next(chunks, None)
+        stats = {"chunks": 0, "failed": 0, "requests": 0}
+        if first is None:
+            return dict(stats, answer=None, elapsed=time.monotonic() - start)
+
+        if second is None:
+            prompt = f"{instruction}\n\n{first}" if instruction else first
+            answer = self._complete([{"role": "user", "content": prompt}], stats)
+            stats["chunks"] = 1
+            return dict(stats, answer=answer, elapsed=time.monotonic() - start)
+
+        instruction = instruction or DEFAULT_INSTRUCTION
+        map_prompt = MAP_PROMPT.format(instruction=instruction)
+        finished = {}
+        next_index = 0
+        ordered = []
+        pending = {}
+
+        def all_chunks():
+            yield first
+            yield second
+            yield from chunks
+
+        with DeadlineExecutor(max_workers=self.concurrency) as executor:
+            for index, chunk in enumerate(all_chunks()):
+                stats["chunks"] += 1
+                messages = [{"role": "system", "content": map_prompt}, {"role": "user", "content": chunk}]
+                pending[executor.submit(self._complete, messages, stats)] = index
+                # Reading stops while this many chunks wait, which bounds the memory held by chunks.
+                if len(pending) >= self.concurrency * 2:
+                    next_index = self._collect(pending, finished, ordered, next_index, stats, on_partial, on_progress)
+                    self._compact(ordered, executor, instruction, stats)
+
+            while pending:
+                next_index = self._collect(pending, finished, ordered, next_index, stats, on_partial, on_progress)
+                self._compact(ordered, executor, instruction, stats)
+
+            while any(isinstance(entry, Future) for entry in ordered) or \
+                    sum(entry[1] for entry in ordered) > self.chunk_tokens:
+                wait([entry for entry in ordered if isinstance(entry, Future)])
+                self._compact(ordered, executor, instruction, stats, final=True)
+
+        texts = [text for text, _ in ordered]
+        if not texts:
+            answer = None
+        elif len(texts) == 1:
+            answer = texts[0]
+        else:
+            answer = self._reduce(texts, instruction, stats)
+        return dict(stats, answer=answer, elapsed=time.monotonic() - start)
+
+    def _collect(self, pending, finished, ordered, next_index, stats, on_partial, on_progress):
+        """
+        Wait for at least one chunk to finish, then move every chunk finished in input order onto
+        the ordered results.
+
+        Returns:
+            int: The index of the next chunk expected in order.
+        """
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = pending.pop(future)
+            finished[index] = future.result()
+            if finished[index] is not None and on_partial is not None:
+                on_partial(index, finished[index])
+        while next_index in finished:
+            text = finished.pop(next_index)
+            if text is None:
+                stats["failed"] += 1
+            else:
+                ordered.append((text, self.client.tokenizer.count(text)))
+            next_index += 1
+        if on_progress is not None:
+            on_progress(next_index, stats["chunks"])
+        return next_index
+
+    def _compact(self, ordered, executor, instruction, stats, final=False):
+        """
+        Replace finished combining requests with their results, and send every run of consecutive
+        results that fills a request to be combined. With final=True a single result too large to
+        be combined with its neighbour is condensed on its own, so the results always shrink.
+        """
+        resolved = []
+        for entry in ordered:
+            if isinstance(entry, Future) and entry.done():
+                text = entry.result()
+                if text is not None:
+                    resolved.append((text, self.client.tokenizer.count(text)))
+            else:
+                resolved.append(entry)
+
+        compacted = []
+        run = []
+        run_tokens = 0
+        for entry in resolved:
+            if isinstance(entry, Future):
+                compacted.extend(run)
+                compacted.append(entry)
+                run, run_tokens = [], 0
+                continue
+            if run and run_tokens + entry[1] > self.chunk_tokens:
+                if len(run) > 1 or final:
+                    compacted.append(executor.submit(self._reduce, [text for text, _ in run], instruction, stats))
+                else:
+                    compacted.extend(run)
+                run, run_tokens = [], 0
+            run.append(entry)
+            run_tokens += entry[1]
+        compacted.extend(run)
+        ordered[:] = compacted
+
+    def _reduce(self, texts, instruction, stats):
+        """
+        Combine consecutive partial results into one.
+
+        Returns:
+            str: The combined result, or None if the request failed.
+        """
+        parts = "\n\n".join(f"Result {i + 1}:\n{text}" for i, text in enumerate(texts))
+        return self._complete([{"role": "system", "content": REDUCE_PROMPT.format(instruction=instruction)},
+                               {"role": "user", "content": parts}], stats)
+
+    def _complete(self, messages, stats):
+        """
+        Send one request without touching the chat history.
+
+        Returns:
+            str: The completion text, or None if the request failed.
+        """
+        with self._lock:
+            stats["requests"] += 1
+        choices = self.client.create_completion(messages)
+        return choices[0] if choices else None
+
+
+if __name__ == "__main__":
+    try:
+        runner = MapReduce(GPTClient(api_key="API_KEY"))
+        with open_input("path/to/large.log") as source:
+            print(runner.run(source, "List the errors and how often they occur.")["answer"])
+    except Exception as e:
+        print(f"Error initializing MapReduce or processing input: {e}")
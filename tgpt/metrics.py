@@ -0,0 +1,381 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# Upper bounds of the Prometheus latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# The timing fields of a request record, in milliseconds.
+TIMING_FIELDS = ("queue_ms", "connect_ms", "ttfb_ms", "total_ms")
+
+_connect_time = threading.local()
+
+
+def reset_connect_time():
+    """
+    Reset the connect time accumulated by the current thread.
+    """
+    _connect_time.seconds = 0.0
+
+
+def get_connect_time():
+    """
+    Retrieve the time the current thread spent opening connections since the last reset.
+
+    Returns:
+        float: The connect time in seconds, including the TLS handshake.
+    """
+    return getattr(_connect_time, "seconds", 0.0)
+
+
+class _TimedConnectionMixin:
+    """
+    Add the time spent in connect() to the connect time of the calling thread.
+    """
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_time.seconds = get_connect_time() + time.perf_counter() - start
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+def percentile(samples, fraction):
+    """
+    Compute a percentile of the samples by the nearest-rank method.
+
+    Returns:
+        float: The sample at the given fraction of the sorted samples, or None if there are none.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class JSONLinesSink:
+    """
+    Append every request record to a JSON-lines file.
+
+    Attributes:
+        path (str): The path of the log file.
+    """
+    def __init__(self, path):
+        """
+        Initialize the JSONLinesSink, creating the log directory if needed.
+        """
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        """
+        Append a record to the log.
+        """
+        line = json.dumps(record) + "\n"
+        with self._lock, open(self.path, "a") as log_file:
+            log_file.write(line)
+
+    def close(self):
+        pass
+
+
+class PrometheusTextfileSink:
+    """
+    Keep Prometheus counters and latency histograms of the requests and write them to a file
+    in the text exposition format, for the node exporter's textfile collector.
+
+    Attributes:
+        path (str): The path of the .prom file.
+        interval (float): The minimum number of seconds between two writes of the file.
+    """
+    def __init__(self, path, interval=5.0):
+        """
+        Initialize the PrometheusTextfileSink.
+        """
+        self.path = os.path.expanduser(path)
+        self.interval = interval
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._requests = defaultdict(int)
+        self._counters = defaultdict(int)
+        self._buckets = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        self._sums = defaultdict(float)
+        self._counts = defaultdict(int)
+        self._written = 0.0
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def record(self, record):
+        """
+        Add a record to the counters and histograms, and rewrite the file if the interval has passed.
+        """
+        kind = record["kind"]
+        seconds = record["total_ms"] / 1000
+        with self._lock:
+            self._requests[(kind, str(record["status"] or "error"))] += 1
+            self._counters[("tgpt_retries_total", kind, None)] += record["retries"]
+            self._counters[("tgpt_bytes_total", kind, 'direction="in"')] += record["bytes_in"]
+            self._counters[("tgpt_bytes_total", kind, 'direction="out"')] += record["bytes_out"]
+            if record["prompt_tokens"] is not None or record["completion_tokens"] is not None:
+                self._counters[("tgpt_tokens_total", kind, 'type="prompt"')] += record["prompt_tokens"] or 0
+                self._counters[("tgpt_tokens_total", kind, 'type="completion"')] += record["completion_tokens"] or 0
+            buckets = self._buckets[kind]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            self._sums[kind] += seconds
+            self._counts[kind] += 1
+            if time.monotonic() - self._written >= self.interval:
+                self._write()
+
+    def close(self):
+        """
+        Write the final values to the file.
+        """
+        with self._lock:
+            if self._counts:
+                self._write()
+
+    def _write(self):
+        """
+        Render the metrics and atomically replace the file. Must be called with the lock held.
+        """
+        lines = ["# HELP tgpt_requests_total Requests sent, by kind and final status.",
+                 "# TYPE tgpt_requests_total counter"]
+        for (kind, status), count in sorted(self._requests.items()):
+            lines.append(f'tgpt_requests_total{{kind="{kind}",status="{status}"}} {count}')
+        for name, help_text in (("tgpt_retries_total", "Retried attempts."),
+                                ("tgpt_bytes_total", "Bytes sent and received."),
+                                ("tgpt_tokens_total", "Prompt and completion tokens reported by the API.")):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (metric, kind, label), value in sorted(self._counters.items(), key=lambda item: (item[0][1], item[0][2] or "")):
+                if metric == name:
+                    labels = f'kind="{kind}"' + (f",{label}" if label else "")
+                    lines.append(f"{name}{{{labels}}} {value}")
+
+        lines += ["# HELP tgpt_request_duration_seconds Total request time, including retries and the response body.",
+                  "# TYPE tgpt_request_duration_seconds histogram"]
+        for kind in sorted(self._counts):
+            for bound, count in zip(LATENCY_BUCKETS, self._buckets[kind]):
+                lines.append(f'tgpt_request_duration_seconds_bucket{{kind="{kind}",le="{bound:g}"}} {count}')
+            lines.append(f'tgpt_request_duration_seconds_bucket{{kind="{kind}",le="+Inf"}} {self._counts[kind]}')
+            lines.append(f'tgpt_request_duration_seconds_sum{{kind="{kind}"}} {self._sums[kind]:.6f}')
+            lines.append(f'tgpt_request_duration_seconds_count{{kind="{kind}"}} {self._counts[kind]}')
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as prom_file:
+            prom_file.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.path)
+        self._written = time.monotonic()
+
+
+class HistogramSink:
+    """
+    Keep the most recent request records in memory and summarize them per kind of request.
+
+    Attributes:
+        max_samples (int): The number of records kept per kind of request.
+    """
+    def __init__(self, max_samples=2000):
+        """
+        Initialize the HistogramSink.
+        """
+        self.max_samples = max_samples
+        self._records = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        """
+        Keep a record.
+        """
+        with self._lock:
+            self._records[record["kind"]].append(record)
+
+    def summary(self):
+        """
+        Summarize the kept records.
+
+        Returns:
+            dict: Per kind of request, the request, error and retry counts, the p50 and p99 of every
+            timing in milliseconds, and the total bytes and tokens.
+        """
+        with self._lock:
+            records = {kind: list(kept) for kind, kept in self._records.items()}
+
+        summary = {}
+        for kind, kept in sorted(records.items()):
+            stats = {
+                "requests": len(kept),
+                "errors": sum(1 for record in kept if record["error"] or (record["status"] or 500) >= 400),
+                "retries": sum(record["retries"] for record in kept),
+                "bytes_in": sum(record["bytes_in"] for record in kept),
+                "bytes_out": sum(record["bytes_out"] for record in kept),
+                "prompt_tokens": sum(record["prompt_tokens"] or 0 for record in kept),
+                "completion_tokens": sum(record["completion_tokens"] or 0 for record in kept),
+            }
+            for field in TIMING_FIELDS:
+                samples = [record[field] for record in kept if record[field] is not None]
+                stats[field.replace("_ms", "_p50_ms")] = percentile(samples, 0.50)
+                stats[field.replace("_ms", "_p99_ms")] = percentile(samples, 0.99)
+            summary[kind] = stats
+        return summary
+
+    def format(self):
+        """
+        Render the summary as a table.
+
+        Returns:
+            str: The table, or a note that no requests were recorded.
+        """
+        summary = self.summary()
+        if not summary:
+            return "No requests recorded yet."
+
+        def ms(value):
+            return "-" if value is None else f"{value:.0f}"
+
+        lines = [f"{'kind':<18}{'reqs':>6}{'errs':>6}{'retry':>6}{'queue':>8}{'connect':>9}{'ttfb':>12}{'total':>14}{'tokens in/out':>16}{'KB in/out':>14}",
+                 f"{'':<18}{'':>6}{'':>6}{'':>6}{'p50':>8}{'p50':>9}{'p50/p99':>12}{'p50/p99':>14}"]
+        for kind, stats in summary.items():
+            lines.append(
+                f"{kind:<18}{stats['requests']:>6}{stats['errors']:>6}{stats['retries']:>6}"
+                f"{ms(stats['queue_p50_ms']):>8}{ms(stats['connect_p50_ms']):>9}"
+                f"{ms(stats['ttfb_p50_ms']) + '/' + ms(stats['ttfb_p99_ms']):>12}"
+                f"{ms(stats['total_p50_ms']) + '/' + ms(stats['total_p99_ms']):>14}"
+                f"{str(stats['prompt_tokens']) + '/' + str(stats['completion_tokens']):>16}"
+                f"{stats['bytes_in'] // 1024:>7}/{stats['bytes_out'] // 1024:<6}")
+        lines.append("(times in ms)")
+        return "\n".join(lines)
+
+    def close(self):
+        pass
+
+
+class Metrics:
+    """
+    Collect a record for every HTTP request and hand it to the configured sinks.
+
+    Every record holds the kind of request, method, host, status, error, number of retries,
+    the time spent waiting for the rate limits (queue), opening connections (connect), until the
+    response headers arrived (ttfb) and in total, the bytes sent and received and the prompt and
+    completion tokens reported by the API.
+
+    Attributes:
+        sinks (list): The sinks receiving every record.
+        histogram (HistogramSink): The in-memory sink, used for /stats and --timings.
+    """
+    def __init__(self, sinks=None):
+        """
+        Initialize Metrics with an in-memory histogram and the given extra sinks.
+        """
+        self.histogram = HistogramSink()
+        self.sinks = [self.histogram] + list(sinks or [])
+
+    def add_sink(self, sink):
+        """
+        Add a sink receiving every following record.
+        """
+        self.sinks.append(sink)
+
+    def record(self, record):
+        """
+        Hand a record to every sink. A failing sink never fails the request.
+        """
+        for sink in self.sinks:
+            try:
+                sink.record(record)
+            except Exception as e:
+                print(f"Error writing request metrics: {e}")
+
+    def close(self):
+        """
+        Flush and close every sink.
+        """
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print(f"Error writing request metrics: {e}")
+
+
+def make_record(kind, method, url, start, connect=0.0, queue=0.0, retries=0, response=None, error=None, usage=None):
+    """
+    Build a request record from a finished request.
+
+    Args:
+        kind (str): The kind of request, for example "completion" or "download".
+        start (float): The time.perf_counter() value when the request was started.
+        connect (float, optional): The seconds spent opening connections.
+        queue (float, optional): The seconds spent waiting for the rate limits.
+        retries (int, optional): The number of retried attempts.
+        response (requests.Response, optional): The final response, if one was received.
+        error (Exception, optional): The error that ended the request, if any.
+        usage (dict, optional): The usage block of the API response.
+
+    Returns:
+        dict: The request record.
+    """
+    bytes_out = bytes_in = 0
+    ttfb = None
+    if response is not None:
+        body = response.request.body if response.request is not None else None
+        bytes_out = len(body) if body else 0
+        ttfb = response.elapsed.total_seconds() * 1000
+        try:
+            bytes_in = response.raw.tell()
+        except AttributeError:
+            bytes_in = 0
+        # Chunked bodies are not counted by urllib3, the SSE parser counts them instead.
+        bytes_in = max(bytes_in, getattr(response, "tgpt_bytes_in", 0))
+    usage = usage or {}
+    return {
+        "time": time.time(),
+        "kind": kind,
+        "method": method,
+        "host": url.split("/")[2] if "://" in url else url,
+        "status": response.status_code if response is not None else None,
+        "error": str(error) if error is not None else None,
+        "retries": retries,
+        "queue_ms": round(queue * 1000, 3),
+        "connect_ms": round(connect * 1000, 3),
+        "ttfb_ms": round(ttfb, 3) if ttfb is not None else None,
+        "total_ms": round((time.perf_counter() - start) * 1000, 3),
+        "bytes_out": bytes_out,
+        "bytes_in": bytes_in,
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+    }
+
+
+if __name__ == "__main__":
+    try:
+        metrics = Metrics([JSONLinesSink("~/.tgpt/metrics.jsonl")])
+        metrics.record({"time": time.time(), "kind": "completion", "method": "POST", "host": "api.openai.com", "status": 200,
+                        "error": None, "retries": 0, "queue_ms": 0.0, "connect_ms": 80.0, "ttfb_ms": 450.0, "total_ms": 460.0,
+                        "bytes_out": 200, "bytes_in": 600, "prompt_tokens": 12, "completion_tokens": 30})
+        print(metrics.histogram.format())
+    except Exception as e:
+        print(f"Error initializing Metrics or recording a request: {e}")
@@ -0,0 +1,285 @@
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+
+from .deadline import DeadlineExceeded
+
+
+RETRY_STATUSES = (408, 409, 429, 500, 502, 503, 504)
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value):
+    """
+    Parse a rate limit reset duration such as "20ms", "1.5s" or "6m0s".
+
+    Returns:
+        float: The duration in seconds, or None if the value cannot be parsed.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_retry_after(headers):
+    """
+    Read the delay requested by the server from the retry-after-ms or Retry-After headers.
+
+    Returns:
+        float: The delay in seconds, or None if the server did not request one.
+    """
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def was_sent(error):
+    """
+    Tell whether a request that failed with a connection error or timeout may have reached the
+    server. Only requests that failed while connecting are known not to have been sent: after a
+    read timeout or a dropped connection, the server may still be running, and billing, the request.
+
+    Returns:
+        bool: False if the request failed before it was sent, True otherwise.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    reason = error.args[0] if error.args else None
+    # Refused and unresolvable connections, urllib3's NewConnectionError, are connect errors too.
+    return not isinstance(getattr(reason, "reason", reason), ConnectTimeoutError)
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled continuously at a fixed rate per minute.
+
+    Attributes:
+        rate (float): The number of tokens added per minute, or 0 for an unlimited bucket.
+    """
+    def __init__(self, rate=0):
+        """
+        Initialize the TokenBucket with a full bucket.
+        """
+        self.rate = rate
+        self._level = float(rate)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1, deadline=None):
+        """
+        Take tokens from the bucket, waiting until enough are available.
+
+        Args:
+            deadline (Deadline, optional): The deadline of the command, which the wait may not pass.
+
+        Returns:
+            float: The number of seconds spent waiting.
+
+        Raises:
+            DeadlineExceeded: If the tokens would only be available after the deadline.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                delay = self._reserve(amount)
+            if delay <= 0:
+                return waited
+            if deadline is not None:
+                deadline.check(delay)
+            time.sleep(delay)
+            waited += delay
+
+    def set_rate(self, rate):
+        """
+        Change the refill rate, for example to the limit reported by the server.
+        """
+        with self._lock:
+            self._refill()
+            self._level = float(rate) if not self.rate else min(self._level, float(rate))
+            self.rate = rate
+
+    def sync(self, remaining, reset=None):
+        """
+        Align the bucket with the remaining quota reported by the server.
+
+        Args:
+            remaining (int): The number of tokens the server reports as remaining.
+            reset (float, optional): The number of seconds until the server quota resets.
+        """
+        with self._lock:
+            self._refill()
+            self._level = min(self._level, float(remaining))
+            if remaining <= 0 and reset:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + reset)
+
+    def _reserve(self, amount):
+        """
+        Take the tokens if available. Must be called with the lock held.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of seconds to wait.
+        """
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if not self.rate:
+            return 0.0
+
+        self._refill()
+        amount = min(amount, self.rate)
+        if self._level >= amount:
+            self._level -= amount
+            return 0.0
+        return (amount - self._level) * 60.0 / self.rate
+
+    def _refill(self):
+        """
+        Add the tokens accrued since the last update. Must be called with the lock held.
+        """
+        now = time.monotonic()
+        if self.rate:
+            self._level = min(float(self.rate), self._level + (now - self._updated) * self.rate / 60.0)
+        self._updated = now
+
+
+class RequestScheduler:
+    """
+    Paces API requests with request and token buckets and retries failed requests with
+    exponential backoff and jitter, honoring the server's Retry-After and x-ratelimit headers.
+
+    Attributes:
+        requests_per_minute (TokenBucket): The request budget. Its rate is learned from the server if not set.
+        tokens_per_minute (TokenBucket): The token budget. Its rate is learned from the server if not set.
+        max_retries (int): The number of times a failed request is retried.
+        base_delay (float): The backoff delay before the first retry, in seconds.
+        max_delay (float): The maximum backoff delay, in seconds.
+    """
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, max_retries=5, base_delay=1.0, max_delay=60.0):
+        """
+        Initialize the RequestScheduler. A rate of 0 is learned from the x-ratelimit-limit headers.
+        """
+        self.requests_per_minute = TokenBucket(requests_per_minute)
+        self.tokens_per_minute = TokenBucket(tokens_per_minute)
+        self._learn_requests = not requests_per_minute
+        self._learn_tokens = not tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def send(self, send_request, tokens=0, stats=None, deadline=None, idempotent=True):
+        """
+        Send a request once the rate limits allow it, retrying on connection errors and retryable statuses.
+        Requests that are not idempotent, such as completions, are only retried after a connection
+        error or timeout if they failed before being sent, so a slow answer is never paid for twice.
+
+        Args:
+            send_request (callable): Sends the request and returns a requests.Response.
+            tokens (int, optional): The estimated number of tokens the request uses. Defaults to 0.
+            stats (dict, optional): Receives the seconds spent waiting for the rate limits as "queue"
+                and the number of retried attempts as "retries".
+            deadline (Deadline, optional): The deadline of the command. No wait or retry is started
+                that would end past it. Defaults to None.
+            idempotent (bool, optional): Whether the request may be sent again after a read timeout
+                or a dropped connection. Defaults to True.
+
+        Returns:
+            requests.Response: The final response, which may still carry an error status.
+
+        Raises:
+            DeadlineExceeded: If the deadline passed before a response was received.
+            Cancelled: If the command was cancelled.
+        """
+        stats = stats if stats is not None else {}
+        stats["queue"] = 0.0
+        for attempt in range(self.max_retries + 1):
+            stats["retries"] = attempt
+            stats["queue"] += self.requests_per_minute.acquire(1, deadline)
+            if tokens:
+                stats["queue"] += self.tokens_per_minute.acquire(tokens, deadline)
+
+            try:
+                response = send_request()
+            except DeadlineExceeded:
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == self.max_retries or (not idempotent and was_sent(e)):
+                    raise
+                delay = self._backoff(attempt)
+                if deadline is not None:
+                    deadline.check(delay)
+                time.sleep(delay)
+                continue
+
+            self.update_from_headers(response.headers)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+
+            delay = parse_retry_after(response.headers)
+            delay = delay if delay is not None else self._backoff(attempt)
+            if deadline is not None and not deadline.allows(delay):
+                return response
+            response.close()
+            time.sleep(delay)
+
+    def update_from_headers(self, headers):
+        """
+        Update the buckets from the x-ratelimit headers of a response.
+        """
+        for bucket, kind, learn in ((self.requests_per_minute, "requests", self._learn_requests),
+                                    (self.tokens_per_minute, "tokens", self._learn_tokens)):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            if learn and limit and limit.isdigit() and int(limit) != bucket.rate:
+                bucket.set_rate(int(limit))
+
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining and remaining.isdigit():
+                bucket.sync(int(remaining), parse_duration(headers.get(f"x-ratelimit-reset-{kind}")))
+
+    def _backoff(self, attempt):
+        """
+        Compute the exponential backoff delay for a retry, with half of it randomized as jitter.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+if __name__ == "__main__":
+    try:
+        scheduler = RequestScheduler(requests_per_minute=60)
+        response = scheduler.send(lambda: requests.get("https://api.openai.com/v1/models"))
+        print(response.status_code)
+    except Exception as e:
+        print(f"Error initializing RequestScheduler or sending request: {e}")
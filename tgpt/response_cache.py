@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    A persistent on-disk cache of completion responses with a size cap, LRU eviction and a time-to-live.
+
+    Every entry is a small JSON file named after the hash of the request. Reading an entry bumps
+    its modification time, which is used as the least-recently-used order when evicting.
+
+    Attributes:
+        directory (str): The directory holding the cache entries.
+        max_bytes (int): The maximum total size of the cache entries.
+        ttl (float): The number of seconds an entry stays valid, or 0 to never expire.
+    """
+    KEY_FIELDS = ("model", "messages", "max_tokens", "temperature", "top_p",
+                  "frequency_penalty", "presence_penalty", "n", "stop")
+
+    def __init__(self, directory="~/.tgpt/cache/completions", max_bytes=100 * 1024 * 1024, ttl=7 * 24 * 3600):
+        """
+        Initialize the ResponseCache and create its directory if needed.
+        """
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def make_key(cls, payload, endpoint=None):
+        """
+        Compute the cache key of a completion request payload.
+
+        Args:
+            payload (dict): The completion request payload.
+            endpoint (str or list, optional): The URL the request is sent to, or the URLs of the
+                endpoints it may be routed to, so answers from one backend are not served for another.
+
+        Returns:
+            str: The hex digest identifying the request.
+        """
+        fields = {field: payload.get(field) for field in cls.KEY_FIELDS}
+        fields["endpoint"] = endpoint
+        encoded = json.dumps(fields, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def is_cacheable(payload):
+        """
+        Check whether the response to a completion request may be cached. Only requests at
+        temperature 0 are, since sampled answers are meant to differ from one request to the next.
+
+        Returns:
+            bool: True if the response may be cached and served from the cache.
+        """
+        return not payload.get("temperature")
+
+    def get(self, key):
+        """
+        Retrieve a cached response, dropping it if it has expired.
+
+        Returns:
+            list: The cached completion texts, or None on a cache miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+
+        if self.ttl and time.time() - entry.get("created", 0) > self.ttl:
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry.get("value")
+
+    def set(self, key, value):
+        """
+        Store a response in the cache, evicting the least recently used entries if the cache is full.
+        """
+        path = self._path(key)
+        data = json.dumps({"created": time.time(), "value": value}, ensure_ascii=False).encode("utf-8")
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as entry_file:
+                entry_file.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing response cache entry: {e}")
+            self._remove(temp_path)
+            return
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += len(data) - replaced
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                if entry.is_file():
+                    self._remove(entry.path)
+            self._total_bytes = 0
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until the cache is below 90% of its size cap.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+        self._total_bytes = total
+
+    def _scan_size(self):
+        """
+        Compute the total size of the cache entries on disk.
+
+        Returns:
+            int: The total size in bytes.
+        """
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory)
+                   if entry.is_file() and entry.name.endswith(".json"))
+
+    def _path(self, key):
+        """
+        Retrieve the file path of a cache entry.
+
+        Returns:
+            str: The path of the entry file.
+        """
+        return os.path.join(self.directory, f"{key}.json")
+
+    @staticmethod
+    def _remove(path):
+        """
+        Remove a file, ignoring files that are already gone.
+        """
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    try:
+        cache = ResponseCache()
+        key = ResponseCache.make_key({"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": "Hello"}]},
+                                     "https://api.openai.com/v1/chat/completions")
+        cache.set(key, ["Hi!"])
+        print(cache.get(key))
+    except Exception as e:
+        print(f"Error initializing ResponseCache or accessing the cache: {e}")
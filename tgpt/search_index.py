@@ -0,0 +1,149 @@
+import json
+import os
+import re
+import sqlite3
+import time
+
+
+class SearchIndex:
+    """
+    A local full-text index of past completions and generated images, stored in SQLite with FTS5.
+
+    Records are added one at a time as they are produced, and the FTS5 table is kept in sync by
+    triggers, so the index never needs a rebuild. Queries are ranked with bm25, weighting matches
+    in the prompt above matches in the answer.
+
+    Attributes:
+        path (str): The path of the SQLite database.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            answer TEXT NOT NULL DEFAULT '',
+            model TEXT,
+            created REAL NOT NULL,
+            paths TEXT,
+            session TEXT
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+            prompt, answer, content='records', content_rowid='id', tokenize='porter unicode61'
+        );
+        CREATE TRIGGER IF NOT EXISTS records_ai AFTER INSERT ON records BEGIN
+            INSERT INTO records_fts(rowid, prompt, answer) VALUES (new.id, new.prompt, new.answer);
+        END;
+        CREATE TRIGGER IF NOT EXISTS records_ad AFTER DELETE ON records BEGIN
+            INSERT INTO records_fts(records_fts, rowid, prompt, answer) VALUES ('delete', old.id, old.prompt, old.answer);
+        END;
+    """
+
+    # bm25 weights of the prompt and answer columns.
+    PROMPT_WEIGHT = 2.0
+    ANSWER_WEIGHT = 1.0
+
+    def __init__(self, path="~/.tgpt/index.db"):
+        """
+        Initialize the SearchIndex, creating the database and its tables if needed.
+        """
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(self.SCHEMA)
+
+    def add(self, kind, prompt, answer="", model=None, paths=None, session=None):
+        """
+        Add a record to the index.
+
+        Args:
+            kind (str): The kind of record: "text", "image" or "variation".
+            prompt (str): The prompt, or the source image path of a variation.
+            answer (str, optional): The completion text. Defaults to "".
+            model (str, optional): The model that produced the record.
+            paths (list, optional): The saved image paths.
+            session (str, optional): The chat session the record belongs to.
+
+        Returns:
+            int: The id of the new record.
+        """
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO records (kind, prompt, answer, model, created, paths, session) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, prompt, answer or "", model, time.time(), json.dumps(paths) if paths else None, session))
+        return cursor.lastrowid
+
+    def search(self, query, limit=10, kind=None):
+        """
+        Find the records best matching the query. Every word of the query must match, after stemming,
+        so "images" also finds "image".
+
+        Args:
+            query (str): The words to search for.
+            limit (int, optional): The maximum number of results. Defaults to 10.
+            kind (str, optional): Only return records of this kind.
+
+        Returns:
+            list: A dict per result, best match first, with the record fields and a highlighted snippet of the answer.
+        """
+        match = self.to_match_expression(query)
+        if not match:
+            return []
+
+        sql = ("SELECT records.*, snippet(records_fts, 1, '[', ']', '...', 16) AS snippet, "
+               "bm25(records_fts, ?, ?) AS score "
+               "FROM records_fts JOIN records ON records.id = records_fts.rowid "
+               "WHERE records_fts MATCH ?")
+        params = [self.PROMPT_WEIGHT, self.ANSWER_WEIGHT, match]
+        if kind:
+            sql += " AND records.kind = ?"
+            params.append(kind)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+
+        results = []
+        for row in self._connection.execute(sql, params):
+            result = dict(row)
+            result["paths"] = json.loads(result["paths"]) if result["paths"] else []
+            results.append(result)
+        return results
+
+    @staticmethod
+    def to_match_expression(query):
+        """
+        Turn free text into an FTS5 match expression, quoting every word so punctuation in the
+        query cannot be read as FTS5 syntax.
+
+        Returns:
+            str: The match expression, or an empty string if the query has no words.
+        """
+        words = re.findall(r"\w+", query)
+        if not words:
+            return ""
+        return " ".join(f'"{word}"' for word in words)
+
+    def count(self):
+        """
+        Retrieve the number of indexed records.
+
+        Returns:
+            int: The record count.
+        """
+        return self._connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        self._connection.close()
+
+
+if __name__ == "__main__":
+    try:
+        index = SearchIndex()
+        for result in index.search("capital of France"):
+            print(f"{result['kind']}: {result['prompt']} -> {result['snippet']}")
+    except Exception as e:
+        print(f"Error initializing SearchIndex or searching: {e}")
@@ -0,0 +1,230 @@
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+
+class Session:
+    """
+    A chat session persisted as an append-only JSON-lines file, one record per message.
+
+    Every record is flushed and fsynced as it is written, so a crash loses at most the message
+    being written, and a torn last line is skipped when the session is read back. Pinned system
+    messages are kept in a small metadata file next to the log, so resuming does not need to
+    read the log from the start to find them.
+
+    Attributes:
+        name (str): The session name.
+        path (str): The path of the message log.
+        meta_path (str): The path of the metadata file.
+    """
+    def __init__(self, directory, name):
+        """
+        Initialize the Session. The files are created when the first message is written.
+        """
+        self.name = name
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self.meta_path = os.path.join(directory, f"{name}.meta.json")
+        self._file = None
+        self._lock = threading.Lock()
+
+    def append(self, role, content):
+        """
+        Append a message to the log and flush it to disk.
+        """
+        self.extend([{"role": role, "content": content}])
+
+    def extend(self, messages):
+        """
+        Append several messages to the log with a single flush.
+        """
+        lines = "".join(json.dumps({"role": message["role"], "content": message["content"], "time": time.time()},
+                                   ensure_ascii=False) + "\n" for message in messages)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+                if self._file.tell() and not _ends_with_newline(self.path):
+                    lines = "\n" + lines
+            self._file.write(lines.encode("utf-8"))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def set_pinned(self, pinned):
+        """
+        Store the pinned system messages in the metadata file.
+        """
+        meta = {"pinned": [message["content"] for message in pinned]}
+        temp_path = f"{self.meta_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as meta_file:
+            json.dump(meta, meta_file, ensure_ascii=False)
+            meta_file.flush()
+            os.fsync(meta_file.fileno())
+        os.replace(temp_path, self.meta_path)
+
+    def get_pinned(self):
+        """
+        Retrieve the pinned system messages from the metadata file.
+
+        Returns:
+            list: The contents of the pinned system messages.
+        """
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as meta_file:
+                return json.load(meta_file).get("pinned", [])
+        except (OSError, ValueError):
+            return []
+
+    def read_tail(self, token_budget, count_tokens):
+        """
+        Read the newest messages that fit in the token budget, scanning the log backwards from its
+        end so that long sessions are not parsed in full.
+
+        Args:
+            token_budget (int): The maximum number of tokens of the returned messages.
+            count_tokens (callable): Counts the tokens of a message.
+
+        Returns:
+            list: The newest messages in chronological order, starting with a user message.
+        """
+        messages = []
+        remaining = token_budget
+        for line in _iter_lines_reversed(self.path):
+            try:
+                record = json.loads(line)
+                message = {"role": record["role"], "content": record["content"]}
+            except (ValueError, KeyError, TypeError):
+                continue
+            tokens = count_tokens(message)
+            if tokens > remaining:
+                break
+            remaining -= tokens
+            messages.append(message)
+
+        messages.reverse()
+        while messages and messages[0]["role"] != "user":
+            messages.pop(0)
+        return messages
+
+    def exists(self):
+        """
+        Check whether the session has been written to disk.
+
+        Returns:
+            bool: True if the message log exists, False otherwise.
+        """
+        return os.path.exists(self.path)
+
+    def close(self):
+        """
+        Close the message log.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SessionStore:
+    """
+    The directory of persisted chat sessions.
+
+    Attributes:
+        directory (str): The directory holding the session files.
+    """
+    NAME_PATTERN = re.compile(r"^[\w.-]+$")
+
+    def __init__(self, directory="~/.tgpt/sessions"):
+        """
+        Initialize the SessionStore and create its directory if needed.
+        """
+        self.directory = os.path.expanduser(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def open(self, name=None):
+        """
+        Open a session by name, or a new session named after the current time.
+
+        Returns:
+            Session: The session. Its files are created on the first write.
+        """
+        if name is None:
+            name = datetime.now().strftime("%Y-%m-%d-%H%M%S")
+        if not self.NAME_PATTERN.match(name) or name.startswith("."):
+            raise ValueError(f"Invalid session name: {name}, use letters, digits, '_', '-' and '.'")
+        return Session(self.directory, name)
+
+    def list_sessions(self):
+        """
+        List the stored sessions, most recently updated first.
+
+        Returns:
+            list: A dict per session with its name, size in bytes and last update time.
+        """
+        sessions = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".jsonl") and entry.is_file():
+                stat = entry.stat()
+                sessions.append({"name": entry.name[:-len(".jsonl")], "size": stat.st_size, "updated": stat.st_mtime})
+        sessions.sort(key=lambda session: session["updated"], reverse=True)
+        return sessions
+
+    def latest(self):
+        """
+        Retrieve the name of the most recently updated session.
+
+        Returns:
+            str: The session name, or None if there are no sessions.
+        """
+        sessions = self.list_sessions()
+        return sessions[0]["name"] if sessions else None
+
+
+def _ends_with_newline(path):
+    """
+    Check whether a file ends with a newline, so a line torn by a crash is not continued.
+
+    Returns:
+        bool: True if the last byte is a newline, False otherwise.
+    """
+    with open(path, "rb") as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
+
+
+def _iter_lines_reversed(path, block_size=64 * 1024):
+    """
+    Yield the lines of a file from the last to the first, reading it in blocks from the end.
+
+    Yields:
+        bytes: Each non-empty line, without its newline.
+    """
+    try:
+        file = open(path, "rb")
+    except OSError:
+        return
+
+    with file:
+        position = file.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            file.seek(position)
+            lines = (file.read(size) + remainder).split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if remainder.strip():
+            yield remainder
+
+
+if __name__ == "__main__":
+    try:
+        store = SessionStore()
+        for session in store.list_sessions():
+            print(f"{session['name']}  {session['size']} bytes")
+    except Exception as e:
+        print(f"Error initializing SessionStore or listing sessions: {e}")
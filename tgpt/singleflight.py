@@ -0,0 +1,153 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesce identical requests in flight: the first caller for a key runs the request, and
+    callers arriving with the same key before it finishes wait for its result instead of sending
+    their own. Nothing is kept once the request finishes, so this never serves stale results.
+
+    Threads and asyncio tasks share the same requests in flight, whichever of them runs one.
+
+    Attributes:
+        calls (int): The number of calls made.
+        shared (int): The number of calls answered by another caller's request.
+    """
+    def __init__(self):
+        """
+        Initialize the SingleFlight with no requests in flight.
+        """
+        self.calls = 0
+        self.shared = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """
+        Run function, or wait for the call already running for the same key.
+
+        Args:
+            key (str): Identifies identical requests, see make_key.
+            function (callable): Sends the request and returns its result.
+
+        Returns:
+            object: The result of the function, shared by every caller with the same key.
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = function()
+                except BaseException as e:
+                    self._settle(key, future, error=e)
+                    raise
+                self._settle(key, future, result=result)
+                return result
+            try:
+                return future.result()
+            except _Abandoned:
+                continue
+
+    async def do_async(self, key, function):
+        """
+        Await function, or wait for the call already running for the same key.
+
+        Args:
+            key (str): Identifies identical requests, see make_key.
+            function (callable): Returns a coroutine sending the request.
+
+        Returns:
+            object: The result of the coroutine, shared by every caller with the same key.
+        """
+        import asyncio
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = await function()
+                except BaseException as e:
+                    self._settle(key, future, error=e)
+                    raise
+                self._settle(key, future, result=result)
+                return result
+            try:
+                return await asyncio.wrap_future(future)
+            except _Abandoned:
+                continue
+
+    def get_stats(self):
+        """
+        Report how many calls were answered by another caller's request.
+
+        Returns:
+            dict: The numbers of calls and of shared calls.
+        """
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared}
+
+    def _join(self, key):
+        """
+        Find the call in flight for a key, or register a new one.
+
+        Returns:
+            tuple: The future of the call and whether the caller has to run it.
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = Future()
+            # A running future cannot be cancelled, so a waiter giving up never cancels it for the others.
+            future.set_running_or_notify_cancel()
+            self._in_flight[key] = future
+            return future, True
+
+    def _settle(self, key, future, result=None, error=None):
+        """
+        Hand the outcome of a call to its waiters. If the caller running it was interrupted or
+        cancelled rather than failing, the waiters retry the request themselves.
+        """
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            future.set_exception(_Abandoned())
+
+
+class _Abandoned(Exception):
+    """
+    Raised to the waiters of a call whose caller was interrupted before it finished.
+    """
+
+
+def make_key(*parts):
+    """
+    Compute the key identifying a request from its URL and full payload.
+
+    Returns:
+        str: The hex digest of the parts.
+    """
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+if __name__ == "__main__":
+    try:
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        flight = SingleFlight()
+        key = make_key("https://api.openai.com/v1/chat/completions", {"prompt": "Hello"})
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            print(list(executor.map(lambda _: flight.do(key, lambda: time.sleep(0.1) or "Hi!"), range(8))))
+        print(flight.get_stats())
+    except Exception as e:
+        print(f"Error initializing SingleFlight or running calls: {e}")
@@ -0,0 +1,241 @@
+import base64
+import os
+import threading
+from functools import lru_cache
+
+try:
+    import regex as _regex
+    _PATTERN = _regex.compile(
+        r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+""")
+except ImportError:
+    import re as _regex
+    _PATTERN = _regex.compile(
+        r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|(?:[^\r\n\w]|_)?[^\W\d_]+|\d{1,3}| ?(?:[^\s\w]|_)+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+""")
+
+
+MODEL_CONTEXT = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-0301": 4096,
+    "gpt-3.5-turbo-0613": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-turbo-preview": 128000,
+    "gpt-4-1106-preview": 128000,
+    "gpt-4-0125-preview": 128000,
+    "gpt-4-vision-preview": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.1-nano": 1047576,
+    "o1": 200000,
+    "o1-mini": 128000,
+    "o1-preview": 128000,
+    "o3": 200000,
+    "o3-mini": 200000,
+    "o4-mini": 200000,
+}
+# Context size assumed for budgeting, such as chunk sizes, when the model is unknown.
+DEFAULT_CONTEXT = 4096
+
+MODEL_ENCODING = {
+    "gpt-3.5-turbo": "cl100k_base",
+    "gpt-4": "cl100k_base",
+    "gpt-4o": "o200k_base",
+    "gpt-4.1": "o200k_base",
+    "o1": "o200k_base",
+    "o3": "o200k_base",
+    "o4-mini": "o200k_base",
+}
+
+
+def _lookup(table, model):
+    """
+    Find the entry of a model in a table keyed by model name. Dated or extended model names,
+    such as gpt-4o-2024-08-06, match the longest known name they extend with a dash.
+
+    Returns:
+        The entry of the model, or None if the model is unknown.
+    """
+    for name in sorted(table, key=len, reverse=True):
+        if model == name or model.startswith(name + "-"):
+            return table[name]
+    return None
+
+
+def get_context_size(model):
+    """
+    Retrieve the context window size of a model.
+
+    Returns:
+        int: The maximum number of prompt and completion tokens, or None if the model is unknown.
+    """
+    return _lookup(MODEL_CONTEXT, model)
+
+
+def get_encoding(model):
+    """
+    Retrieve the name of the encoding a model tokenizes with.
+
+    Returns:
+        str: The encoding name, such as "cl100k_base", or None if the model is unknown.
+    """
+    return _lookup(MODEL_ENCODING, model)
+
+
+class Tokenizer:
+    """
+    A local byte pair encoding tokenizer for the cl100k_base encoding used by the GPT-3.5 and GPT-4 models.
+
+    The vocabulary is read from a local tiktoken file, with one base64 token and its rank per line,
+    the first time it is needed. Without the file, token counts are estimated from the text length.
+    Encoded pieces and message counts are memoized, so repeated history is not re-tokenized every turn.
+    Counts for models using another encoding, such as the o200k_base of gpt-4o, are only estimates.
+
+    Attributes:
+        vocab_path (str): The path of the vocabulary file.
+        encoding (str): The name of the encoding of the vocabulary file.
+    """
+    def __init__(self, vocab_path="~/.tgpt/cl100k_base.tiktoken", cache_size=8192, encoding="cl100k_base"):
+        """
+        Initialize the Tokenizer. The vocabulary is loaded lazily on first use.
+        """
+        self.vocab_path = os.path.expanduser(vocab_path)
+        self.encoding = encoding
+        self._ranks = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._encode_piece = lru_cache(maxsize=cache_size)(self._byte_pair_encode)
+        self._count_message = lru_cache(maxsize=cache_size)(self._count_role_content)
+
+    @property
+    def exact(self):
+        """
+        Whether a vocabulary is loaded, so counts are exact rather than estimated.
+        """
+        return self._load() is not None
+
+    def is_exact_for(self, model):
+        """
+        Tell whether the counts are exact for a model, which takes a loaded vocabulary of the
+        encoding the model uses.
+
+        Returns:
+            bool: True if the model uses the encoding of the loaded vocabulary.
+        """
+        return get_encoding(model) == self.encoding and self.exact
+
+    def encode(self, text):
+        """
+        Encode text into token ids.
+
+        Returns:
+            list: The token ids, or an empty list if no vocabulary is available.
+        """
+        if self._load() is None:
+            return []
+        tokens = []
+        for piece in _PATTERN.findall(text):
+            tokens.extend(self._encode_piece(piece.encode("utf-8")))
+        return tokens
+
+    def count(self, text):
+        """
+        Count the tokens of a text.
+
+        Returns:
+            int: The exact token count, or an estimate if no vocabulary is available.
+        """
+        if not text:
+            return 0
+        if self._load() is None:
+            return (len(text) + 3) // 4
+        return sum(len(self._encode_piece(piece.encode("utf-8"))) for piece in _PATTERN.findall(text))
+
+    def count_message(self, message):
+        """
+        Count the tokens of a chat message, including the per-message overhead.
+
+        Returns:
+            int: The token count of the message.
+        """
+        return self._count_message(message.get("role", ""), message.get("content") or "")
+
+    def count_messages(self, messages):
+        """
+        Count the tokens of a list of chat messages as sent in a request.
+
+        Returns:
+            int: The token count of the messages, including the reply priming.
+        """
+        return sum(self.count_message(message) for message in messages) + 3
+
+    def _count_role_content(self, role, content):
+        """
+        Count the tokens of a message role and content.
+
+        Returns:
+            int: The token count of the message.
+        """
+        return 3 + self.count(role) + self.count(content)
+
+    def _load(self):
+        """
+        Load the vocabulary file on first use.
+
+        Returns:
+            dict: The token ranks by byte sequence, or None if the file is unavailable.
+        """
+        if self._loaded:
+            return self._ranks
+        with self._lock:
+            if not self._loaded:
+                try:
+                    ranks = {}
+                    with open(self.vocab_path, "rb") as vocab_file:
+                        for line in vocab_file:
+                            if line.strip():
+                                token, rank = line.split()
+                                ranks[base64.b64decode(token)] = int(rank)
+                    self._ranks = ranks
+                except (OSError, ValueError):
+                    self._ranks = None
+                self._loaded = True
+        return self._ranks
+
+    def _byte_pair_encode(self, piece):
+        """
+        Encode a single pre-tokenized piece by repeatedly merging its lowest-ranked adjacent pair.
+
+        Returns:
+            tuple: The token ids of the piece.
+        """
+        ranks = self._ranks
+        if piece in ranks:
+            return (ranks[piece],)
+
+        parts = [piece[i:i + 1] for i in range(len(piece))]
+        while len(parts) > 1:
+            best_rank = None
+            best_index = None
+            for i in range(len(parts) - 1):
+                rank = ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank = rank
+                    best_index = i
+            if best_index is None:
+                break
+            parts[best_index:best_index + 2] = [parts[best_index] + parts[best_index + 1]]
+
+        return tuple(ranks[part] for part in parts if part in ranks)
+
+
+if __name__ == "__main__":
+    try:
+        tokenizer = Tokenizer()
+        text = "Hello, how are you?"
+        print(f"{tokenizer.count(text)} tokens ({'exact' if tokenizer.exact else 'estimated'})")
+    except Exception as e:
+        print(f"Error initializing Tokenizer or counting tokens: {e}")
@@ -0,0 +1,449 @@
+import array
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from .deadline import DeadlineExecutor
+
+
+# The size of the text chunks embedded for retrieval: long enough to carry context, short enough
+# for a few of them to fit in a chat prompt.
+CHUNK_TOKENS = 400
+
+# Files are skipped as binary if their first block contains a NUL byte.
+BINARY_PROBE_BYTES = 8192
+
+RETRIEVAL_PROMPT = ("The following excerpts from the user's documents may be relevant to the next message. "
+                    "Use them if they help, and say which source you used.")
+
+
+def _numpy():
+    """
+    Import NumPy, which only searching the index needs.
+
+    Returns:
+        module: The numpy module.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Searching embeddings requires NumPy, install it with: pip install tgpt[embeddings]")
+    return numpy
+
+
+class VectorIndex:
+    """
+    An on-disk index of embedding vectors for semantic search.
+
+    The vectors are stored normalized, as a float32 matrix with one row per text in "vectors.f32",
+    so cosine similarity is a dot product. The matrix is memory-mapped when searched: the OS pages
+    it in from its cache instead of the index being read into memory. The metadata of every row is
+    a JSON line of "meta.jsonl", and "meta.idx" holds the offset of every line, so a search only
+    reads the lines of its matches. "index.json" holds the model, dimensions, row count and the
+    sources indexed.
+
+    Rows are only ever appended. The row count in "index.json" is updated last, so an interrupted
+    append leaves the index as it was. A source that changed is embedded again, and the rows of its
+    previous version are skipped by searches.
+
+    Attributes:
+        path (str): The directory of the index.
+        model (str): The embedding model of the vectors.
+        dimensions (int): The length of every vector, or None before the first append.
+        count (int): The number of rows.
+        sources (dict): Per indexed source path, its modification time, size and the run that indexed it.
+    """
+    VECTORS_NAME = "vectors.f32"
+    META_NAME = "meta.jsonl"
+    OFFSETS_NAME = "meta.idx"
+    HEADER_NAME = "index.json"
+
+    def __init__(self, path, model="text-embedding-3-small", dimensions=None):
+        """
+        Initialize the VectorIndex, reading the header of an existing index. The model and
+        dimensions of an existing index take precedence over the arguments.
+        """
+        self.path = os.path.expanduser(path)
+        self.model = model
+        self.dimensions = dimensions
+        self.count = 0
+        self.sources = {}
+        self._matrix = None
+        self._offsets = None
+        self._lock = threading.Lock()
+        header_path = os.path.join(self.path, self.HEADER_NAME)
+        if os.path.exists(header_path):
+            with open(header_path, "r", encoding="utf-8") as header_file:
+                header = json.load(header_file)
+            self.model = header.get("model", model)
+            self.dimensions = header.get("dimensions")
+            self.count = header.get("count", 0)
+            self.sources = header.get("sources", {})
+
+    def append(self, vectors, records):
+        """
+        Append vectors and their metadata records to the index.
+
+        Args:
+            vectors (list): The embedding vectors, lists of floats.
+            records (list): A dict per vector, such as its text and source.
+
+        Raises:
+            ValueError: If the vectors do not have the dimensions of the index.
+        """
+        if not vectors:
+            return
+        with self._lock:
+            if self.dimensions is None:
+                self.dimensions = len(vectors[0])
+            if any(len(vector) != self.dimensions for vector in vectors):
+                raise ValueError(f"Expected vectors of {self.dimensions} dimensions, as already in the index")
+            os.makedirs(self.path, exist_ok=True)
+            self._truncate()
+
+            rows = array.array("f")
+            for vector in vectors:
+                norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+                rows.extend(value / norm for value in vector)
+            offsets = array.array("Q")
+            with open(self._file(self.META_NAME), "ab") as meta_file:
+                position = meta_file.tell()
+                for record in records:
+                    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                    offsets.append(position)
+                    meta_file.write(line)
+                    position += len(line)
+            with open(self._file(self.VECTORS_NAME), "ab") as vectors_file:
+                rows.tofile(vectors_file)
+            with open(self._file(self.OFFSETS_NAME), "ab") as offsets_file:
+                offsets.tofile(offsets_file)
+
+            self.count += len(vectors)
+            self._write_header()
+            self._matrix = self._offsets = None
+
+    def mark_source(self, source, stamp):
+        """
+        Record a source as fully indexed, which makes the rows of its previous versions stale.
+
+        Args:
+            source (str): The absolute path of the source.
+            stamp (dict): Its "mtime_ns", "size" and the "run" that indexed it.
+        """
+        with self._lock:
+            self.sources[source] = stamp
+            os.makedirs(self.path, exist_ok=True)
+            self._write_header()
+
+    def is_current(self, source, mtime_ns, size):
+        """
+        Check whether a source is indexed in its current version.
+
+        Returns:
+            bool: True if the source does not need to be embedded again.
+        """
+        stamp = self.sources.get(source)
+        return stamp is not None and stamp["mtime_ns"] == mtime_ns and stamp["size"] == size
+
+    def search(self, query, k=5):
+        """
+        Find the rows most similar to a query vector.
+
+        Args:
+            query (list): The query embedding, with the dimensions of the index.
+            k (int, optional): The maximum number of matches. Defaults to 5.
+
+        Returns:
+            list: The metadata record of every match, best first, with its "score" (the cosine
+            similarity) and "row" added.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+        """
+        numpy = _numpy()
+        matrix, offsets = self._load()
+        if matrix is None or k <= 0:
+            return []
+        query = numpy.asarray(query, dtype=numpy.float32)
+        query /= numpy.linalg.norm(query) or 1.0
+        scores = matrix @ query
+
+        # Extra candidates make up for stale rows of sources that were indexed again.
+        candidates = min(len(scores), k * 4)
+        top = numpy.argpartition(scores, -candidates)[-candidates:]
+        top = top[numpy.argsort(scores[top])[::-1]]
+
+        results = []
+        with open(self._file(self.META_NAME), "rb") as meta_file:
+            for row in top:
+                meta_file.seek(int(offsets[row]))
+                record = json.loads(meta_file.readline())
+                stamp = self.sources.get(record.get("source"))
+                if record.get("run") is not None and (stamp is None or stamp["run"] != record["run"]):
+                    continue
+                results.append(dict(record, score=float(scores[row]), row=int(row)))
+                if len(results) == k:
+                    break
+        return results
+
+    def clear(self):
+        """
+        Remove every row and source from the index.
+        """
+        with self._lock:
+            for name in (self.VECTORS_NAME, self.META_NAME, self.OFFSETS_NAME, self.HEADER_NAME):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self.count = 0
+            self.dimensions = None
+            self.sources = {}
+            self._matrix = self._offsets = None
+
+    def _load(self):
+        """
+        Memory-map the vectors and line offsets of the rows in the header, once per append.
+
+        Returns:
+            tuple: The vector matrix and the offsets, or (None, None) for an empty index.
+        """
+        with self._lock:
+            if self._matrix is None and self.count:
+                numpy = _numpy()
+                self._matrix = numpy.memmap(self._file(self.VECTORS_NAME), dtype=numpy.float32, mode="r",
+                                            shape=(self.count, self.dimensions))
+                self._offsets = numpy.memmap(self._file(self.OFFSETS_NAME), dtype=numpy.uint64, mode="r",
+                                             shape=(self.count,))
+            return self._matrix, self._offsets
+
+    def _truncate(self):
+        """
+        Drop the vectors and offsets an interrupted append wrote past the row count. Metadata
+        lines past the count are never referenced, so they are left in place.
+        """
+        for name, row_bytes in ((self.VECTORS_NAME, self.dimensions * 4), (self.OFFSETS_NAME, 8)):
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > self.count * row_bytes:
+                os.truncate(path, self.count * row_bytes)
+
+    def _write_header(self):
+        """
+        Write the header atomically.
+        """
+        header = {"model": self.model, "dimensions": self.dimensions, "count": self.count, "sources": self.sources}
+        with open(self._file(self.HEADER_NAME + ".tmp"), "w", encoding="utf-8") as header_file:
+            json.dump(header, header_file, ensure_ascii=False)
+        os.replace(self._file(self.HEADER_NAME + ".tmp"), self._file(self.HEADER_NAME))
+
+    def _file(self, name):
+        """
+        Build the path of a file of the index.
+
+        Returns:
+            str: The path.
+        """
+        return os.path.join(self.path, name)
+
+
+class EmbeddingIndexer:
+    """
+    Embed files, directories or stdin into a VectorIndex: every input is split into chunks, the
+    chunks are batched into large embedding requests, and the requests run concurrently. Files
+    already indexed in their current version are skipped.
+
+    Attributes:
+        client (GPTClient): The GPTClient used to send the embedding requests.
+        index (VectorIndex): The index the vectors are appended to.
+        concurrency (int): The maximum number of requests in flight.
+        batch_size (int): The maximum number of chunks per request.
+        chunk_tokens (int): The size of every chunk in tokens.
+    """
+    def __init__(self, client, index, concurrency=4, batch_size=256, chunk_tokens=CHUNK_TOKENS):
+        """
+        Initialize the EmbeddingIndexer.
+        """
+        self.client = client
+        self.index = index
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.chunk_tokens = max(16, chunk_tokens)
+
+    def run(self, paths, on_progress=None):
+        """
+        Embed every file under the given paths, "-" standing for stdin.
+
+        Args:
+            paths (list): Files, directories searched recursively, or "-".
+            on_progress (callable, optional): Called with the number of chunks embedded and read so far.
+
+        Returns:
+            dict: The numbers of sources indexed, skipped and failed, of chunks and of requests, and the elapsed seconds.
+        """
+        from .map_reduce import BYTES_PER_TOKEN, iter_chunks, open_input
+        start = time.monotonic()
+        run_id = time.time_ns()
+        stats = {"sources": 0, "skipped": 0, "failed": 0, "chunks": 0, "embedded": 0, "requests": 0}
+        remaining = {}
+        failed = set()
+        pending = {}
+        batch = []
+
+        def submit():
+            future = executor.submit(self.client.create_embeddings, [record["text"] for record in batch],
+                                     model=self.index.model, dimensions=self.index.dimensions)
+            pending[future] = list(batch)
+            batch.clear()
+            stats["requests"] += 1
+            # Reading stops while this many requests wait, which bounds the memory held by chunks.
+            while len(pending) >= self.concurrency * 2:
+                collect()
+
+        def collect():
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                records = pending.pop(future)
+                vectors = future.result()
+                if len(vectors) == len(records):
+                    self.index.append(vectors, records)
+                    stats["embedded"] += len(records)
+                else:
+                    failed.update(record["source"] for record in records)
+                for record in records:
+                    remaining[record["source"]] -= 1
+                    self._finish(record["source"], remaining, failed, stamps, stats)
+            if on_progress is not None:
+                on_progress(stats["embedded"], stats["chunks"])
+
+        stamps = {}
+        with DeadlineExecutor(max_workers=self.concurrency) as executor:
+            for source, stamp in self._iter_sources(paths, stats):
+                # Rows of files carry the run that embedded them, so rows of older versions can be told apart.
+                stamps[source] = dict(stamp, run=run_id) if stamp is not None else None
+                run = run_id if stamp is not None else None
+                remaining[source] = 1
+                with open_input(source) as input_source:
+                    for position, text in enumerate(iter_chunks(input_source, self.chunk_tokens * BYTES_PER_TOKEN)):
+                        stats["chunks"] += 1
+                        batch.append({"source": source, "chunk": position, "run": run, "text": text})
+                        remaining[source] += 1
+                        if len(batch) >= self.batch_size:
+                            submit()
+                remaining[source] -= 1
+                self._finish(source, remaining, failed, stamps, stats)
+            if batch:
+                submit()
+            while pending:
+                collect()
+
+        stats["elapsed"] = time.monotonic() - start
+        return stats
+
+    def _finish(self, source, remaining, failed, stamps, stats):
+        """
+        Record a source in the index once every chunk of it has been embedded. A source with a
+        failed request is not recorded, so a rerun embeds it again.
+        """
+        if remaining[source]:
+            return
+        del remaining[source]
+        if source in failed:
+            stats["failed"] += 1
+            return
+        stats["sources"] += 1
+        if stamps[source] is not None:
+            self.index.mark_source(source, stamps[source])
+
+    def _iter_sources(self, paths, stats):
+        """
+        Expand the paths into the sources to embed, skipping hidden directories, binary files and
+        files already indexed in their current version.
+
+        Yields:
+            tuple: The absolute path of every source, or "-", and its stamp, None for stdin.
+        """
+        for path in paths:
+            if path == "-":
+                yield "-", None
+                continue
+            if os.path.isdir(path):
+                files = []
+                for root, dirs, names in os.walk(path):
+                    dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+                    files.extend(os.path.join(root, name) for name in sorted(names) if not name.startswith("."))
+            else:
+                files = [path]
+            for file_path in files:
+                file_path = os.path.abspath(file_path)
+                try:
+                    status = os.stat(file_path)
+                    with open(file_path, "rb") as probe:
+                        binary = b"\0" in probe.read(BINARY_PROBE_BYTES)
+                except OSError as e:
+                    sys.stderr.write(f"Skipping {file_path}: {e}\n")
+                    continue
+                if binary or self.index.is_current(file_path, status.st_mtime_ns, status.st_size):
+                    stats["skipped"] += 1
+                    continue
+                yield file_path, {"mtime_ns": status.st_mtime_ns, "size": status.st_size}
+
+
+class Retriever:
+    """
+    Find the indexed chunks most relevant to a chat prompt and build the message injecting them
+    into the request.
+
+    Attributes:
+        client (GPTClient): The GPTClient used to embed the prompts.
+        index (VectorIndex): The index searched.
+        k (int): The number of chunks injected.
+        min_score (float): The lowest cosine similarity of an injected chunk.
+    """
+    def __init__(self, client, index, k=3, min_score=0.2):
+        """
+        Initialize the Retriever.
+        """
+        self.client = client
+        self.index = index
+        self.k = k
+        self.min_score = min_score
+
+    def search(self, text, k=None):
+        """
+        Find the indexed chunks most similar to a text.
+
+        Returns:
+            list: The matching records, best first, see VectorIndex.search.
+        """
+        if not self.index.count:
+            return []
+        vectors = self.client.create_embeddings([text], model=self.index.model, dimensions=self.index.dimensions)
+        if not vectors:
+            return []
+        return self.index.search(vectors[0], k or self.k)
+
+    def build_message(self, prompt):
+        """
+        Build a system message holding the chunks relevant to a prompt.
+
+        Returns:
+            dict: The message, or None if no chunk is relevant enough.
+        """
+        matches = [match for match in self.search(prompt) if match["score"] >= self.min_score]
+        if not matches:
+            return None
+        excerpts = "\n\n".join(f"[{i}] {match['source']}:\n{match['text'].strip()}" for i, match in enumerate(matches, 1))
+        return {"role": "system", "content": f"{RETRIEVAL_PROMPT}\n\n{excerpts}"}
+
+
+if __name__ == "__main__":
+    try:
+        from .gpt_client import GPTClient
+        client = GPTClient(api_key="API_KEY")
+        index = VectorIndex("~/.tgpt/embeddings", dimensions=256)
+        print(EmbeddingIndexer(client, index).run(["docs"]))
+        for match in Retriever(client, index).search("How do I configure the cache?"):
+            print(f"{match['score']:.3f} {match['source']}")
+    except Exception as e:
+        print(f"Error initializing VectorIndex or embedding documents: {e}")